@@ -1,94 +1,177 @@
 """
 Risk Assessment Agent for clinical risk evaluation
 """
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from api.db.async_database import release_connection, run_session_sync
 from api.services.ai_service import MedicalAIService
-from api.models.note import Note
+from api.services.registry import get_ai_service
 from api.models.patient import Patient
+from api.services.context_builder import build_note_context
+from api.services.high_risk_roster import list_high_risk_patients
+from api.services.risk_state_service import (
+    load_risk_state,
+    needs_assessment,
+    risk_trends,
+    store_assessment,
+    stored_assessment,
+)
+from api.models.risk_state import PatientRiskState
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+
+class ReportInputs(NamedTuple):
+    patient: Patient
+    state: PatientRiskState
+    covered_note_id: Optional[int]  # newest note the new assessment covers
+    prompt: Optional[str]           # None when the stored assessment is current
+    context_notes: Optional[int]
 
 class RiskAssessmentAgent:
-    def __init__(self):
-        self.ai_service = MedicalAIService()
+    def __init__(self, ai_service: Optional[MedicalAIService] = None):
+        # The process-wide service unless one is injected (tests, scripts)
+        self.ai_service = ai_service or get_ai_service()
     
     def generate_patient_risk_report(self, patient_id: int, db: Session) -> Dict[str, any]:
         """
-        Generate comprehensive risk report for a patient
+        Generate comprehensive risk report for a patient.
+        Served from the patient's stored risk state; the LLM is only called
+        again when notes were written after the last assessment.
         """
         try:
-            # Get patient and all their notes
-            patient = db.query(Patient).filter(Patient.id == patient_id).first()
-            if not patient:
-                return {"error": "Patient not found"}
-            
-            notes = db.query(Note).filter(
-                Note.patient_id == patient_id
-            ).order_by(Note.created_at.desc()).all()
-            
-            if not notes:
-                return {
-                    "patient_name": f"{patient.first_name} {patient.last_name}",
-                    "risk_level": "UNKNOWN",
-                    "summary": "No notes available for risk assessment",
-                    "risks": [],
-                    "recommendations": [],
-                    "escalation": "No data available",
-                    "trends": [],
-                    "last_assessment": None
-                }
-            
-            # Analyze all notes for comprehensive risk assessment
-            all_note_content = "\n\n".join([f"{note.title}: {note.content}" for note in notes])
-            patient_context = self._build_patient_context(patient, notes)
-            
-            # Get AI risk assessment
-            risk_analysis = self.ai_service.assess_risk(
-                note_content=all_note_content,
-                patient_history=[note.content for note in notes[:10]]  # Last 10 notes
-            )
+            prepared = self._prepare_report(db, patient_id)
+            if isinstance(prepared, dict):
+                return prepared
+            risk_analysis = self._assess(prepared) if prepared.prompt is not None else None
+            return self._finish_report(db, prepared, risk_analysis)
             
-            # Analyze trends
-            trends = self._analyze_risk_trends(notes)
-            
-            # Generate specific recommendations
-            recommendations = self._generate_risk_recommendations(risk_analysis, trends, patient)
-            
-            # Determine escalation criteria
-            escalation = self._determine_escalation(risk_analysis, trends)
-            
-            return {
-                "patient_name": f"{patient.first_name} {patient.last_name}",
-                "patient_id": patient.patient_id,
-                "risk_level": risk_analysis["risk_level"],
-                "summary": risk_analysis["risk_analysis"],
-                "risks": self._extract_risk_factors(risk_analysis["risk_analysis"]),
-                "recommendations": recommendations,
-                "escalation": escalation,
-                "trends": trends,
-                "last_assessment": datetime.now().isoformat(),
-                "monitoring_suggestions": risk_analysis.get("monitoring_suggestions", ""),
-                "escalation_criteria": risk_analysis.get("escalation_criteria", "")
-            }
+        except Exception as e:
+            db.rollback()
+            return self._error_report(e)
+    
+    async def agenerate_patient_risk_report(self, patient_id: int, db) -> Dict[str, any]:
+        """
+        Async variant of `generate_patient_risk_report` for request handlers: the
+        session work runs through `run_session_sync` and the LLM call on the
+        threadpool, so the event loop is never blocked.
+        """
+        try:
+            prepared = await run_session_sync(db, self._prepare_report, patient_id)
+            if isinstance(prepared, dict):
+                return prepared
+            risk_analysis = None
+            if prepared.prompt is not None:
+                await release_connection(db)
+                risk_analysis = await run_in_threadpool(self._assess, prepared)
+            return await run_session_sync(db, self._finish_report, prepared, risk_analysis)
             
         except Exception as e:
+            await run_session_sync(db, lambda session: session.rollback())
+            return self._error_report(e)
+    
+    def _prepare_report(self, db: Session, patient_id: int):
+        """
+        Load the patient and risk state. Returns the finished response when there is
+        nothing to assess, else the inputs; `prompt` is set only if the LLM must re-assess.
+        """
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        if not patient:
+            return {"error": "Patient not found"}
+        
+        state = load_risk_state(db, patient_id)
+        
+        if not state.note_count:
+            db.commit()
             return {
-                "error": f"Error generating risk report: {str(e)}",
-                "patient_name": "Unknown",
+                "patient_name": f"{patient.first_name} {patient.last_name}",
                 "risk_level": "UNKNOWN",
-                "summary": "Unable to assess risk",
+                "summary": "No notes available for risk assessment",
                 "risks": [],
                 "recommendations": [],
-                "escalation": "Contact IT support"
+                "escalation": "No data available",
+                "trends": [],
+                "last_assessment": None
             }
+        
+        if not needs_assessment(state):
+            return ReportInputs(patient, state, None, None, None)
+        
+        # Newest notes first, summarized, up to the context token budget
+        note_context = build_note_context(db, patient_id)
+        patient_context = self._build_patient_context(patient, state.note_count)
+        return ReportInputs(
+            patient,
+            state,
+            state.last_note_id,
+            f"{patient_context}\n\nNOTES (newest first):\n{note_context.text}",
+            note_context.notes_included
+        )
+    
+    def _assess(self, prepared: "ReportInputs") -> Dict:
+        # Get AI risk assessment
+        return self.ai_service.assess_risk(note_content=prepared.prompt)
+    
+    def _finish_report(self, db: Session, prepared: "ReportInputs", risk_analysis: Optional[Dict]) -> Dict[str, any]:
+        """Store a new assessment (if one was made) and build the report from the state."""
+        patient, state = prepared.patient, prepared.state
+        reassessed = risk_analysis is not None
+        if reassessed:
+            store_assessment(
+                state,
+                {"risk_analysis": risk_analysis, "context_notes": prepared.context_notes},
+                prepared.covered_note_id
+            )
+            db.commit()
+        
+        assessment = stored_assessment(state)
+        risk_analysis = assessment["risk_analysis"]
+        
+        # Weekly trends come from the incrementally maintained counts
+        trends = risk_trends(state)
+        
+        # Generate specific recommendations
+        recommendations = self._generate_risk_recommendations(risk_analysis, trends, patient)
+        
+        # Determine escalation criteria
+        escalation = self._determine_escalation(risk_analysis, trends)
+        summary = risk_analysis.get("summary") or risk_analysis.get("risk_analysis", "")
+        
+        return {
+            "patient_name": f"{patient.first_name} {patient.last_name}",
+            "patient_id": patient.patient_id,
+            "risk_level": risk_analysis["risk_level"],
+            "summary": summary,
+            "risks": self._extract_risk_factors(summary),
+            "recommendations": recommendations,
+            "escalation": escalation,
+            "trends": trends,
+            "last_assessment": state.assessed_at.isoformat() if state.assessed_at else None,
+            "monitoring_suggestions": risk_analysis.get("monitoring_suggestions", ""),
+            "escalation_criteria": risk_analysis.get("escalation_criteria", ""),
+            "context_notes": assessment.get("context_notes"),
+            "total_notes": state.note_count,
+            "latest_note_risk_level": state.risk_level,
+            "reassessed": reassessed
+        }
+    
+    @staticmethod
+    def _error_report(error: Exception) -> Dict[str, any]:
+        return {
+            "error": f"Error generating risk report: {str(error)}",
+            "patient_name": "Unknown",
+            "risk_level": "UNKNOWN",
+            "summary": "Unable to assess risk",
+            "risks": [],
+            "recommendations": [],
+            "escalation": "Contact IT support"
+        }
     
-    def _build_patient_context(self, patient: Patient, notes: List[Note]) -> str:
+    def _build_patient_context(self, patient: Patient, note_count: int) -> str:
         """Build comprehensive patient context for risk assessment"""
         context_parts = [
             f"Patient: {patient.first_name} {patient.last_name}",
             f"DOB: {patient.date_of_birth}",
             f"MRN: {patient.medical_record_number}",
-            f"Total Notes: {len(notes)}"
+            f"Total Notes: {note_count}"
         ]
         
         if patient.allergies:
@@ -97,42 +180,8 @@ class RiskAssessmentAgent:
         if patient.medical_history:
             context_parts.append(f"Medical History: {patient.medical_history}")
         
-        # Add recent note summaries
-        recent_notes = notes[:3]  # Last 3 notes
-        for note in recent_notes:
-            context_parts.append(f"Recent: {note.title} ({note.created_at.strftime('%Y-%m-%d')})")
-        
         return "\n".join(context_parts)
     
-    def _analyze_risk_trends(self, notes: List[Note]) -> List[Dict[str, any]]:
-        """Analyze risk trends over time"""
-        trends = []
-        
-        # Group notes by week
-        weekly_notes = {}
-        for note in notes:
-            week_start = note.created_at - timedelta(days=note.created_at.weekday())
-            week_key = week_start.strftime('%Y-%m-%d')
-            
-            if week_key not in weekly_notes:
-                weekly_notes[week_key] = []
-            weekly_notes[week_key].append(note)
-        
-        # Analyze each week
-        for week, week_notes in list(weekly_notes.items())[:4]:  # Last 4 weeks
-            high_risk_count = sum(1 for note in week_notes if note.risk_level == "HIGH")
-            medium_risk_count = sum(1 for note in week_notes if note.risk_level == "MEDIUM")
-            
-            trends.append({
-                "week": week,
-                "total_notes": len(week_notes),
-                "high_risk_notes": high_risk_count,
-                "medium_risk_notes": medium_risk_count,
-                "risk_trend": "increasing" if high_risk_count > 0 else "stable"
-            })
-        
-        return trends
-    
     def _generate_risk_recommendations(self, risk_analysis: Dict, trends: List[Dict], patient: Patient) -> List[str]:
         """Generate specific risk management recommendations"""
         recommendations = []
@@ -203,30 +252,9 @@ class RiskAssessmentAgent:
             return "No immediate escalation required"
     
     def get_high_risk_patients(self, db: Session, limit: int = 10) -> List[Dict[str, any]]:
-        """Get list of high-risk patients"""
+        """Get list of high-risk patients from the materialized roster"""
         try:
-            # Get patients with high-risk notes
-            high_risk_notes = db.query(Note).filter(
-                Note.risk_level.in_(["HIGH", "CRITICAL"])
-            ).order_by(Note.created_at.desc()).limit(limit).all()
-            
-            high_risk_patients = []
-            processed_patients = set()
-            
-            for note in high_risk_notes:
-                if note.patient_id not in processed_patients:
-                    patient = note.patient
-                    high_risk_patients.append({
-                        "patient_id": patient.patient_id,
-                        "patient_name": f"{patient.first_name} {patient.last_name}",
-                        "risk_level": note.risk_level,
-                        "last_note_date": note.created_at.isoformat(),
-                        "last_note_title": note.title,
-                        "recommendations": note.recommendations
-                    })
-                    processed_patients.add(note.patient_id)
-            
-            return high_risk_patients
+            return list_high_risk_patients(db, limit)
             
         except Exception as e:
             return []
@@ -1,103 +1,220 @@
 """
 Summarization Agent for medical notes using LangChain
 """
-from typing import Dict, List, Optional
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from api.db.async_database import release_connection, run_session_sync
 from api.services.ai_service import MedicalAIService
+from api.services.registry import get_ai_service
 from api.models.note import Note
 from api.models.patient import Patient
+from api.services.patient_summary_cache import invalidate_patient_summaries
+from api.services.risk_state_service import record_note_risk
 from sqlalchemy.orm import Session
 
+AI_CALL_TIMEOUT_SECONDS = float(os.getenv("AI_CALL_TIMEOUT_SECONDS", "45"))
+AI_CALL_WORKERS = int(os.getenv("AI_CALL_WORKERS", "12"))
+
+# Shared by every agent in the process so concurrent notes can't spawn unbounded threads
+_ai_call_executor = ThreadPoolExecutor(max_workers=AI_CALL_WORKERS, thread_name_prefix="ai-call")
+
+
 class SummarizationAgent:
-    def __init__(self):
-        self.ai_service = MedicalAIService()
+    def __init__(self, ai_service: Optional[MedicalAIService] = None):
+        # The process-wide service unless one is injected (tests, scripts)
+        self.ai_service = ai_service or get_ai_service()
     
     def process_note(self, note: Note, patient: Patient, db: Session) -> Dict[str, str]:
         """
-        Process a note and generate AI-powered summary and analysis
+        Process a note and generate AI-powered summary and analysis.
+        The summary, risk and nursing calls are independent, so they run concurrently.
         """
         try:
-            # Get patient context
-            patient_context = self._build_patient_context(patient, db)
-            
-            # Generate summary
-            if hasattr(self.ai_service, "summarize_note"):
-                summary_result = self.ai_service.summarize_note(
-                    note_content=note.content,
-                    note_type=note.note_type.value,
-                    patient_context=patient_context
-                )
-            else:
-                # Defensive fallback for older AI service implementations
-                summary_result = self.ai_service.summarize_medical_note(
-                    note_content=note.content,
-                    note_type=note.note_type.value,
-                    patient_history=None
-                )
-            
-            # Assess risk
-            patient_history = self._get_patient_history(patient.id, db)
-            if hasattr(self.ai_service, "assess_risk"):
-                risk_result = self.ai_service.assess_risk(
-                    note_content=note.content,
-                    patient_history=patient_history
-                )
-            else:
-                risk_result = self.ai_service.assess_patient_risk(
-                    note_content=note.content,
-                    patient_history=patient_history
-                )
-            
-            # Generate nurse recommendations if it's a nurse note
-            nurse_recommendations = {}
-            if note.note_type.value == "nurse_note":
-                if hasattr(self.ai_service, "generate_nurse_recommendations"):
-                    nurse_recommendations = self.ai_service.generate_nurse_recommendations(
-                        note_content=note.content,
-                        patient_context=patient_context
-                    )
-                else:
-                    nurse_recommendations = {}
+            calls = self._prepare_ai_calls(note, patient, db)
+            futures = {name: _ai_call_executor.submit(call) for name, (call, _) in calls.items()}
+            deadline = time.monotonic() + AI_CALL_TIMEOUT_SECONDS
             
-            # Update note with AI results
-            note.summary = summary_result["summary"]
-            note.risk_level = _normalize_risk_level(risk_result.get("risk_level"))
+            results, failed_calls = {}, []
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except Exception as e:
+                    future.cancel()
+                    results[name] = self._fallback_result(name, calls, e, failed_calls)
             
-            # Combine recommendations
-            all_recommendations = []
-            if summary_result.get("recommendations"):
-                all_recommendations.append(f"Clinical: {summary_result['recommendations']}")
-            if risk_result.get("recommendations"):
-                all_recommendations.append(f"Risk Management: {risk_result['recommendations']}")
-            if nurse_recommendations.get("nursing_actions"):
-                all_recommendations.append(f"Nursing: {nurse_recommendations['nursing_actions']}")
+            return self._apply_ai_results(note, results, failed_calls, db)
             
-            note.recommendations = "\n\n".join(all_recommendations) if all_recommendations else None
-            
-            # Create tags from key findings
-            tags = self._extract_tags(summary_result, risk_result)
-            note.tags = ",".join(tags) if tags else None
-            
-            db.commit()
-            
-            return {
-                "success": True,
-                "summary": summary_result["summary"],
-                "risk_level": risk_result["risk_level"],
-                "recommendations": note.recommendations,
-                "tags": tags,
-                "nurse_recommendations": nurse_recommendations
-            }
+        except Exception as e:
+            return self._error_result(e)
+    
+    async def aprocess_note(self, note: Note, patient: Patient, db) -> Dict[str, str]:
+        """
+        Async variant of `process_note` for request handlers: the LLM calls run on the
+        shared worker pool and the session work through `run_session_sync` (an
+        AsyncSession, or a sync Session on a worker thread), so the event loop
+        stays free throughout.
+        """
+        try:
+            calls = await run_session_sync(db, lambda session: self._prepare_ai_calls(note, patient, session))
+            await release_connection(db)
+            results, failed_calls = await self.arun_ai_calls(calls)
+            return await run_session_sync(
+                db, lambda session: self._apply_ai_results(note, results, failed_calls, session)
+            )
             
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "summary": None,
-                "risk_level": "UNKNOWN",
-                "recommendations": None,
-                "tags": [],
-                "nurse_recommendations": {}
-            }
+            return self._error_result(e)
+    
+    async def arun_ai_calls(self, calls: Dict[str, Tuple[Callable, Callable]]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Run prepared AI calls concurrently, substituting fallbacks for failures and timeouts."""
+        loop = asyncio.get_running_loop()
+        
+        async def run(call):
+            return await asyncio.wait_for(
+                loop.run_in_executor(_ai_call_executor, call),
+                timeout=AI_CALL_TIMEOUT_SECONDS
+            )
+        
+        outcomes = await asyncio.gather(
+            *(run(call) for call, _ in calls.values()),
+            return_exceptions=True
+        )
+        
+        results, failed_calls = {}, []
+        for name, outcome in zip(calls, outcomes):
+            if isinstance(outcome, BaseException):
+                results[name] = self._fallback_result(name, calls, outcome, failed_calls)
+            else:
+                results[name] = outcome
+        return results, failed_calls
+    
+    def _prepare_ai_calls(self, note: Note, patient: Patient, db: Session) -> Dict[str, Tuple[Callable, Callable]]:
+        """Gather DB context on the calling thread and return the independent AI calls."""
+        patient_context = self._build_patient_context(patient, db)
+        patient_history = self._get_patient_history(patient.id, db)
+        return self.build_ai_calls(note, patient_context, patient_history)
+    
+    def build_ai_calls(self, note: Note, patient_context: str, patient_history: List[str]) -> Dict[str, Tuple[Callable, Callable]]:
+        """
+        Return the independent AI calls for a note, each paired with the fallback
+        used if it fails or times out. Does not touch the database.
+        """
+        note_type = note.note_type.value
+        
+        # Generate summary
+        if hasattr(self.ai_service, "summarize_note"):
+            summarize = partial(
+                self.ai_service.summarize_note,
+                note_content=note.content,
+                note_type=note_type,
+                patient_context=patient_context,
+                patient_id=note.patient_id,
+                note_id=note.id
+            )
+        else:
+            # Defensive fallback for older AI service implementations
+            summarize = partial(
+                self.ai_service.summarize_medical_note,
+                note_content=note.content,
+                note_type=note_type,
+                patient_history=None,
+                patient_id=note.patient_id,
+                note_id=note.id
+            )
+        
+        # Assess risk
+        if hasattr(self.ai_service, "assess_risk"):
+            assess = partial(self.ai_service.assess_risk, note_content=note.content, patient_history=patient_history)
+        else:
+            assess = partial(self.ai_service.assess_patient_risk, note_content=note.content, patient_history=patient_history)
+        
+        calls = {
+            "summary": (summarize, partial(MedicalAIService.build_structured_mock_summary, note.content, note_type)),
+            "risk": (assess, partial(_keyword_risk_assessment, note.content)),
+        }
+        
+        # Generate nurse recommendations if it's a nurse note
+        if note_type == "nurse_note" and hasattr(self.ai_service, "generate_nurse_recommendations"):
+            calls["nurse"] = (
+                partial(
+                    self.ai_service.generate_nurse_recommendations,
+                    note_content=note.content,
+                    patient_context=patient_context
+                ),
+                dict
+            )
+        
+        return calls
+    
+    @staticmethod
+    def _fallback_result(name: str, calls: Dict, error: BaseException, failed_calls: List[str]) -> Dict:
+        reason = "timeout" if isinstance(error, (TimeoutError, asyncio.TimeoutError, FuturesTimeoutError)) else str(error)
+        print(f"⚠️ AI call '{name}' failed ({reason}); using fallback result")
+        failed_calls.append(name)
+        return calls[name][1]()
+    
+    def _apply_ai_results(self, note: Note, results: Dict[str, Dict], failed_calls: List[str], db: Session) -> Dict:
+        """Write AI results onto the note, commit, and build the response payload."""
+        summary_result = results["summary"]
+        risk_result = results["risk"]
+        nurse_recommendations = results.get("nurse", {})
+        
+        update = self.build_note_update(summary_result, risk_result, nurse_recommendations)
+        previous_risk_level = note.risk_level
+        for field, value in update.items():
+            setattr(note, field, value)
+        record_note_risk(db, note, previous_risk_level)
+        invalidate_patient_summaries(db, note.patient_id)
+        
+        db.commit()
+        
+        return {
+            "success": True,
+            "summary": summary_result["summary"],
+            "risk_level": risk_result["risk_level"],
+            "recommendations": note.recommendations,
+            "tags": note.tags.split(",") if note.tags else [],
+            "nurse_recommendations": nurse_recommendations,
+            "partial": bool(failed_calls),
+            "failed_calls": failed_calls
+        }
+    
+    def build_note_update(self, summary_result: Dict, risk_result: Dict, nurse_recommendations: Dict) -> Dict[str, Optional[str]]:
+        """Column values for a note derived from the three AI results."""
+        # Combine recommendations
+        all_recommendations = []
+        if summary_result.get("recommendations"):
+            all_recommendations.append(f"Clinical: {summary_result['recommendations']}")
+        if risk_result.get("recommendations"):
+            all_recommendations.append(f"Risk Management: {risk_result['recommendations']}")
+        if nurse_recommendations.get("nursing_actions"):
+            all_recommendations.append(f"Nursing: {nurse_recommendations['nursing_actions']}")
+        
+        # Create tags from key findings
+        tags = self._extract_tags(summary_result, risk_result)
+        
+        return {
+            "summary": summary_result["summary"],
+            "risk_level": _normalize_risk_level(risk_result.get("risk_level")),
+            "recommendations": "\n\n".join(all_recommendations) if all_recommendations else None,
+            "tags": ",".join(tags) if tags else None
+        }
+    
+    @staticmethod
+    def _error_result(error: Exception) -> Dict:
+        return {
+            "success": False,
+            "error": str(error),
+            "summary": None,
+            "risk_level": "UNKNOWN",
+            "recommendations": None,
+            "tags": [],
+            "nurse_recommendations": {}
+        }
     
     def _build_patient_context(self, patient: Patient, db: Session) -> str:
         """Build comprehensive patient context"""
@@ -121,7 +238,7 @@ class SummarizationAgent:
             Note.patient_id == patient_id
         ).order_by(Note.created_at.desc()).limit(5).all()
         
-        return [f"{note.title}: {note.content[:200]}..." for note in recent_notes]
+        return [format_history_entry(note.title, note.content) for note in recent_notes]
     
     def _extract_tags(self, summary_result: Dict, risk_result: Dict) -> List[str]:
         """Extract relevant tags from AI analysis"""
@@ -147,3 +264,18 @@ def _normalize_risk_level(value: Optional[str]) -> Optional[str]:
     if lowered in {"high", "medium", "low"}:
         return lowered
     return lowered
+
+
+def format_history_entry(title: str, content: Optional[str]) -> str:
+    return f"{title}: {(content or '')[:200]}..."
+
+
+def _keyword_risk_assessment(note_content: str) -> Dict:
+    """Risk fallback used when the risk call fails or times out."""
+    mock = MedicalAIService.build_structured_mock_summary(note_content)
+    return {
+        "risk_level": mock["risk_level"],
+        "recommendations": None,
+        "ai_generated": False,
+        "mock": True
+    }
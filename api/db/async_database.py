@@ -0,0 +1,171 @@
+"""
+Async database sessions for request handlers.
+
+`get_async_db` yields an `AsyncSession` bound to an asyncpg (Postgres) or
+aiosqlite (SQLite) engine built from DATABASE_URL, so hot read routes wait on the
+database without holding the event loop. ASYNC_DATABASE_URL overrides the
+derived URL.
+
+When SQLAlchemy's asyncio extension or the async driver is not installed, the
+dependency falls back to `SyncSessionAdapter`: the regular sync session with the
+same awaitable interface, executed on the threadpool. Routes are written once
+against the AsyncSession API either way.
+
+Services written against the sync `Session` API run through `run_session_sync`:
+inside `AsyncSession.run_sync` (database I/O is awaited on the async driver), or
+on a worker thread for a plain sync session. LLM calls never run in there, and
+callers `release_connection` before awaiting one so no pooled (or pgbouncer
+server) connection sits idle in a transaction while the model answers.
+"""
+import asyncio
+import importlib.util
+import os
+from typing import Dict, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from api.db.database import DATABASE_URL, SessionLocal
+from api.db.pooling import async_engine_pool_kwargs, pgbouncer_connect_args
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    SQLALCHEMY_ASYNC_AVAILABLE = True
+except ImportError:
+    SQLALCHEMY_ASYNC_AVAILABLE = False
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+# libpq options asyncpg doesn't accept as URL query parameters
+_LIBPQ_ONLY_PARAMS = ("sslmode", "channel_binding")
+
+
+def to_async_url(url: str) -> Tuple[str, Dict]:
+    """Map a sync DATABASE_URL to its async-driver equivalent plus connect_args."""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "postgres":
+        dialect = "postgresql"
+    driver = ASYNC_DRIVERS.get(dialect)
+    if driver is None:
+        return url, {}
+
+    connect_args = {}
+    async_url = f"{dialect}+{driver}://{rest}"
+    if dialect == "postgresql":
+        parts = urlsplit(async_url)
+        params = parse_qsl(parts.query)
+        sslmode = dict(params).get("sslmode")
+        if sslmode in ("require", "verify-ca", "verify-full") or "neon.tech" in url:
+            connect_args["ssl"] = "require"
+        query = urlencode([(key, value) for key, value in params if key not in _LIBPQ_ONLY_PARAMS])
+        async_url = urlunsplit(parts._replace(query=query))
+    return async_url, connect_args
+
+
+def _driver_installed(async_url: str) -> bool:
+    scheme = async_url.split("://", 1)[0]
+    driver = scheme.split("+", 1)[1] if "+" in scheme else None
+    return driver is not None and importlib.util.find_spec(driver) is not None
+
+
+class SyncSessionAdapter:
+    """
+    AsyncSession-shaped wrapper over a sync `Session`. Every database call runs on
+    the threadpool; results are buffered there so iterating them never does I/O
+    on the event loop.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def execute(self, statement, params=None):
+        return await run_in_threadpool(lambda: self.sync_session.execute(statement, params).freeze()())
+
+    async def scalar(self, statement, params=None):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params)
+
+    async def scalars(self, statement, params=None):
+        result = await self.execute(statement, params)
+        return result.scalars()
+
+    async def get(self, entity, ident):
+        return await run_in_threadpool(self.sync_session.get, entity, ident)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+if not SQLALCHEMY_ASYNC_AVAILABLE:
+    AsyncSession = SyncSessionAdapter
+
+
+class PrimarySyncSession(Session):
+    """Sync session behind `get_async_db`'s AsyncSession; its own class so session events can target it."""
+
+ASYNC_DATABASE_URL, _async_connect_args = (
+    (os.getenv("ASYNC_DATABASE_URL"), {}) if os.getenv("ASYNC_DATABASE_URL") else to_async_url(DATABASE_URL)
+)
+
+async_engine = None
+AsyncSessionLocal = None
+if SQLALCHEMY_ASYNC_AVAILABLE and _driver_installed(ASYNC_DATABASE_URL):
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={**_async_connect_args, **pgbouncer_connect_args(ASYNC_DATABASE_URL)},
+        **async_engine_pool_kwargs(ASYNC_DATABASE_URL)
+    )
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, sync_session_class=PrimarySyncSession, expire_on_commit=False, autoflush=False
+    )
+else:
+    print("⚠️ Async database driver not installed - async routes use the sync pool on worker threads")
+
+
+async def run_session_sync(db, fn, *args, **kwargs):
+    """Call `fn(sync_session, *args, **kwargs)` for an AsyncSession, the adapter or a sync Session."""
+    if isinstance(db, Session):
+        return await asyncio.to_thread(fn, db, *args, **kwargs)
+    return await db.run_sync(fn, *args, **kwargs)
+
+
+async def release_connection(db) -> None:
+    """
+    Commit the session's transaction so its connection goes back to the pool; the
+    next statement begins a fresh one. Loaded objects stay usable (AsyncSessionLocal
+    doesn't expire on commit; sync sessions reload them on access).
+    """
+    await run_session_sync(db, lambda session: session.commit())
+
+
+async def get_async_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+    else:
+        session = SyncSessionAdapter(SessionLocal())
+        try:
+            yield session
+        finally:
+            await session.close()
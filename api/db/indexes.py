@@ -0,0 +1,70 @@
+"""
+Secondary indexes for the hot read paths.
+
+The indexes are declared on the models (`__table_args__`), so fresh databases
+get them from the schema. Existing databases are brought up to date with
+`migration 0002 (`python -m api.db.migrations upgrade`), which calls
+`create_hot_path_indexes`: CREATE INDEX IF NOT EXISTS for each of them, with
+CONCURRENTLY on Postgres so writes to large tables are not blocked. A
+concurrent build that failed leaves an INVALID index behind; those are dropped
+and rebuilt.
+"""
+from typing import List
+
+from sqlalchemy import Index, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+
+from api.models.appointment import Appointment
+from api.models.audit import AuditLog
+from api.models.note import Note
+
+INDEXED_TABLES = (Note.__table__, Appointment.__table__, AuditLog.__table__)
+
+
+def hot_path_indexes() -> List[Index]:
+    """Secondary indexes declared on the hot tables (the redundant `index=True` on primary keys excluded)."""
+    return [
+        index
+        for table in INDEXED_TABLES
+        for index in sorted(table.indexes, key=lambda index: index.name)
+        if not all(column.primary_key for column in index.columns)
+    ]
+
+
+def create_index_sql(index: Index, engine: Engine, concurrently: bool = False) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+    if concurrently:
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+    return ddl
+
+
+def _drop_invalid_index(conn, name: str) -> None:
+    invalid = conn.execute(
+        text("SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid"
+             " WHERE c.relname = :name AND NOT i.indisvalid"),
+        {"name": name}
+    ).first()
+    if invalid:
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+def create_hot_path_indexes(conn: Connection) -> List[str]:
+    """
+    Create any missing hot-path index on an AUTOCOMMIT connection (CONCURRENTLY
+    cannot run inside a transaction block); returns the statements that were run.
+    """
+    concurrently = conn.dialect.name == "postgresql"
+    executed = []
+    for index in hot_path_indexes():
+        if concurrently:
+            _drop_invalid_index(conn, index.name)
+        ddl = create_index_sql(index, conn.engine, concurrently=concurrently)
+        conn.execute(text(ddl))
+        executed.append(ddl)
+    return executed
+
+
+def ensure_indexes(engine: Engine) -> List[str]:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        return create_hot_path_indexes(conn)
@@ -0,0 +1,131 @@
+"""
+Versioned schema migrations, run once per deploy out of band:
+
+    python -m api.db.migrations upgrade        # apply pending migrations
+    python -m api.db.migrations status         # list applied/pending versions
+
+Each module in `versions/` is named `NNNN_description.py` and defines
+`upgrade(conn)`. Applied versions are recorded in `schema_migrations`, so each
+migration runs exactly once per database. The app itself never inspects or
+creates schema at startup.
+
+By default a migration runs inside a transaction together with its version
+row. Set `transactional = False` for work that cannot or should not hold one
+transaction: CREATE INDEX CONCURRENTLY, or batched backfills that commit as they
+go. Those receive an AUTOCOMMIT connection and must be safe to re-run, since a
+crash can leave them partly applied without their version row.
+
+0001 creates tables from the current models, so later migrations must tolerate
+a fresh database where their objects already exist (CREATE ... IF NOT EXISTS,
+`checkfirst=True`).
+
+On Postgres a session-level advisory lock serialises concurrent runners (e.g.
+two deploys starting at once).
+"""
+import importlib
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Set
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select, text
+from sqlalchemy.engine import Connection, Engine
+
+VERSIONS_DIR = Path(__file__).parent / "versions"
+_VERSION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+# Arbitrary constant identifying this app's migration lock
+ADVISORY_LOCK_KEY = 72634101
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String(16), primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    module: object
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, "transactional", True)
+
+
+def discover_migrations() -> List[Migration]:
+    migrations = []
+    for path in sorted(VERSIONS_DIR.glob("*.py")):
+        match = _VERSION_FILE.match(path.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.versions.{path.stem}")
+        migrations.append(Migration(match.group(1), match.group(2), module))
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {VERSIONS_DIR}: {versions}")
+    return migrations
+
+
+def applied_versions(conn: Connection) -> Set[str]:
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def _record(conn: Connection, migration: Migration) -> None:
+    conn.execute(schema_migrations.insert().values(
+        version=migration.version, name=migration.name, applied_at=datetime.now(timezone.utc)
+    ))
+
+
+def _apply(engine: Engine, migration: Migration) -> None:
+    if migration.transactional:
+        with engine.begin() as conn:
+            migration.module.upgrade(conn)
+            _record(conn, migration)
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        migration.module.upgrade(conn)
+    with engine.begin() as conn:
+        _record(conn, migration)
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [migration for migration in discover_migrations() if migration.version not in applied]
+
+
+def upgrade(engine: Engine, target: Optional[str] = None, log=print) -> List[str]:
+    """Apply pending migrations up to and including `target`; returns the versions applied."""
+    lock_conn = None
+    if engine.dialect.name == "postgresql":
+        lock_conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+    try:
+        # Re-read under the lock: another runner may have just finished
+        applied = []
+        for migration in pending_migrations(engine):
+            if target is not None and migration.version > target:
+                break
+            log(f"Applying {migration.version}_{migration.name}...")
+            _apply(engine, migration)
+            applied.append(migration.version)
+        return applied
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            lock_conn.close()
+
+
+def status(engine: Engine) -> List[dict]:
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        applied = {row.version: row.applied_at for row in conn.execute(select(schema_migrations))}
+    return [
+        {"version": migration.version, "name": migration.name, "applied_at": applied.get(migration.version)}
+        for migration in discover_migrations()
+    ]
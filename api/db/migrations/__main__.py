@@ -0,0 +1,21 @@
+"""
+    python -m api.db.migrations upgrade [--target VERSION]
+    python -m api.db.migrations status
+"""
+import argparse
+
+from api.db.database import engine
+from api.db.migrations import status, upgrade
+
+parser = argparse.ArgumentParser(prog="python -m api.db.migrations")
+parser.add_argument("command", choices=["upgrade", "status"])
+parser.add_argument("--target", help="stop after this version (upgrade only)")
+args = parser.parse_args()
+
+if args.command == "upgrade":
+    applied = upgrade(engine, target=args.target)
+    print(f"✅ Applied {len(applied)} migration(s)" if applied else "✅ Database is up to date")
+else:
+    for row in status(engine):
+        state = f"applied {row['applied_at']:%Y-%m-%d %H:%M}" if row["applied_at"] else "pending"
+        print(f"{row['version']}  {row['name']:<40} {state}")
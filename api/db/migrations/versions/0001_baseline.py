@@ -0,0 +1,8 @@
+"""Tables for every model, as the app used to create them at startup."""
+from api.db.database import Base
+from api.models import appointment, audit, note, patient, user  # noqa: F401  (register tables)
+
+
+def upgrade(conn):
+    # Existing databases already have these tables; only missing ones are created
+    Base.metadata.create_all(bind=conn, checkfirst=True)
@@ -0,0 +1,10 @@
+"""Secondary indexes for the list/history/report queries, built without locking writes."""
+from api.db.indexes import create_hot_path_indexes
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction
+transactional = False
+
+
+def upgrade(conn):
+    for statement in create_hot_path_indexes(conn):
+        print(f"  {statement}")
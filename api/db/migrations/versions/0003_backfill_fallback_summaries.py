@@ -0,0 +1,12 @@
+"""Fallback summaries for notes written before they were stored on write."""
+from sqlalchemy.orm import Session
+
+# One commit per batch, so large notes tables are never locked by a single transaction
+transactional = False
+
+
+def upgrade(conn):
+    from api.services.fallback_summary_service import backfill_fallback_summaries
+
+    with Session(bind=conn) as db:
+        print(f"  {backfill_fallback_summaries(db, batch_size=500)}")
@@ -0,0 +1,15 @@
+"""Per-patient risk state table, filled from existing notes."""
+from sqlalchemy.orm import Session
+
+from api.models.risk_state import PatientRiskState
+
+# The backfill commits one batch of patients at a time
+transactional = False
+
+
+def upgrade(conn):
+    from api.services.risk_state_service import backfill_risk_states
+
+    PatientRiskState.__table__.create(conn, checkfirst=True)
+    with Session(bind=conn) as db:
+        print(f"  {backfill_risk_states(db)}")
@@ -0,0 +1,15 @@
+"""High-risk patient roster, filled from existing HIGH/CRITICAL notes."""
+from sqlalchemy.orm import Session
+
+from api.models.risk_state import HighRiskRosterEntry
+
+# The backfill commits one batch of patients at a time
+transactional = False
+
+
+def upgrade(conn):
+    from api.services.high_risk_roster import backfill_roster
+
+    HighRiskRosterEntry.__table__.create(conn, checkfirst=True)
+    with Session(bind=conn) as db:
+        print(f"  {backfill_roster(db)}")
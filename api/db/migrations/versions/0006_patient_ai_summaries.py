@@ -0,0 +1,6 @@
+"""Stored per-patient AI summaries; filled on first request, so no backfill."""
+from api.models.ai_summary import PatientAISummary
+
+
+def upgrade(conn):
+    PatientAISummary.__table__.create(conn, checkfirst=True)
@@ -0,0 +1 @@
+# Migration versions (see api/db/migrations/__init__.py)
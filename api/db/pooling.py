@@ -0,0 +1,156 @@
+"""
+Connection pool configuration and metrics for the SQLAlchemy engine.
+
+Configuration (environment):
+    DB_POOL_MODE        queue | null | pgbouncer (default: null on Vercel, queue elsewhere)
+                        - queue:     in-process QueuePool sized below
+                        - null:      no pooling; one connection per checkout (serverless)
+                        - pgbouncer: no in-process pooling behind a transaction-mode PgBouncer
+                                     (or Neon's pooled endpoint), which owns the pool; the
+                                     async engine's prepared-statement caches are turned off,
+                                     since consecutive transactions may land on different
+                                     server connections (see pgbouncer_connect_args)
+    DB_POOL_SIZE        persistent connections per process (default: 5)
+    DB_MAX_OVERFLOW     extra connections allowed under burst (default: 10)
+    DB_POOL_TIMEOUT     seconds to wait for a connection before failing (default: 30)
+    DB_POOL_RECYCLE     seconds after which a connection is replaced (default: 1800)
+    DB_POOL_PRE_PING    true to ping on every checkout (default: false)
+
+Pre-ping costs a round trip per checkout. Instead, connections are recycled before
+server/proxy idle timeouts close them, and a disconnect error invalidates the
+pool so stale connections are replaced on their next checkout (SQLAlchemy does
+this on any error it classifies as a disconnect).
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def pool_mode() -> str:
+    default = "null" if os.getenv("VERCEL") else "queue"
+    return os.getenv("DB_POOL_MODE", default).lower()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self._in_get = threading.local()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; only time the outermost call
+        if getattr(self._in_get, "active", False):
+            return super()._do_get()
+        self._in_get.active = True
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.checkout_timeouts += 1
+            raise
+        finally:
+            self._in_get.active = False
+            waited = time.perf_counter() - started
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def _queue_pool_kwargs() -> Dict:
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": _env_flag("DB_POOL_PRE_PING"),
+        # Reuse the most recently returned connection so surplus ones sit idle and get recycled
+        "pool_use_lifo": True,
+    }
+
+
+def engine_pool_kwargs(database_url: str) -> Dict:
+    """Keyword arguments for `create_engine` according to the environment."""
+    mode = pool_mode()
+    if mode in ("null", "pgbouncer"):
+        return {"poolclass": NullPool, "pool_pre_ping": False}
+    if database_url.startswith("sqlite") and ":memory:" in database_url:
+        return {}
+    return {"poolclass": InstrumentedQueuePool, **_queue_pool_kwargs()}
+
+
+def async_engine_pool_kwargs(database_url: str) -> Dict:
+    """Same settings for `create_async_engine` (which uses its own async-adapted QueuePool)."""
+    if pool_mode() in ("null", "pgbouncer"):
+        return {"poolclass": NullPool, "pool_pre_ping": False}
+    if database_url.startswith("sqlite") and ":memory:" in database_url:
+        return {}
+    return _queue_pool_kwargs()
+
+
+def pgbouncer_connect_args(database_url: str) -> Dict:
+    """
+    Driver `connect_args` for DB_POOL_MODE=pgbouncer. A server connection only
+    belongs to the client for one transaction there, so statements prepared on it
+    must not be reused by name: asyncpg's statement caches are disabled and every
+    prepared statement gets a unique name. Empty in other modes and for psycopg2,
+    which does not prepare statements server-side.
+    """
+    if pool_mode() != "pgbouncer" or not database_url.split("://", 1)[0].endswith("+asyncpg"):
+        return {}
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+
+_disconnects = {"count": 0}
+
+
+def install_pool_events(engine) -> None:
+    @event.listens_for(engine, "handle_error")
+    def _count_disconnects(context):
+        if context.is_disconnect:
+            _disconnects["count"] += 1
+
+
+def pool_metrics(engine) -> Dict:
+    pool = engine.pool
+    metrics = {"mode": pool_mode(), "pool_class": type(pool).__name__, "disconnects": _disconnects["count"]}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        metrics.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": checked_out,
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "utilization": round(checked_out / capacity, 4) if capacity else None,
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        metrics.update({
+            "checkouts": pool.checkouts,
+            "checkout_timeouts": pool.checkout_timeouts,
+            "checkout_wait_ms_avg": round(pool.wait_seconds_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "checkout_wait_ms_max": round(pool.wait_seconds_max * 1000, 3),
+        })
+    return metrics
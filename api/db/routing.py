@@ -0,0 +1,255 @@
+"""
+Read-replica routing for list and report queries.
+
+`get_read_db` / `get_async_read_db` yield sessions whose SELECTs go to a healthy
+replica while anything they write (and every read after that write) goes to the
+primary. Writes through the primary sessions (`get_db` and `get_async_db`) are
+recorded per user, and that user's reads stay on the primary for READ_YOUR_WRITES_SECONDS so they see
+their own changes even if replicas lag.
+
+Replica lag is probed in a background thread; replicas behind by more than
+REPLICA_MAX_LAG_SECONDS (or failing the probe) are skipped until they catch up.
+With no replicas configured every session simply uses the primary.
+
+Configuration (environment):
+    DATABASE_REPLICA_URLS       comma-separated replica URLs (default: none)
+    REPLICA_MAX_LAG_SECONDS     lag above which a replica is skipped (default: 5)
+    REPLICA_LAG_CHECK_SECONDS   probe interval (default: 2)
+    READ_YOUR_WRITES_SECONDS    primary-only window after a user's write (default: 10)
+"""
+import itertools
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+from api.db import async_database
+from api.db.async_database import PrimarySyncSession, SyncSessionAdapter, to_async_url
+from api.db.database import SessionLocal, engine as primary_engine
+from api.db.pooling import async_engine_pool_kwargs, engine_pool_kwargs, pgbouncer_connect_args
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "2"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Set by get_current_user so routing and write tracking know who the request is for
+current_user_id: ContextVar[Optional[int]] = ContextVar("current_user_id", default=None)
+
+_LAG_QUERY = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def probe_replication_lag(engine: Engine) -> float:
+    """Seconds the replica is behind the primary (0 for non-Postgres stand-ins)."""
+    if engine.dialect.name != "postgresql":
+        return 0.0
+    with engine.connect() as conn:
+        return float(conn.execute(_LAG_QUERY).scalar() or 0)
+
+
+class ReplicaState:
+    def __init__(self, engine: Engine, async_engine=None):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.lag: Optional[float] = None
+        self.healthy = False
+        self.error: Optional[str] = None
+
+
+class ReplicaRouter:
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: List[ReplicaState],
+        primary_async=None,
+        max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = REPLICA_LAG_CHECK_SECONDS,
+        read_your_writes_seconds: float = READ_YOUR_WRITES_SECONDS,
+        probe: Callable[[Engine], float] = probe_replication_lag,
+    ):
+        self.primary = primary
+        self.primary_async = primary_async
+        self.replicas = replicas
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.probe = probe
+        self.primary_reads = 0
+        self.replica_reads = 0
+        self._recent_writes: Dict[int, float] = {}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._monitor: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """Probe every replica once and update its health."""
+        for replica in self.replicas:
+            try:
+                replica.lag = self.probe(replica.engine)
+                replica.healthy = replica.lag <= self.max_lag_seconds
+                replica.error = None
+            except Exception as e:
+                replica.healthy = False
+                replica.error = str(e)
+
+    def _ensure_monitor(self) -> None:
+        if self._monitor is not None or not self.replicas:
+            return
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self.refresh()
+
+            def monitor():
+                while True:
+                    time.sleep(self.check_interval)
+                    self.refresh()
+
+            self._monitor = threading.Thread(target=monitor, name="replica-lag-monitor", daemon=True)
+            self._monitor.start()
+
+    def note_write(self, user_id: Optional[int]) -> None:
+        if user_id is None:
+            return
+        with self._lock:
+            self._recent_writes[user_id] = time.monotonic() + self.read_your_writes_seconds
+            if len(self._recent_writes) > 10000:
+                now = time.monotonic()
+                self._recent_writes = {uid: until for uid, until in self._recent_writes.items() if until > now}
+
+    def wrote_recently(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        until = self._recent_writes.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    def choose_replica(self, user_id: Optional[int] = None) -> Optional[ReplicaState]:
+        """A healthy replica for this user's reads, or None when they must use the primary."""
+        if not self.replicas or self.wrote_recently(user_id):
+            self.primary_reads += 1
+            return None
+        self._ensure_monitor()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.primary_reads += 1
+            return None
+        self.replica_reads += 1
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def stats(self) -> Dict:
+        return {
+            "replicas": [
+                {"url": replica.engine.url.render_as_string(hide_password=True), "healthy": replica.healthy,
+                 "lag_seconds": replica.lag, "error": replica.error}
+                for replica in self.replicas
+            ],
+            "primary_reads": self.primary_reads,
+            "replica_reads": self.replica_reads,
+            "max_lag_seconds": self.max_lag_seconds,
+            "read_your_writes_seconds": self.read_your_writes_seconds,
+        }
+
+
+class RoutingSession(Session):
+    """
+    Session that reads from a replica chosen on first use and sends writes to the
+    primary. Once it has written, later reads also go to the primary.
+    """
+
+    router: ReplicaRouter = None
+    use_async_engines = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._read_engine = None
+        self._wrote = False
+
+    def _primary(self):
+        if self.use_async_engines:
+            return self.router.primary_async.sync_engine
+        return self.router.primary
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self._wrote = True
+        if self._wrote:
+            return self._primary()
+        if self._read_engine is None:
+            replica = self.router.choose_replica(current_user_id.get())
+            if replica is None:
+                self._read_engine = self._primary()
+            else:
+                self._read_engine = replica.async_engine.sync_engine if self.use_async_engines else replica.engine
+        return self._read_engine
+
+
+class AsyncRoutingSession(RoutingSession):
+    use_async_engines = True
+
+
+def _build_router() -> ReplicaRouter:
+    use_async = async_database.AsyncSessionLocal is not None
+    replicas = []
+    for url in DATABASE_REPLICA_URLS:
+        replica_async = None
+        if use_async:
+            async_url, connect_args = to_async_url(url)
+            replica_async = async_database.create_async_engine(
+                async_url,
+                connect_args={**connect_args, **pgbouncer_connect_args(async_url)},
+                **async_engine_pool_kwargs(async_url)
+            )
+        replicas.append(ReplicaState(create_engine(url, **engine_pool_kwargs(url)), replica_async))
+    return ReplicaRouter(primary_engine, replicas, primary_async=async_database.async_engine)
+
+
+replica_router = _build_router()
+RoutingSession.router = replica_router
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    if async_database.AsyncSessionLocal is not None:
+        async with async_database.AsyncSession(
+            sync_session_class=AsyncRoutingSession, expire_on_commit=False, autoflush=False
+        ) as session:
+            yield session
+    else:
+        session = SyncSessionAdapter(ReadSessionLocal())
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+# Read-your-writes: remember which user committed through a primary session
+def _flag_session_write(session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+def _record_user_write(session) -> None:
+    if session.info.pop("wrote", False):
+        replica_router.note_write(current_user_id.get())
+
+
+for _primary_sessions in (SessionLocal, PrimarySyncSession):
+    event.listen(_primary_sessions, "after_flush", _flag_session_write)
+    event.listen(_primary_sessions, "after_commit", _record_user_write)
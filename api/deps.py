@@ -1,15 +1,21 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from typing import Optional
+import hmac
 import os
 from dotenv import load_dotenv
 
 from api.db.database import get_db
-from api.models.user import User
+from api.db.routing import current_user_id
+from api.models.user import User, UserRole
 from api.schemas.user import TokenData
+from api.services.auth_cache import Principal, principal_cache, token_signature
+from api.services.password_hashing import password_hash_pool
 
 load_dotenv()
 
@@ -17,9 +23,12 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Lets scrapers read /metrics with an X-Metrics-Token header; unset, only admins can
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -27,6 +36,14 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the bounded hashing pool; raises PasswordHashPoolSaturated when full"""
+    return await password_hash_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash on the bounded hashing pool; raises PasswordHashPoolSaturated when full"""
+    return await password_hash_pool.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -37,14 +54,26 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def get_user_by_email(db: Session, email: str):
+    return db.query(User).filter(User.email == email).first()
+
 def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+    user = get_user_by_email(db, email)
     if not user:
         return False
     if not verify_password(password, user.hashed_password):
         return False
     return user
 
+async def authenticate_user_async(db: Session, email: str, password: str):
+    """authenticate_user for async routes: the lookup runs on the threadpool, bcrypt on the hashing pool"""
+    user = await run_in_threadpool(get_user_by_email, db, email)
+    if not user:
+        return False
+    if not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -55,8 +84,9 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    token = credentials.credentials
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
@@ -64,12 +94,43 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == token_data.email).first()
+    # Signature was verified above, so a cached principal for it can be trusted
+    signature = token_signature(token)
+    principal = principal_cache.get(signature)
+    if principal is not None:
+        current_user_id.set(principal.id)
+        return principal
+    
+    # Cache miss: the role and active flag come from the users table, never from the token
+    user = await run_in_threadpool(get_user_by_email, db, token_data.email)
     if user is None:
         raise credentials_exception
-    return user
+    
+    principal = Principal.from_user(user)
+    principal_cache.set(signature, principal, token_expires_at=payload.get("exp"))
+    current_user_id.set(principal.id)
+    return principal
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+async def require_metrics_access(
+    x_metrics_token: Optional[str] = Header(default=None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+):
+    """/metrics exposes pool and cache internals: admins only, or a scraper presenting METRICS_TOKEN."""
+    if METRICS_TOKEN and x_metrics_token and hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+        return None
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_current_active_user(await get_current_user(credentials, db))
+    if user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
+    return user
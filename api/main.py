@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
@@ -21,30 +21,40 @@ logger.info(f"Python Path: {sys.path}")
 logger.info(f"Current Directory: {os.getcwd()}")
 
 try:
-    from api.db.database import engine, Base
+    from api.db.database import engine
     from api.routes import auth, patients, notes, ai, appointments, tasks
+    from api.deps import require_metrics_access
     from api.services.cloud_tasks_service import ensure_queue_exists
+    from api.services.auth_cache import principal_cache
+    from api.services.password_hashing import password_hash_pool
+    from api.db.pooling import pool_metrics
+    from api.db.async_database import async_engine
+    from api.db.routing import replica_router
+    from api.services.registry import registry_stats
+    from api.services.structured_output import structured_output_metrics
     logger.info("Successfully imported modules using 'api.' prefix")
 except ImportError as e:
     logger.warning(f"Failed to import using 'api.' prefix: {e}. Trying absolute imports...")
     try:
-        from db.database import engine, Base
+        from db.database import engine
         from routes import auth, patients, notes, ai, appointments, tasks
+        from deps import require_metrics_access
         from services.cloud_tasks_service import ensure_queue_exists
+        from services.auth_cache import principal_cache
+        from services.password_hashing import password_hash_pool
+        from db.pooling import pool_metrics
+        from db.async_database import async_engine
+        from db.routing import replica_router
+        from services.registry import registry_stats
+        from services.structured_output import structured_output_metrics
         logger.info("Successfully imported modules using absolute imports")
     except ImportError as e2:
         logger.error(f"Critical: Failed all import attempts. E1: {e}, E2: {e2}")
         raise e2
 
-# Create database tables
+# Schema is managed out of band by `python -m api.db.migrations upgrade`; startup never touches it
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables with safety
-    try:
-        Base.metadata.create_all(bind=engine)
-    except Exception as e:
-        print(f"Database initialization warning: {e}")
-        
     # Ensure Cloud Tasks queue exists
     if os.getenv("SKIP_CLOUD_TASKS") != "true":
         try:
@@ -86,3 +96,19 @@ def healthcheck():
 @app.get("/health")
 def health():
     return {"status": "healthy", "version": "1.0.0"}
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+def metrics():
+    """
+    Process-local cache, hashing pool, connection pool, AI registry and LLM parsing
+    counters for dashboards and load tests (admins, or X-Metrics-Token: METRICS_TOKEN)
+    """
+    return {
+        "auth_cache": principal_cache.stats(),
+        "password_hashing": password_hash_pool.stats(),
+        "db_pool": pool_metrics(engine),
+        "async_db_pool": pool_metrics(async_engine.sync_engine) if async_engine is not None else None,
+        "read_replicas": replica_router.stats(),
+        "ai_registry": registry_stats(),
+        "structured_output": structured_output_metrics.stats()
+    }
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy.sql import func
+from api.db.database import Base
+
+class PatientAISummary(Base):
+    """
+    Last good LLM summary of a patient, one row per kind ("summary" for the
+    patient overview, "journey" for the timeline). Keyed on a fingerprint of the
+    notes it was generated from; note writes mark it stale and it is regenerated
+    in the background (api/services/patient_summary_cache.py).
+    """
+    __tablename__ = "patient_ai_summaries"
+
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String, primary_key=True)
+    # SHA-256 over the (note id, note hash) pairs the summary covers; note_ids is their JSON id list
+    fingerprint = Column(String(64), nullable=False)
+    note_ids = Column(Text, nullable=False)
+    content = Column(Text, nullable=False)
+    stale = Column(Boolean, nullable=False, default=False)
+    # Bumped by every invalidation, so a regeneration that raced one stays stale
+    invalidations = Column(Integer, nullable=False, default=0)
+    generated_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
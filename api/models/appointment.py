@@ -6,6 +6,7 @@ from sqlalchemy import (
     Text,
     DateTime,
     ForeignKey,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -32,3 +33,8 @@ class Appointment(Base):
 
     patient = relationship("Patient", backref="appointments")
     creator = relationship("User")
+
+    __table_args__ = (
+        Index("ix_appointments_start_time", "start_time"),
+        Index("ix_appointments_patient_start", "patient_id", "start_time"),
+    )
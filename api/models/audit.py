@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from api.db.database import Base
@@ -30,3 +30,7 @@ class AuditLog(Base):
     
     # Relationships
     user = relationship("User")
+    
+    __table_args__ = (
+        Index("ix_audit_logs_user_created", "user_id", "created_at"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from api.db.database import Base
@@ -36,3 +36,27 @@ class Note(Base):
     risk_level = Column(String, nullable=True)  # Low, Medium, High
     recommendations = Column(Text, nullable=True)
     tags = Column(Text, nullable=True)  # JSON string of tags
+    
+    # Access paths used by list/history/report queries (added to existing databases by migration 0002)
+    __table_args__ = (
+        Index("ix_notes_patient_created", "patient_id", "created_at"),
+        Index("ix_notes_created_id", "created_at", "id"),
+        Index("ix_notes_type_created", "note_type", "created_at"),
+        Index("ix_notes_risk_created", "risk_level", "created_at"),
+        Index("ix_notes_status", "status"),
+    )
+
+class NoteFallbackSummary(Base):
+    """
+    Deterministic (non-LLM) summary for a note, keyed by a hash of the content it
+    was built from. Written when a note is created or edited and by the backfill
+    job, so list endpoints never have to rebuild it per request.
+    """
+    __tablename__ = "note_fallback_summaries"
+    
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True)
+    content_hash = Column(String(64), nullable=False)
+    summary = Column(Text, nullable=True)
+    risk_level = Column(String, nullable=True)
+    recommendations = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from api.db.database import Base
+
+class PatientRiskState(Base):
+    """
+    Materialized per-patient risk picture, maintained incrementally as notes are
+    created and summarized (api/services/risk_state_service.py). The risk report
+    is served from here and only re-assessed by the LLM once newer notes exist.
+    """
+    __tablename__ = "patient_risk_states"
+
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True)
+    note_count = Column(Integer, nullable=False, default=0)
+    # Newest note folded into the counts
+    last_note_id = Column(Integer, nullable=True)
+    last_note_at = Column(DateTime(timezone=True), nullable=True)
+    # Risk level of the newest note that has one (LOW, MEDIUM, HIGH, CRITICAL)
+    risk_level = Column(String, nullable=True)
+    risk_note_id = Column(Integer, nullable=True)
+    # JSON: {"<week start>": {"total": n, "HIGH": n, ...}} for the most recent weeks
+    weekly_counts = Column(Text, nullable=True)
+
+    # Last LLM assessment (JSON) and the newest note it covered
+    assessment = Column(Text, nullable=True)
+    assessed_note_id = Column(Integer, nullable=True)
+    assessed_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class HighRiskRosterEntry(Base):
+    """
+    One row per patient with a HIGH or CRITICAL note, describing the newest such
+    note; maintained with the risk state (api/services/high_risk_roster.py).
+    """
+    __tablename__ = "high_risk_roster"
+
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True)
+    risk_level = Column(String, nullable=False)  # HIGH or CRITICAL
+    last_note_id = Column(Integer, nullable=False)
+    last_note_date = Column(DateTime(timezone=True), nullable=True)
+    last_note_title = Column(String, nullable=True)
+    recommendations = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # The dashboard reads this index in order: CRITICAL before HIGH, newest note first
+    __table_args__ = (
+        Index("ix_high_risk_roster_level_date", "risk_level", last_note_date.desc()),
+    )
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from starlette.concurrency import iterate_in_threadpool
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+from datetime import datetime
 import asyncio
+import json
 import os
 
-from api.db.database import get_db
+from api.db.async_database import AsyncSession, get_async_db, run_session_sync
+from api.db.routing import get_async_read_db
 from api.models.user import User
 from api.models.patient import Patient
 from api.models.note import Note
@@ -12,34 +19,62 @@ from api.deps import get_current_active_user
 from api.agents.summarization_agent import SummarizationAgent
 from api.agents.risk_agent import RiskAssessmentAgent
 from api.services.cloud_tasks_service import create_ai_summarization_task, create_risk_assessment_task
-from api.services.ai_service import MedicalAIService
+from api.services.registry import get_ai_service
+from api.services.streaming import JSONSectionParser
+from api.services.structured_output import structured_output_metrics
+from api.services.llm_cache import get_llm_cache
+from api.services.batch_summarization import BatchSummarizationEngine
+from api.services.patient_summary_cache import (
+    JOURNEY_KIND,
+    SUMMARY_KIND,
+    CachedSummary,
+    aread_patient_summary,
+    regenerate_patient_summary,
+)
+from api.services.timeline_service import (
+    TIMELINE_PAGE_SIZE,
+    TimelinePage,
+    journey_context,
+    load_timeline_page,
+    parse_fields,
+    recent_note_digests,
+    timeline_statistics,
+)
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
-# Initialize agents
-summarization_agent = SummarizationAgent()
-risk_agent = RiskAssessmentAgent()
-ai_service = MedicalAIService()
+# Agents are built on first use, not at import, so cold starts (and /health) don't
+# pay for LangChain/OpenAI client setup; they share the registry's AI service
+
+
+@lru_cache(maxsize=None)
+def get_summarization_agent() -> SummarizationAgent:
+    return SummarizationAgent()
+
+
+@lru_cache(maxsize=None)
+def get_risk_agent() -> RiskAssessmentAgent:
+    return RiskAssessmentAgent()
 
 @router.post("/summarize/{note_id}")
 async def summarize_note(
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
         # Get note
-        note = db.query(Note).filter(Note.id == note_id).first()
+        note = await db.get(Note, note_id)
         if not note:
             raise HTTPException(status_code=404, detail="Note not found")
         
         # If Cloud Tasks are disabled, run synchronously for the demo
         if os.getenv("SKIP_CLOUD_TASKS") == "true":
-            patient = db.query(Patient).filter(Patient.id == note.patient_id).first()
+            patient = await db.get(Patient, note.patient_id)
             if not patient:
                 raise HTTPException(status_code=404, detail="Patient not found")
             
-            result = summarization_agent.process_note(note, patient, db)
+            result = await get_summarization_agent().aprocess_note(note, patient, db)
             return {
                 "message": "Note summarized synchronously (Cloud Tasks skipped)",
                 "note_id": note_id,
@@ -63,22 +98,22 @@ async def summarize_note(
 @router.post("/summarize/{note_id}/sync")
 async def summarize_note_sync(
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Generate AI summary for a specific note (synchronous)"""
     try:
         # Get note and patient
-        note = db.query(Note).filter(Note.id == note_id).first()
+        note = await db.get(Note, note_id)
         if not note:
             raise HTTPException(status_code=404, detail="Note not found")
         
-        patient = db.query(Patient).filter(Patient.id == note.patient_id).first()
+        patient = await db.get(Patient, note.patient_id)
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
         
-        # Process note with AI
-        result = summarization_agent.process_note(note, patient, db)
+        # Process note with AI (summary, risk and nursing calls run concurrently)
+        result = await get_summarization_agent().aprocess_note(note, patient, db)
         
         if result["success"]:
             return {
@@ -86,7 +121,9 @@ async def summarize_note_sync(
                 "summary": result["summary"],
                 "risk_level": result["risk_level"],
                 "recommendations": result["recommendations"],
-                "tags": result["tags"]
+                "tags": result["tags"],
+                "partial": result["partial"],
+                "failed_calls": result["failed_calls"]
             }
         else:
             raise HTTPException(status_code=500, detail=f"AI processing failed: {result['error']}")
@@ -97,12 +134,12 @@ async def summarize_note_sync(
 @router.get("/risk-report/{patient_id}")
 async def get_patient_risk_report(
     patient_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get comprehensive risk report for a patient"""
     try:
-        risk_report = risk_agent.generate_patient_risk_report(patient_id, db)
+        risk_report = await get_risk_agent().agenerate_patient_risk_report(patient_id, db)
         
         if "error" in risk_report:
             raise HTTPException(status_code=404, detail=risk_report["error"])
@@ -115,12 +152,12 @@ async def get_patient_risk_report(
 @router.get("/high-risk-patients")
 async def get_high_risk_patients(
     limit: int = 10,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get list of high-risk patients"""
     try:
-        high_risk_patients = risk_agent.get_high_risk_patients(db, limit)
+        high_risk_patients = await run_session_sync(db, get_risk_agent().get_high_risk_patients, limit)
         return {
             "high_risk_patients": high_risk_patients,
             "count": len(high_risk_patients)
@@ -132,28 +169,29 @@ async def get_high_risk_patients(
 @router.post("/batch-summarize")
 async def batch_summarize_notes(
     request_data: Dict[str, List[int]],
-    db: Session = Depends(get_db),
+    request: Request,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Batch process multiple notes for AI summarization"""
+    """
+    Batch process multiple notes for AI summarization.
+
+    Notes are summarized concurrently (bounded and rate limited). Pass `stream=true`
+    or send `Accept: application/x-ndjson` to receive one JSON line per note as it
+    completes; `Accept: text/event-stream` streams the same results as SSE.
+    """
     try:
         note_ids = request_data.get("note_ids", [])
-        results = []
+        engine = BatchSummarizationEngine(agent=get_summarization_agent())
         
-        for note_id in note_ids:
-            note = db.query(Note).filter(Note.id == note_id).first()
-            if note:
-                patient = db.query(Patient).filter(Patient.id == note.patient_id).first()
-                if patient:
-                    result = summarization_agent.process_note(note, patient, db)
-                    results.append({
-                        "note_id": note_id,
-                        "success": result["success"],
-                        "summary": result.get("summary"),
-                        "risk_level": result.get("risk_level"),
-                        "error": result.get("error")
-                    })
+        accept = request.headers.get("accept", "")
+        if "text/event-stream" in accept:
+            return StreamingResponse(_batch_events(engine, db, note_ids, sse=True), media_type="text/event-stream")
+        if stream or "application/x-ndjson" in accept:
+            return StreamingResponse(_batch_events(engine, db, note_ids, sse=False), media_type="application/x-ndjson")
         
+        results = await engine.run(db, note_ids)
         return {
             "message": f"Processed {len(results)} notes",
             "results": results
@@ -162,16 +200,34 @@ async def batch_summarize_notes(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in batch processing: {str(e)}")
 
+async def _batch_events(engine: BatchSummarizationEngine, db: AsyncSession, note_ids: List[int], sse: bool):
+    processed = 0
+    try:
+        async for result in engine.stream(db, note_ids):
+            processed += 1
+            yield _format_event(result, sse)
+        yield _format_event({"event": "done", "processed": processed}, sse)
+    except Exception as e:
+        yield _format_event({"event": "error", "processed": processed, "error": str(e)}, sse)
+
+def _format_event(payload: Dict[str, Any], sse: bool) -> str:
+    line = json.dumps(payload, default=str)
+    return f"data: {line}\n\n" if sse else f"{line}\n"
+
 @router.get("/ai-status")
 async def get_ai_status():
     """Check AI service status and configuration"""
     try:
         # Test AI service availability
+        ai_service = get_ai_service()
         return {
             "status": "operational" if ai_service.enabled else "disabled",
             "openai_configured": bool(ai_service.enabled and hasattr(ai_service, 'openai_api_key') and ai_service.openai_api_key),
             "models_available": ai_service.enabled,
-            "vector_store_ready": ai_service.enabled and ai_service.vectorstore is not None
+            "vector_store_ready": ai_service.vector_index_ready(),
+            "llm_cache": get_llm_cache().stats(),
+            "structured_output": structured_output_metrics.stats(),
+            "embedding_cache": ai_service.chunk_embedder.stats() if getattr(ai_service, "chunk_embedder", None) else None
         }
     
     except Exception as e:
@@ -186,154 +242,182 @@ async def get_ai_status():
 @router.post("/patient-summary/{patient_id}")
 async def get_patient_summary(
     patient_id: int,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Generate a concise 3-4 line summary for a patient from recent notes.
+    Concise 3-4 line summary of a patient from recent notes. The stored summary
+    is returned right away; once notes changed it is regenerated in the background.
     """
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    patient = await db.get(Patient, patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    # Pull recent notes for context
-    recent_notes = (
-        db.query(Note)
-        .filter(Note.patient_id == patient_id)
+    summary = await _stored_summary(db, patient, SUMMARY_KIND, background_tasks)
+    return {
+        "patient_id": patient_id,
+        "summary": summary.content,
+        "generated_at": summary.generated_at,
+        "stale": summary.stale
+    }
+
+async def _stored_summary(db: AsyncSession, patient: Patient, kind: str, background_tasks: BackgroundTasks) -> CachedSummary:
+    """The patient's stored summary of `kind`, scheduling a regeneration if notes changed since."""
+    ai_service = get_ai_service()
+    summary = await aread_patient_summary(db, patient, kind, ai_service)
+    if summary.stale:
+        background_tasks.add_task(regenerate_patient_summary, patient.id, kind, ai_service)
+    return summary
+
+@router.get("/patient-summary/{patient_id}/stream")
+async def stream_patient_summary(
+    patient_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Server-sent events variant of the patient summary: `token` events carry text
+    as the model writes it, then a `done` event carries the full summary.
+    """
+    patient_name, note_texts = await _patient_summary_inputs(db, patient_id)
+    chunks = get_ai_service().stream_patient_summary(patient_name, note_texts)
+    return StreamingResponse(_summary_events(patient_id, chunks), media_type="text/event-stream")
+
+async def _patient_summary_inputs(db: AsyncSession, patient_id: int):
+    patient = await db.get(Patient, patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # Pull recent notes for context (content only)
+    recent_contents = (await db.execute(
+        select(Note.content)
+        .where(Note.patient_id == patient_id)
         .order_by(Note.created_at.desc())
         .limit(10)
-        .all()
-    )
-    note_texts = [n.content or "" for n in recent_notes if n.content]
-
-    summary_text = ai_service.generate_patient_summary(
-        patient_name=f"{patient.first_name} {patient.last_name}",
-        notes=note_texts
-    )
+    )).scalars().all()
+    return f"{patient.first_name} {patient.last_name}", [content for content in recent_contents if content]
 
-    return {"patient_id": patient_id, "summary": summary_text}
+async def _summary_events(patient_id: int, chunks):
+    parts = []
+    try:
+        # The model client blocks between chunks, so the iterator is driven from the threadpool
+        async for chunk in iterate_in_threadpool(chunks):
+            parts.append(chunk)
+            yield _format_event({"event": "token", "text": chunk}, sse=True)
+        yield _format_event({"event": "done", "patient_id": patient_id, "summary": "".join(parts).strip()}, sse=True)
+    except Exception as e:
+        yield _format_event({"event": "error", "error": str(e)}, sse=True)
 
 @router.get("/patient-timeline/{patient_id}")
 async def get_patient_timeline_with_ai(
     patient_id: int,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    limit: int = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    primary_db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get comprehensive patient visit history with AI-generated timeline summary"""
-    try:
-        from api.services.ai_service import MedicalAIService
-        
-        # Fetch patient
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-        
-        # Fetch all notes ordered by date
-        notes = db.query(Note).filter(
-            Note.patient_id == patient_id
-        ).order_by(Note.created_at.desc()).all()
-        
-        # Fetch all appointments
-        appointments = db.query(Appointment).filter(
-            Appointment.patient_id == patient_id
-        ).order_by(Appointment.start_time.desc()).all()
-        
-        # Build timeline data
-        timeline_items = []
-        for note in notes:
-            timeline_items.append({
-                "type": "note",
-                "id": note.id,
-                "date": note.created_at.isoformat(),
-                "title": note.title,
-                "content": note.content,
-                "summary": note.summary,
-                "risk_level": note.risk_level,
-                "author": note.author_name
-            })
-        
-        for apt in appointments:
-            timeline_items.append({
-                "type": "appointment",
-                "id": apt.id,
-                "date": apt.start_time.isoformat(),
-                "title": apt.title,
-                "reason": apt.reason,
-                "status": apt.status
-            })
-        
-        # Sort by date
-        timeline_items.sort(key=lambda x: x["date"], reverse=True)
-        
-        # Generate AI summary of patient journey
-        ai_service = MedicalAIService()
-        if ai_service.enabled:
-            # Build context for AI
-            patient_info = f"""
-Patient: {patient.first_name} {patient.last_name}
-DOB: {patient.date_of_birth}
-MRN: {patient.medical_record_number}
-Allergies: {patient.allergies or 'None'}
-Medical History: {patient.medical_history or 'None'}
-
-Total Visits: {len(notes)}
-Total Appointments: {len(appointments)}
-            """
-            
-            # Summarize recent notes
-            recent_notes_summary = "\n\n".join([
-                f"{note.created_at.strftime('%Y-%m-%d')}: {note.title}\n{note.content[:300]}..."
-                for note in notes[:10]  # Last 10 notes
-            ])
-            
-            prompt = f"""As a medical AI assistant, analyze this patient's complete medical timeline and provide:
-
-1. **Patient Journey Summary**: A comprehensive overview of the patient's medical journey
-2. **Key Medical Events**: Significant diagnoses, treatments, or changes in condition
-3. **Risk Trends**: How the patient's risk level has changed over time
-4. **Current Status**: Patient's current health status based on recent visits
-5. **Recommendations**: Suggested follow-ups or areas requiring attention
-
-{patient_info}
+    """
+    Get comprehensive patient visit history with AI-generated timeline summary.
 
-Recent Visit Summaries:
-{recent_notes_summary}
+    The timeline is paged newest-first: pass the returned `next_cursor` as
+    `cursor` for the next page, narrow it with `since`/`until`, and list the
+    item fields you need in `fields` (e.g. `fields=title,summary,risk_level`
+    leaves out full note content).
 
-Provide a structured, professional medical summary."""
-            
-            try:
-                ai_summary = ai_service._call_openai(prompt, max_tokens=800)
-            except Exception as e:
-                ai_summary = f"AI summary unavailable: {str(e)}"
-        else:
-            ai_summary = "AI service not configured"
+    `ai_summary` is the patient's stored journey summary; after their notes
+    change it is served as is (`ai_summary_stale`) while a new one is generated
+    in the background.
+    """
+    try:
+        patient, page, statistics = await run_session_sync(
+            db, _load_timeline, patient_id, limit, cursor, since, until, fields
+        )
         
-        # Calculate statistics
-        risk_distribution = {}
-        for note in notes:
-            if note.risk_level:
-                risk_distribution[note.risk_level] = risk_distribution.get(note.risk_level, 0) + 1
+        # The stored summary is read and written on the primary: a lagging replica would
+        # miss fresh entries (regenerating them inline) and report outdated staleness
+        summary_patient = await primary_db.get(Patient, patient_id)
+        summary = await _stored_summary(primary_db, summary_patient, JOURNEY_KIND, background_tasks)
         
         return {
-            "patient": {
-                "id": patient.id,
-                "name": f"{patient.first_name} {patient.last_name}",
-                "mrn": patient.medical_record_number,
-                "dob": patient.date_of_birth.isoformat() if patient.date_of_birth else None,
-                "allergies": patient.allergies,
-                "medical_history": patient.medical_history
-            },
-            "timeline": timeline_items,
-            "ai_summary": ai_summary,
-            "statistics": {
-                "total_visits": len(notes),
-                "total_appointments": len(appointments),
-                "risk_distribution": risk_distribution,
-                "last_visit": notes[0].created_at.isoformat() if notes else None
-            }
+            **_timeline_payload(patient, page, statistics),
+            "ai_summary": summary.content,
+            "ai_summary_generated_at": summary.generated_at,
+            "ai_summary_stale": summary.stale
         }
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating patient timeline: {str(e)}")
+
+@router.get("/patient-timeline/{patient_id}/stream")
+async def stream_patient_timeline(
+    patient_id: int,
+    limit: int = TIMELINE_PAGE_SIZE,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Server-sent events variant of the patient timeline. The first timeline page
+    is sent first (`timeline` event); the AI journey summary follows as `token`
+    events, plus a `section` event as each of its JSON sections (chief
+    complaint first) completes, and a final `done` event with all sections.
+    """
+    patient, page, statistics = await run_session_sync(
+        db, _load_timeline, patient_id, limit, None, since, until, fields
+    )
+    payload = _timeline_payload(patient, page, statistics)
+    recent_notes = await run_session_sync(db, recent_note_digests, patient_id)
+    patient_info, recent_notes_summary = journey_context(patient, statistics, recent_notes)
+    chunks = get_ai_service().stream_patient_journey_summary(patient_info, recent_notes_summary)
+    return StreamingResponse(_timeline_events(payload, chunks), media_type="text/event-stream")
+
+async def _timeline_events(payload: Dict[str, Any], chunks):
+    yield _format_event({"event": "timeline", **payload}, sse=True)
+    parser = JSONSectionParser()
+    try:
+        async for chunk in iterate_in_threadpool(chunks):
+            yield _format_event({"event": "token", "text": chunk}, sse=True)
+            for name, value in parser.feed(chunk):
+                yield _format_event({"event": "section", "name": name, "value": value}, sse=True)
+        yield _format_event({"event": "done", "ai_summary": parser.sections}, sse=True)
+    except Exception as e:
+        yield _format_event({"event": "error", "error": str(e)}, sse=True)
+
+def _load_timeline(db: Session, patient_id: int, limit: int = TIMELINE_PAGE_SIZE, cursor: Optional[str] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None, fields: Optional[str] = None):
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    try:
+        page = load_timeline_page(
+            db, patient_id, limit=limit, cursor=cursor, since=since, until=until, fields=parse_fields(fields)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return patient, page, timeline_statistics(db, patient_id)
+
+def _timeline_payload(patient: Patient, page: TimelinePage, statistics: Dict[str, Any]):
+    return {
+        "patient": {
+            "id": patient.id,
+            "name": f"{patient.first_name} {patient.last_name}",
+            "mrn": patient.medical_record_number,
+            "dob": patient.date_of_birth.isoformat() if patient.date_of_birth else None,
+            "allergies": patient.allergies,
+            "medical_history": patient.medical_history
+        },
+        "timeline": page.items,
+        "next_cursor": page.next_cursor,
+        "statistics": statistics
+    }
@@ -2,12 +2,16 @@ from datetime import datetime, timedelta
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from api.db.database import get_db
+from api.db.async_database import AsyncSession, get_async_db
+from api.db.routing import get_async_read_db
 from api.deps import get_current_active_user
 from api.models.appointment import Appointment
 from api.models.user import User
+from api.services.patient_summary_cache import invalidate_patient_summaries
 from api.schemas.appointment import (
     AppointmentCreate,
     AppointmentResponse,
@@ -31,31 +35,36 @@ def create_appointment(
 
     db_appointment = Appointment(**appointment.dict(), created_by=current_user.id)
     db.add(db_appointment)
+    _invalidate_journeys(db, db_appointment.patient_id)
     db.commit()
     db.refresh(db_appointment)
     return db_appointment
 
 
 @router.get("/", response_model=List[AppointmentResponse])
-def list_appointments(
+async def list_appointments(
     start: Optional[datetime] = None,
     end: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
+    primary_db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    query = db.query(Appointment)
+    query = select(Appointment)
     if start:
-        query = query.filter(Appointment.start_time >= start)
+        query = query.where(Appointment.start_time >= start)
     if end:
-        query = query.filter(Appointment.start_time <= end)
+        query = query.where(Appointment.start_time <= end)
+    query = query.order_by(Appointment.start_time.asc())
 
-    appointments = query.order_by(Appointment.start_time.asc()).all()
+    appointments = (await db.execute(query)).scalars().all()
 
     if not appointments:
-        total = db.query(Appointment).count()
+        # Demo seeding writes, so it runs on the primary; a lagging replica can't show the rows yet
+        total = await primary_db.scalar(select(func.count()).select_from(Appointment))
         if total == 0:
-            _seed_sample_appointments(db, current_user, start)
-            appointments = query.order_by(Appointment.start_time.asc()).all()
+            await primary_db.run_sync(_seed_sample_appointments, current_user, start)
+            await primary_db.commit()
+            appointments = (await primary_db.execute(query)).scalars().all()
 
     return appointments
 
@@ -85,8 +94,10 @@ def update_appointment(
         )
 
     update_data = appointment_update.dict(exclude_unset=True)
+    previous_patient_id = appointment.patient_id
     for field, value in update_data.items():
         setattr(appointment, field, value)
+    _invalidate_journeys(db, previous_patient_id, appointment.patient_id)
 
     db.commit()
     db.refresh(appointment)
@@ -106,12 +117,19 @@ def delete_appointment(
     if appointment.created_by != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
 
+    _invalidate_journeys(db, appointment.patient_id)
     db.delete(appointment)
     db.commit()
 
 
+def _invalidate_journeys(db: Session, *patient_ids: Optional[int]) -> None:
+    """Appointment counts are part of the journey summary prompt (caller commits)."""
+    for patient_id in {patient_id for patient_id in patient_ids if patient_id is not None}:
+        invalidate_patient_summaries(db, patient_id)
+
+
 def _seed_sample_appointments(db: Session, user: User, start: Optional[datetime]) -> None:
-    """Bootstrap the calendar with a few sample appointments when the table is empty."""
+    """Bootstrap the calendar with a few sample appointments when the table is empty (caller commits)."""
     reference = start or datetime.now()
     base = reference.replace(day=1, hour=8, minute=0, second=0, microsecond=0)
     samples = [
@@ -137,5 +155,3 @@ def _seed_sample_appointments(db: Session, user: User, start: Optional[datetime]
                 created_by=user.id,
             )
         )
-
-    db.commit()
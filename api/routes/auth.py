@@ -1,18 +1,42 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from datetime import timedelta
 
 from api.db.database import get_db
 from api.schemas.user import UserCreate, UserLogin, UserResponse, Token
 from api.models.user import User
-from api.deps import authenticate_user, create_access_token, get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES
+from api.deps import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    authenticate_user_async,
+    create_access_token,
+    get_password_hash_async,
+    get_user_by_email,
+)
+from api.services.password_hashing import PasswordHashPoolSaturated
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+def _hashing_busy(exc: PasswordHashPoolSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Authentication service is busy, please retry shortly",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def _save_user(db: Session, db_user: User) -> User:
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+# The routes are async so they can await the hashing pool; their (blocking)
+# database calls still run on the threadpool, never on the event loop
+
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: Session = Depends(get_db)):
     # Check if user already exists
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await run_in_threadpool(get_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(
             status_code=400,
@@ -20,21 +44,24 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await get_password_hash_async(user.password)
+    except PasswordHashPoolSaturated as exc:
+        raise _hashing_busy(exc)
     db_user = User(
         email=user.email,
         hashed_password=hashed_password,
         full_name=user.full_name,
         role=user.role
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return await run_in_threadpool(_save_user, db, db_user)
 
 @router.post("/login", response_model=Token)
-def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, user_credentials.email, user_credentials.password)
+async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+    try:
+        user = await authenticate_user_async(db, user_credentials.email, user_credentials.password)
+    except PasswordHashPoolSaturated as exc:
+        raise _hashing_busy(exc)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,7 +69,5 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    access_token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,14 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session, aliased
+from typing import List, Optional
+from datetime import datetime
 
 from api.db.database import get_db
+from api.db.async_database import AsyncSession, get_async_db
+from api.db.routing import get_async_read_db
 from api.schemas.note import NoteCreate, NoteUpdate, NoteResponse, NoteSummary
-from api.models.note import Note
+from api.models.note import Note, NoteFallbackSummary
+from api.models.patient import Patient
 from api.models.user import User
 from api.deps import get_current_active_user
 from api.agents.summarization_agent import _normalize_risk_level
-from api.services.ai_service import MedicalAIService
+from api.services.fallback_summary_service import (
+    DEFAULT_RECOMMENDATIONS,
+    PLACEHOLDER_CONTENT,
+    build_fallback_fields,
+    refresh_fallback_summary,
+)
+from api.services.high_risk_roster import record_note_title
+from api.services.patient_summary_cache import invalidate_patient_summaries
+from api.services.risk_state_service import record_note_created
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
@@ -23,67 +36,126 @@ def create_note(
         author_id=current_user.id
     )
     db.add(db_note)
+    db.flush()
+    refresh_fallback_summary(db, db_note)
+    record_note_created(db, db_note)
+    invalidate_patient_summaries(db, db_note.patient_id)
     db.commit()
     db.refresh(db_note)
     return db_note
 
 @router.get("/", response_model=List[NoteSummary])
-def get_notes(
+async def get_notes(
     skip: int = 0,
     limit: int = 100,
     note_type: str = None,
     patient_id: int = None,
-    db: Session = Depends(get_db),
+    after_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    query = db.query(Note)
+    """
+    List notes newest-first.
+
+    Author and patient names are fetched in the same joined query, and only the
+    columns needed for `NoteSummary` are selected. Pass the `id`/`created_at` of
+    the last note on a page as `after_id`/`after_created_at` to fetch the next
+    page with a keyset seek instead of an OFFSET scan. A bare `after_id` seeks
+    from that note's own `created_at` (an unknown id gives an empty page);
+    `after_created_at` alone can't break ties and is rejected.
+    """
+    query = _note_summary_select().order_by(Note.created_at.desc(), Note.id.desc())
     
     if note_type:
-        query = query.filter(Note.note_type == note_type)
+        query = query.where(Note.note_type == note_type)
     if patient_id:
-        query = query.filter(Note.patient_id == patient_id)
+        query = query.where(Note.patient_id == patient_id)
     
-    notes = query.offset(skip).limit(limit).all()
+    if after_id is not None and after_created_at is None:
+        # The anchor's timestamp is read in the same statement, compared column to column
+        anchor = aliased(Note)
+        after_created_at = select(anchor.created_at).where(anchor.id == after_id).scalar_subquery()
+    elif after_created_at is not None and after_id is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="after_created_at requires after_id")
+    
+    if after_id is not None:
+        # Same key as the ORDER BY, so rows sharing a created_at are neither skipped nor repeated
+        query = query.where(or_(
+            Note.created_at < after_created_at,
+            and_(Note.created_at == after_created_at, Note.id < after_id)
+        ))
+    else:
+        query = query.offset(skip)
+    
+    rows = (await db.execute(query.limit(limit))).all()
     
     # Convert to NoteSummary format with safe fallbacks for demo/testing
     note_summaries = []
-    for note in notes:
+    for row in rows:
         # Provide placeholder content so the UI never shows "no content"
-        default_content = note.content or "Clinical note content pending. This placeholder ensures demos never render empty notes."
-        # Smarter fallback AI summary/recommendations when an AI run hasn't populated the record
-        mock_ai = MedicalAIService.build_structured_mock_summary(
-            default_content,
-            note_type=note.note_type.value if hasattr(note.note_type, "value") else "general"
-        )
-        default_summary = note.summary or mock_ai["summary"]
-        default_risk = _normalize_risk_level(note.risk_level) or mock_ai.get("risk_level", "medium")
-        default_recommendations = note.recommendations or mock_ai.get(
-            "recommendations",
-            "Monitor symptoms, document changes, and schedule follow-up if no improvement."
-        )
+        default_content = row.content or PLACEHOLDER_CONTENT
+        # Fallback AI summary/recommendations are precomputed on write; only notes
+        # that predate the backfill still need them built here
+        if row.fallback_summary is None:
+            fallback = build_fallback_fields(default_content, row.note_type)
+        else:
+            fallback = {
+                "summary": row.fallback_summary,
+                "risk_level": row.fallback_risk_level,
+                "recommendations": row.fallback_recommendations,
+            }
+        default_summary = row.summary or fallback["summary"]
+        default_risk = _normalize_risk_level(row.risk_level) or fallback["risk_level"] or "medium"
+        default_recommendations = row.recommendations or fallback["recommendations"] or DEFAULT_RECOMMENDATIONS
 
         note_summaries.append(NoteSummary(
-            id=note.id,
-            title=note.title,
-            note_type=note.note_type,
+            id=row.id,
+            title=row.title,
+            note_type=row.note_type,
             content=default_content,
             summary=default_summary,
             risk_level=default_risk,
             recommendations=default_recommendations,
-            created_at=note.created_at,
-            author_name=note.author.full_name,
-            patient_name=f"{note.patient.first_name} {note.patient.last_name}"
+            created_at=row.created_at,
+            author_name=row.author_name,
+            patient_name=f"{row.patient_first_name} {row.patient_last_name}"
         ))
     
     return note_summaries
 
+def _note_summary_select():
+    """Single joined query selecting only the columns `NoteSummary` needs, plus the stored fallback summary."""
+    return (
+        select(
+            Note.id,
+            Note.title,
+            Note.note_type,
+            Note.content,
+            Note.summary,
+            Note.risk_level,
+            Note.recommendations,
+            Note.created_at,
+            User.full_name.label("author_name"),
+            Patient.first_name.label("patient_first_name"),
+            Patient.last_name.label("patient_last_name"),
+            NoteFallbackSummary.summary.label("fallback_summary"),
+            NoteFallbackSummary.risk_level.label("fallback_risk_level"),
+            NoteFallbackSummary.recommendations.label("fallback_recommendations"),
+        )
+        .join(User, User.id == Note.author_id)
+        .join(Patient, Patient.id == Note.patient_id)
+        .outerjoin(NoteFallbackSummary, NoteFallbackSummary.note_id == Note.id)
+    )
+
 @router.get("/{note_id}", response_model=NoteResponse)
-def get_note(
+async def get_note(
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    note = db.query(Note).filter(Note.id == note_id).first()
+    note = await db.get(Note, note_id)
     if not note:
         raise HTTPException(
             status_code=404,
@@ -116,6 +188,12 @@ def update_note(
     for field, value in update_data.items():
         setattr(note, field, value)
     
+    if "content" in update_data:
+        refresh_fallback_summary(db, note)
+    if "title" in update_data:
+        record_note_title(db, note)
+    invalidate_patient_summaries(db, note.patient_id)
+    
     db.commit()
     db.refresh(note)
     return note
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List
 
 from api.db.database import get_db
+from api.db.async_database import AsyncSession, get_async_db
+from api.db.routing import get_async_read_db
 from api.schemas.patient import PatientCreate, PatientUpdate, PatientResponse
 from api.models.patient import Patient
 from api.models.user import User
 from api.deps import get_current_active_user
+from api.services.patient_summary_cache import invalidate_patient_summaries
 
 router = APIRouter(prefix="/patients", tags=["patients"])
 
@@ -33,22 +37,22 @@ def create_patient(
     return db_patient
 
 @router.get("/", response_model=List[PatientResponse])
-def get_patients(
+async def get_patients(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    patients = db.query(Patient).offset(skip).limit(limit).all()
-    return patients
+    result = await db.execute(select(Patient).order_by(Patient.id).offset(skip).limit(limit))
+    return result.scalars().all()
 
 @router.get("/{patient_id}", response_model=PatientResponse)
-def get_patient(
+async def get_patient(
     patient_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    patient = await db.get(Patient, patient_id)
     if not patient:
         raise HTTPException(
             status_code=404,
@@ -73,6 +77,7 @@ def update_patient(
     update_data = patient_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(patient, field, value)
+    invalidate_patient_summaries(db, patient.id)
     
     db.commit()
     db.refresh(patient)
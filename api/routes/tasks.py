@@ -41,7 +41,7 @@ async def process_summarization_task(
         
         # Perform AI summarization using agent
         agent = SummarizationAgent()
-        result = agent.process_note(note, patient, db)
+        result = await agent.aprocess_note(note, patient, db)
         
         # Results are already saved in process_note, just commit
         db.commit()
@@ -50,7 +50,9 @@ async def process_summarization_task(
             "status": "success",
             "note_id": note.id,
             "summary": note.summary,
-            "risk_level": note.risk_level
+            "risk_level": note.risk_level,
+            "partial": result.get("partial", False),
+            "failed_calls": result.get("failed_calls", [])
         }
     except Exception as e:
         db.rollback()
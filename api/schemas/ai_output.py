@@ -0,0 +1,84 @@
+from pydantic import BaseModel, ConfigDict, field_validator
+from typing import Any, List, Optional, Union
+
+# Free-text fields the model sometimes answers with a list of points
+Text = Optional[Union[str, List[Any]]]
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class LLMOutput(BaseModel):
+    # Keys the prompt didn't ask for are kept, so callers see the full response
+    model_config = ConfigDict(extra="allow")
+
+
+class NoteSummaryOutput(LLMOutput):
+    summary: Text = None
+    key_findings: Text = None
+    chief_complaint: Text = None
+    assessment: Text = None
+    vital_signs: Text = None
+    medications: Text = None
+    treatment_plan: Text = None
+    follow_up: Text = None
+    risk_factors: Text = None
+    urgent_flags: Text = None
+
+
+class RiskAssessmentOutput(LLMOutput):
+    risk_level: str
+    confidence_score: Optional[float] = None
+    summary: Text = None
+    risk_factors: List[Any] = []
+    clinical_concerns: List[Any] = []
+    recommendations: List[Any] = []
+    monitoring_plan: Text = None
+    escalation_criteria: Text = None
+    requires_urgent_attention: Optional[bool] = None
+    estimated_severity: Optional[str] = None
+
+    @field_validator("risk_level")
+    @classmethod
+    def normalize_risk_level(cls, value: str) -> str:
+        level = value.strip().upper()
+        if level not in ("LOW", "MEDIUM", "HIGH", "CRITICAL"):
+            raise ValueError(f"unknown risk level {value!r}")
+        return level
+
+    @field_validator("risk_factors", "clinical_concerns", "recommendations", mode="before")
+    @classmethod
+    def coerce_list(cls, value):
+        return _as_list(value)
+
+
+class TreatmentPlanOutput(LLMOutput):
+    primary_treatment: Text = None
+    medications: List[Any] = []
+    non_pharmacological: List[Any] = []
+    monitoring_requirements: Text = None
+    patient_education: List[Any] = []
+    red_flags: List[Any] = []
+    follow_up_timeline: Text = None
+
+    @field_validator("medications", "non_pharmacological", "patient_education", "red_flags", mode="before")
+    @classmethod
+    def coerce_list(cls, value):
+        return _as_list(value)
+
+
+class MedicalEntitiesOutput(LLMOutput):
+    conditions: List[Any] = []
+    symptoms: List[Any] = []
+    medications: List[Any] = []
+    procedures: List[Any] = []
+    vital_signs: List[Any] = []
+    lab_results: List[Any] = []
+
+    @field_validator("conditions", "symptoms", "medications", "procedures", "vital_signs", "lab_results", mode="before")
+    @classmethod
+    def coerce_list(cls, value):
+        return _as_list(value)
@@ -2,23 +2,69 @@
 Enhanced AI Service for medical note processing using LangChain and OpenAI
 REAL AI implementation with GPT-4 and embeddings
 """
+import importlib.util
 import os
-from typing import Dict, List, Optional, Tuple
+import threading
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
 import json
-import re
 from datetime import datetime
 
-try:
-    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-    from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
-    from langchain_core.messages import HumanMessage, SystemMessage
-    from langchain_community.vectorstores import FAISS
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-    from langchain_core.output_parsers import JsonOutputParser
-    AI_AVAILABLE = True
-except ImportError as e:
-    AI_AVAILABLE = False
-    print(f"⚠️ LangChain not available: {e}")
+from api.schemas.ai_output import (
+    MedicalEntitiesOutput,
+    NoteSummaryOutput,
+    RiskAssessmentOutput,
+    TreatmentPlanOutput,
+)
+from api.services.clinical_rules import default_rule_engine
+from api.services.llm_cache import get_llm_cache
+from api.services.structured_output import parse_structured, structured_output_metrics
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+    from api.services.vector_index import NoteVectorIndex
+
+# Re-asks allowed when a structured answer can't be parsed or repaired locally
+STRUCTURED_OUTPUT_MAX_RETRIES = int(os.getenv("STRUCTURED_OUTPUT_MAX_RETRIES", "1"))
+
+# Client-side limit per chat request. It defaults to the agents' per-call deadline
+# (AI_CALL_TIMEOUT_SECONDS), so a call the agent gave up on also stops on the wire
+# instead of holding a worker thread and a pooled connection until OpenAI answers.
+LLM_REQUEST_TIMEOUT_SECONDS = float(
+    os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", os.getenv("AI_CALL_TIMEOUT_SECONDS", "45"))
+)
+# Client retries each get the full timeout again; the agents fall back to rule-based output instead
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "0"))
+
+# Bump a template's version whenever its prompt text or output schema changes,
+# so cached responses produced by the old prompt are no longer served.
+PROMPT_TEMPLATE_VERSIONS = {
+    "note_summary": "2",
+    "patient_summary": "1",
+    "risk_assessment": "2",
+    "treatment_plan": "2",
+    "entity_extraction": "2",
+    "patient_journey": "2",
+}
+
+# Sections of the structured patient journey summary, in the order the model writes
+# them; the chief complaint comes first so streaming clients can show it right away
+PATIENT_JOURNEY_SECTIONS = {
+    "chief_complaint": "Current presenting concern from the most recent visits",
+    "current_status": "Patient's current health status based on recent visits",
+    "journey_summary": "Overview of the patient's medical journey",
+    "key_events": ["Significant diagnoses, treatments, or changes in condition, with dates"],
+    "risk_trends": "How the patient's risk level has changed over time",
+    "recommendations": ["Suggested follow-ups or areas requiring attention"],
+}
+
+# LangChain/OpenAI (and numpy/FAISS for RAG) are only imported once a service is
+# constructed or the index is opened, so importing this module stays cheap on cold start
+AI_AVAILABLE = all(
+    importlib.util.find_spec(module) is not None
+    for module in ("langchain_openai", "langchain_core", "langchain_text_splitters")
+)
+if not AI_AVAILABLE:
+    print("⚠️ LangChain not available: install langchain-openai and langchain-text-splitters")
 
 class MedicalAIService:
     """
@@ -31,7 +77,12 @@ class MedicalAIService:
     - Treatment recommendations
     """
     
-    def __init__(self):
+    def __init__(self, http_client=None, http_async_client=None):
+        """
+        `http_client` / `http_async_client` are httpx clients shared by the chat and
+        embedding models (see api/services/registry.py); each model opens its own
+        pool when they are omitted.
+        """
         if not AI_AVAILABLE:
             self.enabled = False
             print("⚠️ AI Service disabled - missing dependencies")
@@ -45,23 +96,53 @@ class MedicalAIService:
         
         self.enabled = True
         
+        from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        
+        # Responses are cached process-wide, keyed by prompt content
+        self.llm_cache = get_llm_cache()
+        
+        # All OpenAI clients share one connection pool when one is provided
+        http_clients = {"http_client": http_client, "http_async_client": http_async_client}
+        # Chat requests are bounded on the client so timed-out calls don't keep running
+        request_limits = {"timeout": LLM_REQUEST_TIMEOUT_SECONDS, "max_retries": LLM_MAX_RETRIES}
+        
         # Initialize LLM models
         self.llm = ChatOpenAI(
             model="gpt-4o-mini",  # Using GPT-4o-mini for cost efficiency
             temperature=0.1,  # Low temperature for medical accuracy
-            openai_api_key=self.openai_api_key
+            openai_api_key=self.openai_api_key,
+            **http_clients,
+            **request_limits
+        )
+        
+        # JSON mode for prompts that expect a structured answer; every creative_llm
+        # caller (treatment plans) parses a typed JSON object, so it uses it too
+        json_mode = {"model_kwargs": {"response_format": {"type": "json_object"}}}
+        
+        self.json_llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0.1,
+            openai_api_key=self.openai_api_key,
+            **http_clients,
+            **request_limits,
+            **json_mode
         )
         
         self.creative_llm = ChatOpenAI(
             model="gpt-4o-mini",
             temperature=0.7,  # Higher temperature for recommendations
-            openai_api_key=self.openai_api_key
+            openai_api_key=self.openai_api_key,
+            **http_clients,
+            **request_limits,
+            **json_mode
         )
         
         # Initialize embeddings for RAG
         self.embeddings = OpenAIEmbeddings(
             openai_api_key=self.openai_api_key,
-            model="text-embedding-3-small"
+            model="text-embedding-3-small",
+            **http_clients
         )
         
         # Text splitter for document chunking
@@ -71,15 +152,100 @@ class MedicalAIService:
             length_function=len,
         )
         
-        # Vector store for historical notes (RAG)
-        self.vectorstore = None
+        # Persistent vector index for historical notes (RAG), opened on first use
+        self._vector_index = None
+        self._vector_index_lock = threading.Lock()
+        self.chunk_embedder = None
         
         print("✅ Enhanced AI Service initialized successfully!")
     
+    def _llm_cache_key(self, llm, messages: List, template: str) -> str:
+        return self.llm_cache.make_key(
+            getattr(llm, "model_name", None),
+            getattr(llm, "temperature", None),
+            f"{template}:{PROMPT_TEMPLATE_VERSIONS[template]}",
+            messages,
+            response_format=(getattr(llm, "model_kwargs", None) or {}).get("response_format"),
+        )
+    
+    def _invoke_llm(self, llm, messages: List, template: str) -> str:
+        """
+        Call the chat model through the shared response cache.
+        Keyed on model, temperature, response format, prompt template version and the normalized messages.
+        """
+        key = self._llm_cache_key(llm, messages, template)
+        cached = self.llm_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        content = llm.invoke(messages).content
+        self.llm_cache.set(key, content)
+        return content
+    
+    def _invoke_structured(self, llm, messages: List, template: str,
+                           output_model: "type[BaseModel]") -> Tuple[Optional["BaseModel"], str]:
+        """
+        Call the model for a JSON answer and validate it as `output_model`.
+        Malformed answers are repaired locally first; only if that fails is the
+        model asked to re-emit its own answer as valid JSON (a far shorter prompt
+        than the original). Returns the typed result (None on failure) and the raw text.
+        """
+        content = self._invoke_llm(llm, messages, template)
+        parsed = parse_structured(content, output_model)
+        if parsed.value is not None:
+            structured_output_metrics.record(template, "repaired" if parsed.repaired else "parsed")
+            return parsed.value, content
+        
+        for _ in range(STRUCTURED_OUTPUT_MAX_RETRIES):
+            structured_output_metrics.record(template, "retried")
+            fixed = self.json_llm.invoke(self._json_fix_messages(content, output_model, parsed.error)).content
+            parsed = parse_structured(fixed, output_model)
+            if parsed.value is not None:
+                structured_output_metrics.record(template, "recovered_by_retry")
+                # Replace the cached malformed answer so later hits don't pay for the fix again
+                self.llm_cache.set(self._llm_cache_key(llm, messages, template), fixed)
+                return parsed.value, fixed
+        
+        structured_output_metrics.record(template, "failed")
+        print(f"⚠️ Unparseable {template} response: {parsed.error}")
+        return None, content
+    
+    @staticmethod
+    def _json_fix_messages(content: str, output_model: "type[BaseModel]", error: Optional[str]) -> List:
+        from langchain_core.messages import HumanMessage, SystemMessage
+        
+        return [
+            SystemMessage(content="You fix malformed JSON. Reply with the corrected JSON object only."),
+            HumanMessage(content=(
+                f"This answer should be a JSON object with the fields {', '.join(output_model.model_fields)} "
+                f"but could not be used ({error}). Return it as valid JSON without changing its meaning:\n\n{content}"
+            ))
+        ]
+    
+    def _stream_llm(self, llm, messages: List, template: str) -> Iterator[str]:
+        """
+        Streaming form of `_invoke_llm`: yields content chunks as the model produces
+        them. A cached response is replayed as one chunk; a completed stream is cached.
+        """
+        key = self._llm_cache_key(llm, messages, template)
+        cached = self.llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        self.llm_cache.set(key, "".join(parts))
+    
     def summarize_medical_note(self, note_content: str, note_type: str = "general", 
-                               patient_history: Optional[List[str]] = None) -> Dict:
+                               patient_history: Optional[List[str]] = None,
+                               patient_id: Optional[int] = None, note_id: Optional[int] = None) -> Dict:
         """
-        Generate comprehensive medical note summary using GPT-4
+        Generate comprehensive medical note summary using GPT-4.
+        Historical context is retrieved from `patient_id`'s own notes only.
         """
         if not self.enabled:
             return self._get_mock_summary(note_content, note_type)
@@ -87,9 +253,14 @@ class MedicalAIService:
         try:
             # Build context from patient history if available
             history_context = ""
-            if patient_history and self.vectorstore:
-                # Use RAG to find relevant historical information
-                relevant_docs = self.vectorstore.similarity_search(note_content, k=3)
+            if patient_id is not None and self.vector_index_ready():
+                # Use RAG to find relevant information in this patient's earlier notes
+                relevant_docs = self.vector_index.similarity_search(
+                    note_content,
+                    k=3,
+                    patient_id=patient_id,
+                    exclude_note_keys=[note_id] if note_id is not None else ()
+                )
                 history_context = "\n".join([doc.page_content for doc in relevant_docs])
             
             # Create specialized prompt based on note type
@@ -130,76 +301,150 @@ Guidelines:
             )
             
             # Call GPT-4
+            from langchain_core.messages import HumanMessage, SystemMessage
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
             
-            response = self.llm.invoke(messages)
-            
-            # Parse JSON response
-            try:
-                # Extract JSON from response
-                content = response.content
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group())
-                    result["ai_generated"] = True
-                    result["model"] = "gpt-4o-mini"
-                    result["timestamp"] = datetime.now().isoformat()
-                    return result
-                else:
-                    # Fallback if no JSON found
-                    return {
-                        "summary": content[:500],
-                        "ai_generated": True,
-                        "model": "gpt-4o-mini"
-                    }
-            except json.JSONDecodeError:
+            result, content = self._invoke_structured(self.json_llm, messages, "note_summary", NoteSummaryOutput)
+            if result is None:
                 return {
-                    "summary": response.content[:500],
+                    "summary": content[:500],
                     "ai_generated": True,
+                    "model": "gpt-4o-mini",
                     "parsing_error": True
                 }
+            
+            summary = result.model_dump()
+            summary["ai_generated"] = True
+            summary["model"] = "gpt-4o-mini"
+            summary["timestamp"] = datetime.now().isoformat()
+            return summary
                 
         except Exception as e:
             print(f"Error in AI summarization: {str(e)}")
             return self._get_mock_summary(note_content, note_type)
 
-    def generate_patient_summary(self, patient_name: str, notes: List[str]) -> str:
+    def generate_patient_summary(self, patient_name: str, notes: List[str], fallback: bool = True) -> str:
         """
         Generate a concise 3-4 line patient overview from recent notes.
+        With `fallback=False` a failed LLM call raises instead of returning the
+        excerpt-based overview (callers that store the result).
         """
         if not notes:
             return "No documented encounters yet. Please add clinical notes to enable AI summaries."
 
-        joined_notes = "\n\n".join(notes[:8])  # keep prompt compact
-
         if not self.enabled:
-            # Lightweight fallback summary
-            trimmed = joined_notes[:400].replace("\n", " ")
-            return f"Patient overview for {patient_name}: {trimmed}..."
+            return self.fallback_patient_summary(patient_name, notes)
 
         try:
-            system_prompt = (
-                "You are an expert clinical documentation assistant. "
-                "Write a brief, 3-4 line overview that captures the patient's current status, "
-                "key diagnoses/complaints, notable vitals/findings, and plan or follow-up. "
-                "Be concise, objective, and clinically relevant."
-            )
-            user_prompt = f"Patient: {patient_name}\nRecent notes:\n{joined_notes}"
-
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
-
-            response = self.llm.invoke(messages)
-            return response.content.strip()
+            return self._invoke_llm(self.llm, self._patient_summary_messages(patient_name, notes), "patient_summary").strip()
         except Exception as e:
+            if not fallback:
+                raise
             print(f"Error generating patient summary: {e}")
-            trimmed = joined_notes[:400].replace("\n", " ")
-            return f"Patient overview for {patient_name}: {trimmed}..."
+            return self.fallback_patient_summary(patient_name, notes)
+    
+    def stream_patient_summary(self, patient_name: str, notes: List[str]) -> Iterator[str]:
+        """Token-streaming form of `generate_patient_summary`."""
+        if not notes:
+            yield "No documented encounters yet. Please add clinical notes to enable AI summaries."
+            return
+        if not self.enabled:
+            yield self.fallback_patient_summary(patient_name, notes)
+            return
+        
+        yielded = False
+        try:
+            for chunk in self._stream_llm(self.llm, self._patient_summary_messages(patient_name, notes), "patient_summary"):
+                yielded = True
+                yield chunk
+        except Exception as e:
+            print(f"Error streaming patient summary: {e}")
+            if not yielded:
+                yield self.fallback_patient_summary(patient_name, notes)
+    
+    def _patient_summary_messages(self, patient_name: str, notes: List[str]) -> List:
+        from langchain_core.messages import HumanMessage, SystemMessage
+        
+        system_prompt = (
+            "You are an expert clinical documentation assistant. "
+            "Write a brief, 3-4 line overview that captures the patient's current status, "
+            "key diagnoses/complaints, notable vitals/findings, and plan or follow-up. "
+            "Be concise, objective, and clinically relevant."
+        )
+        joined_notes = "\n\n".join(notes[:8])  # keep prompt compact
+        user_prompt = f"Patient: {patient_name}\nRecent notes:\n{joined_notes}"
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+    
+    @staticmethod
+    def fallback_patient_summary(patient_name: str, notes: List[str]) -> str:
+        trimmed = "\n\n".join(notes[:8])[:400].replace("\n", " ")
+        return f"Patient overview for {patient_name}: {trimmed}..."
+    
+    def stream_patient_journey_summary(self, patient_info: str, recent_notes: str) -> Iterator[str]:
+        """
+        Stream a structured patient journey summary: a JSON object with the
+        `PATIENT_JOURNEY_SECTIONS` keys, written in that order (parse it
+        incrementally with api.services.streaming.JSONSectionParser).
+        """
+        if not self.enabled:
+            yield json.dumps({"journey_summary": "AI service not configured"})
+            return
+        
+        from langchain_core.messages import HumanMessage, SystemMessage
+        
+        system_prompt = (
+            "You are a medical AI assistant. Analyze the patient's complete medical timeline "
+            "and respond with a single JSON object only, no prose or code fences."
+        )
+        user_prompt = (
+            f"{patient_info}\n\n"
+            f"Recent Visit Summaries:\n{recent_notes}\n\n"
+            "Respond with JSON containing exactly these keys, in this order:\n"
+            f"{json.dumps(PATIENT_JOURNEY_SECTIONS, indent=4)}\n"
+        )
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+        yield from self._stream_llm(self.json_llm, messages, "patient_journey")
+    
+    def generate_patient_journey_summary(self, patient_info: str, recent_notes: str) -> str:
+        """
+        Non-streaming form of `stream_patient_journey_summary`, rendered as text
+        (one paragraph per section). LLM errors propagate to the caller.
+        """
+        from api.services.streaming import JSONSectionParser
+        
+        if not self.enabled:
+            return "AI service not configured"
+        
+        document = "".join(self.stream_patient_journey_summary(patient_info, recent_notes))
+        parser = JSONSectionParser()
+        parser.feed(document)
+        if not parser.sections:
+            return document.strip()
+        return self.render_journey_sections(parser.sections)
+    
+    @staticmethod
+    def render_journey_sections(sections: Dict) -> str:
+        paragraphs = []
+        for name, value in sections.items():
+            title = name.replace("_", " ").title()
+            if isinstance(value, list):
+                lines = [
+                    ": ".join(str(part) for part in item.values()) if isinstance(item, dict) else str(item)
+                    for item in value
+                ]
+                paragraphs.append(f"{title}:\n" + "\n".join(f"- {line}" for line in lines))
+            else:
+                paragraphs.append(f"{title}: {value}")
+        return "\n\n".join(paragraphs)
     
     def assess_patient_risk(self, note_content: str, patient_history: List[str] = None, 
                            vital_signs: Dict = None) -> Dict:
@@ -257,26 +502,20 @@ Base your assessment on:
                 f"{risk_json_template}\n"
             )
             
+            from langchain_core.messages import HumanMessage, SystemMessage
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            result, _ = self._invoke_structured(self.json_llm, messages, "risk_assessment", RiskAssessmentOutput)
+            if result is None:
+                return self._get_mock_risk_assessment(note_content)
             
-            # Parse response
-            try:
-                content = response.content
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group())
-                    result["ai_generated"] = True
-                    result["assessment_timestamp"] = datetime.now().isoformat()
-                    return result
-            except json.JSONDecodeError:
-                pass
-            
-            return self._get_mock_risk_assessment(note_content)
+            assessment = result.model_dump()
+            assessment["ai_generated"] = True
+            assessment["assessment_timestamp"] = datetime.now().isoformat()
+            return assessment
             
         except Exception as e:
             print(f"Error in risk assessment: {str(e)}")
@@ -327,22 +566,16 @@ Always consider patient safety, contraindications, and individual patient factor
                 f"{treatment_json_template}\n"
             )
             
+            from langchain_core.messages import HumanMessage, SystemMessage
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
             
-            response = self.creative_llm.invoke(messages)
-            
-            try:
-                content = response.content
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
-            
-            return self._get_mock_treatment_recommendations(diagnosis)
+            result, _ = self._invoke_structured(self.creative_llm, messages, "treatment_plan", TreatmentPlanOutput)
+            if result is None:
+                return self._get_mock_treatment_recommendations(diagnosis)
+            return result.model_dump()
             
         except Exception as e:
             print(f"Error generating recommendations: {str(e)}")
@@ -372,49 +605,82 @@ Always consider patient safety, contraindications, and individual patient factor
                 f"{entity_json_template}\n"
             )
             
-            response = self.llm.invoke([HumanMessage(content=prompt)])
-            
-            try:
-                json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
-            except:
-                pass
-            
-            return {"entities": [], "raw_response": response.content}
+            from langchain_core.messages import HumanMessage
+            result, content = self._invoke_structured(
+                self.json_llm, [HumanMessage(content=prompt)], "entity_extraction", MedicalEntitiesOutput
+            )
+            if result is None:
+                return {"entities": [], "raw_response": content}
+            return result.model_dump()
             
         except Exception as e:
             return {"error": str(e)}
     
-    def create_vectorstore_from_notes(self, notes: List[Dict]):
+    @property
+    def vector_index(self) -> Optional["NoteVectorIndex"]:
+        """Persistent note index, opened lazily so cold starts don't touch the disk."""
+        from api.services.vector_index import NUMPY_AVAILABLE, VECTOR_INDEX_DIR, NoteVectorIndex
+        
+        if self._vector_index is None and NUMPY_AVAILABLE:
+            # Concurrent first requests on the threadpool must not open two indexes
+            with self._vector_index_lock:
+                if self._vector_index is None:
+                    from api.services.embedding_store import EMBEDDING_CACHE_PATH, CachingEmbedder, EmbeddingStore
+                    
+                    # Chunk vectors are cached by content hash, so only new chunks reach the API
+                    self.chunk_embedder = CachingEmbedder(
+                        self.embeddings.embed_documents,
+                        model=self.embeddings.model,
+                        store=EmbeddingStore(EMBEDDING_CACHE_PATH),
+                    )
+                    self._vector_index = NoteVectorIndex(
+                        VECTOR_INDEX_DIR,
+                        embed_documents=self.chunk_embedder.embed_documents,
+                        embed_query=self.embeddings.embed_query,
+                        split_text=self.text_splitter.split_text,
+                    )
+        return self._vector_index
+
+    def vector_index_ready(self) -> bool:
+        if not self.enabled:
+            return False
+        try:
+            return self.vector_index is not None and self.vector_index.is_ready()
+        except Exception as e:
+            print(f"Error opening vector index: {str(e)}")
+            return False
+
+    def create_vectorstore_from_notes(self, notes: List[Dict]) -> Dict:
         """
-        Create FAISS vector store from historical notes for RAG
+        Bring the persistent vector index in line with `notes` (dicts with id,
+        patient_id, date, type, content). Only new or changed notes are embedded;
+        notes missing from the list are removed from the index.
         """
-        if not self.enabled:
-            return
+        if not self.enabled or self.vector_index is None:
+            return {"embedded": 0, "unchanged": 0, "deleted": 0}
         
         try:
-            texts = []
-            for note in notes:
-                text = f"Date: {note.get('date', 'N/A')}\n"
-                text += f"Type: {note.get('type', 'N/A')}\n"
-                text += f"Content: {note.get('content', '')}"
-                texts.append(text)
-            
-            if texts:
-                docs = self.text_splitter.create_documents(texts)
-                self.vectorstore = FAISS.from_documents(docs, self.embeddings)
-                print(f"✅ Created vector store with {len(docs)} documents")
+            stats = self.vector_index.sync_notes(notes)
+            print(f"✅ Vector index synced: {stats}")
+            return stats
         except Exception as e:
-            print(f"Error creating vector store: {str(e)}")
+            print(f"Error updating vector index: {str(e)}")
+            return {"error": str(e)}
+
+    def add_documents_to_vector_store(self, notes: List[Dict]) -> Dict:
+        """Embed new or changed notes without removing anything from the index."""
+        if not self.enabled or self.vector_index is None:
+            return {"embedded": 0, "unchanged": 0, "deleted": 0}
+        return self.vector_index.upsert_notes(notes)
 
     # --- Compatibility helpers used by agents/routes without needing a full LLM call ---
-    def summarize_note(self, note_content: str, note_type: str = "general", patient_context: str = "") -> Dict:
+    def summarize_note(self, note_content: str, note_type: str = "general", patient_context: str = "",
+                       patient_id: Optional[int] = None, note_id: Optional[int] = None) -> Dict:
         """
         Compatibility wrapper expected by SummarizationAgent.
         Uses real LLM when enabled; otherwise uses structured mock summarization.
         """
-        base_summary = self.summarize_medical_note(note_content, note_type)
+        base_summary = self.summarize_medical_note(note_content, note_type, patient_id=patient_id, note_id=note_id)
 
         # If the LLM did not generate recommendations, synthesize lightweight guidance
         if not base_summary.get("recommendations"):
@@ -447,85 +713,12 @@ Always consider patient safety, contraindications, and individual patient factor
         Deterministic, lightweight summarization used when AI is unavailable.
         Extracts common clinical sections and generates tailored recommendations.
         """
-        import re
-
-        text = content or ""
-        lowered = text.lower()
-
-        # Extract key-value sections like **Reason for Admission:** headache
-        section_matches = re.findall(r"\*\*(.+?)\*\*\s*:?\s*([^*]+)", text)
-        sections = {key.strip().lower(): value.strip() for key, value in section_matches}
-
-        def first_sentence_fallback(raw: str) -> str:
-            sentences = re.split(r"(?<=[.!?])\s+", raw.strip())
-            trimmed = " ".join(sentences[:2]).strip()
-            return trimmed or raw.strip()
-
-        summary_parts = []
-        label_map = {
-            "reason for admission": "Admission",
-            "chief complaint": "Chief complaint",
-            "history of present illness": "HPI",
-            "past medical history": "PMH",
-            "physical examination": "Exam",
-            "assessment": "Assessment",
-            "plan": "Plan"
-        }
-        for key, label in label_map.items():
-            if key in sections and sections[key]:
-                summary_parts.append(f"{label}: {sections[key]}")
-
-        if not summary_parts:
-            summary_parts.append(first_sentence_fallback(text))
-
-        summary_text = " ".join(summary_parts)
-        if len(summary_text) > 320:
-            summary_text = summary_text[:317].rstrip() + "..."
+        return default_rule_engine.evaluate(content, note_type)
 
-        # Keyword-driven recommendations
-        recommendations = []
-        def add_rec(rec: str):
-            if rec and rec not in recommendations:
-                recommendations.append(rec)
-
-        if any(word in lowered for word in ["chest pain", "shortness of breath", "dyspnea"]):
-            add_rec("Obtain ECG/troponin and monitor vitals closely; escalate if pain worsens.")
-        if "fever" in lowered or "infection" in lowered:
-            add_rec("Check CBC and cultures if indicated; start antipyretics and hydration.")
-        if "headache" in lowered:
-            add_rec("Assess neuro status; consider imaging if red flags (sudden/severe, neuro deficits).")
-        if "mri" in lowered or "ct" in lowered:
-            add_rec("Confirm imaging order and follow up on results with the patient.")
-        if "diabetes" in lowered or "glucose" in lowered:
-            add_rec("Reinforce glucose control, medication adherence, and foot care education.")
-        if "hypertension" in lowered or "bp" in lowered:
-            add_rec("Review antihypertensive regimen and home BP logs; adjust if persistently elevated.")
-        if "asthma" in lowered or "wheezing" in lowered:
-            add_rec("Assess inhaler technique; ensure rescue inhaler available; monitor for triggers.")
-
-        if not recommendations:
-            add_rec("Monitor symptoms, document changes, and schedule follow-up if no improvement.")
-
-        recommendations_text = " • ".join(recommendations)
-
-        # Simple risk heuristic
-        risk_level = "medium"
-        if any(word in lowered for word in ["chest pain", "severe", "critical", "dyspnea", "unstable"]):
-            risk_level = "high"
-        elif any(word in lowered for word in ["routine", "stable", "well controlled", "improved"]):
-            risk_level = "low"
-
-        key_findings = "; ".join(summary_parts[:3])
-
-        return {
-            "summary": summary_text,
-            "key_findings": key_findings or "Key findings pending AI analysis",
-            "assessment": sections.get("assessment", "Manual review required"),
-            "recommendations": recommendations_text,
-            "risk_level": risk_level,
-            "ai_generated": False,
-            "mock": True
-        }
+    @staticmethod
+    def build_structured_mock_summaries(contents: List[str], note_type: str = "general") -> List[Dict]:
+        """Batch form of `build_structured_mock_summary`."""
+        return default_rule_engine.evaluate_many(contents, note_type)
 
     def _get_mock_summary(self, content: str, note_type: str) -> Dict:
         """Fallback summary when AI is not available"""
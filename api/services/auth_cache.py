@@ -0,0 +1,140 @@
+"""
+Cache of validated JWT principals.
+
+`get_current_user` used to decode the token and query the users table on every
+authenticated request. Validated principals are now kept in a short-TTL,
+size-bounded LRU keyed by the token signature, so authorization normally costs
+no queries. Entries are dropped early when a user row is updated or deleted
+(mapper events at the bottom of this module), and never outlive the token's `exp`.
+
+The cache is per process: a change made through another worker is picked up at
+the latest after AUTH_CACHE_TTL_SECONDS.
+
+Configuration (environment):
+    AUTH_CACHE_TTL_SECONDS   lifetime of a cached principal, 0 disables the cache (default: 60)
+    AUTH_CACHE_MAX_ENTRIES   size bound (default: 10000)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Set
+
+from sqlalchemy import event
+
+from api.models.user import User, UserRole
+
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class Principal(NamedTuple):
+    """The authenticated user as seen by route handlers (id, role and active flag)."""
+    id: int
+    email: str
+    full_name: str
+    role: UserRole
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user.id, user.email, user.full_name, UserRole(user.role), bool(user.is_active))
+
+
+def token_signature(token: str) -> str:
+    """Signature segment of a compact JWS; unique per issued token."""
+    return token.rsplit(".", 1)[-1]
+
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: int = AUTH_CACHE_TTL_SECONDS, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, signature: str) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(signature)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(signature)
+            self.hits += 1
+            return principal
+
+    def set(self, signature: str, principal: Principal, token_expires_at: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._remove(signature)
+            self._entries[signature] = (principal, expires_at)
+            self._by_user.setdefault(principal.id, set()).add(signature)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Forget every cached token of a user (called when the user row changes)."""
+        with self._lock:
+            for signature in list(self._by_user.get(user_id, ())):
+                self._remove(signature)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _remove(self, signature: str) -> None:
+        entry = self._entries.pop(signature, None)
+        if entry is None:
+            return
+        signatures = self._by_user.get(entry[0].id)
+        if signatures is not None:
+            signatures.discard(signature)
+            if not signatures:
+                del self._by_user[entry[0].id]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target) -> None:
+    principal_cache.invalidate_user(target.id)
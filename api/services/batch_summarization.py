@@ -0,0 +1,201 @@
+"""
+Batch note summarization engine.
+
+Used by /ai/batch-summarize and the Celery batch task:
+- notes, patients and recent patient history are prefetched with one query each
+- per-note LLM work is fanned out under a concurrency limit and a rate limiter
+- results are yielded as each note completes so callers can stream them
+- note updates are bulk-written and committed before their results are
+  yielded, so every success a caller sees is persisted; notes that finish
+  together share one UPDATE and commit
+"""
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from api.agents.summarization_agent import SummarizationAgent, format_history_entry
+from api.db.async_database import release_connection, run_session_sync
+from api.models.note import Note
+from api.models.patient import Patient
+from api.services.patient_summary_cache import invalidate_patient_summaries
+from api.services.risk_state_service import record_note_risk
+
+BATCH_SUMMARIZE_CONCURRENCY = int(os.getenv("BATCH_SUMMARIZE_CONCURRENCY", "4"))
+BATCH_SUMMARIZE_RATE_PER_SECOND = float(os.getenv("BATCH_SUMMARIZE_RATE_PER_SECOND", "5"))
+PATIENT_HISTORY_LIMIT = 5
+
+
+class AsyncRateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BatchSummarizationEngine:
+    def __init__(
+        self,
+        agent: Optional[SummarizationAgent] = None,
+        max_concurrency: int = BATCH_SUMMARIZE_CONCURRENCY,
+        rate_per_second: float = BATCH_SUMMARIZE_RATE_PER_SECOND,
+    ):
+        self.agent = agent or SummarizationAgent()
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_per_second = rate_per_second
+
+    def prefetch(self, db: Session, note_ids: Sequence[int]) -> Tuple[List[Note], Dict[int, Patient], Dict[int, List[str]]]:
+        """Load the requested notes, their patients and each patient's recent history."""
+        unique_ids = list(dict.fromkeys(note_ids))
+        if not unique_ids:
+            return [], {}, {}
+
+        notes_by_id = {note.id: note for note in db.query(Note).filter(Note.id.in_(unique_ids)).all()}
+        notes = [notes_by_id[note_id] for note_id in unique_ids if note_id in notes_by_id]
+
+        patient_ids = {note.patient_id for note in notes}
+        patients = {
+            patient.id: patient
+            for patient in db.query(Patient).filter(Patient.id.in_(patient_ids)).all()
+        } if patient_ids else {}
+
+        return notes, patients, self._prefetch_histories(db, patients.keys())
+
+    @staticmethod
+    def _prefetch_histories(db: Session, patient_ids) -> Dict[int, List[str]]:
+        """Latest notes per patient in one windowed query."""
+        patient_ids = list(patient_ids)
+        if not patient_ids:
+            return {}
+
+        ranked = (
+            db.query(
+                Note.patient_id.label("patient_id"),
+                Note.title.label("title"),
+                Note.content.label("content"),
+                func.row_number().over(
+                    partition_by=Note.patient_id,
+                    order_by=(Note.created_at.desc(), Note.id.desc())
+                ).label("position"),
+            )
+            .filter(Note.patient_id.in_(patient_ids))
+            .subquery()
+        )
+        rows = (
+            db.query(ranked.c.patient_id, ranked.c.title, ranked.c.content)
+            .filter(ranked.c.position <= PATIENT_HISTORY_LIMIT)
+            .order_by(ranked.c.patient_id, ranked.c.position)
+            .all()
+        )
+
+        histories: Dict[int, List[str]] = {patient_id: [] for patient_id in patient_ids}
+        for row in rows:
+            histories[row.patient_id].append(format_history_entry(row.title, row.content))
+        return histories
+
+    async def stream(self, db, note_ids: Sequence[int]) -> AsyncIterator[Dict]:
+        """
+        Yield one result per note as soon as it finishes. Updates of the notes
+        completed so far are committed before each result is yielded, so a
+        client that disconnects loses only results it was never sent.
+        `db` is an AsyncSession (request handlers) or a sync Session (tasks).
+        """
+        notes, patients, histories = await run_session_sync(db, self.prefetch, note_ids)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = AsyncRateLimiter(self.rate_per_second)
+        pending: List[Dict] = []
+
+        # The AI calls are built up front: commits expire the prefetched objects, and
+        # the session must not be used from the event loop while a commit runs
+        prepared = []
+        for note in notes:
+            patient = patients.get(note.patient_id)
+            if patient is None:
+                continue
+            try:
+                calls = self.agent.build_ai_calls(
+                    note,
+                    self.agent._build_patient_context(patient, db),
+                    histories.get(patient.id, [])
+                )
+            except Exception as e:
+                calls = e
+            prepared.append((note.id, calls))
+        await release_connection(db)
+
+        async def process(note_id: int, calls) -> Dict:
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    if isinstance(calls, Exception):
+                        raise calls
+                    results, failed_calls = await self.agent.arun_ai_calls(calls)
+                    update = self.agent.build_note_update(results["summary"], results["risk"], results.get("nurse", {}))
+                    pending.append({"id": note_id, **update})
+                    return {
+                        "note_id": note_id,
+                        "success": True,
+                        "summary": update["summary"],
+                        "risk_level": results["risk"].get("risk_level"),
+                        "partial": bool(failed_calls),
+                        "error": None
+                    }
+                except Exception as e:
+                    return {"note_id": note_id, "success": False, "summary": None,
+                            "risk_level": "UNKNOWN", "partial": False, "error": str(e)}
+
+        tasks = [asyncio.ensure_future(process(note_id, calls)) for note_id, calls in prepared]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                if pending:
+                    # Also covers notes that completed meanwhile; they are yielded next
+                    updates, pending[:] = list(pending), []
+                    await run_session_sync(db, self.commit_updates, updates)
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, db, note_ids: Sequence[int]) -> List[Dict]:
+        return [result async for result in self.stream(db, note_ids)]
+
+    @staticmethod
+    def commit_updates(db: Session, updates: List[Dict]) -> None:
+        if not updates:
+            return
+        # Notes are in the identity map from prefetch (reloaded once an earlier chunk's
+        # commit expired them) and still hold their previous risk level
+        try:
+            patient_ids = set()
+            for update in updates:
+                note = db.get(Note, update["id"])
+                record_note_risk(db, note, note.risk_level, update["risk_level"], update["recommendations"])
+                patient_ids.add(note.patient_id)
+            for patient_id in sorted(patient_ids):
+                invalidate_patient_summaries(db, patient_id)
+            db.bulk_update_mappings(Note, updates)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
@@ -2,17 +2,23 @@
 Google Cloud Tasks integration for background job processing.
 Replaces Celery for Cloud Run environment.
 """
+import importlib.util
 import os
 import datetime
 from typing import Optional, Dict, Any
 import json
 
-try:
-    from google.cloud import tasks_v2
-    from google.protobuf import timestamp_pb2
-    GCP_TASKS_AVAILABLE = True
-except ImportError:
-    GCP_TASKS_AVAILABLE = False
+
+def _library_installed() -> bool:
+    try:
+        return importlib.util.find_spec("google.cloud.tasks_v2") is not None
+    except ImportError:
+        return False
+
+
+# The client library (gRPC/protobuf) is imported when a client is first created, not on cold start
+GCP_TASKS_AVAILABLE = _library_installed()
+if not GCP_TASKS_AVAILABLE:
     print("⚠️ Google Cloud Tasks library not installed. Background tasks will be disabled.")
 
 PROJECT_ID = os.getenv("GCP_PROJECT_ID", "securemed-ai")
@@ -24,6 +30,7 @@ def get_tasks_client():
     if not GCP_TASKS_AVAILABLE:
         return None
     try:
+        from google.cloud import tasks_v2
         return tasks_v2.CloudTasksClient()
     except Exception as e:
         print(f"Warning: Could not initialize Cloud Tasks client: {e}")
@@ -63,10 +70,13 @@ def create_task(
     backend_url = os.getenv("BACKEND_URL", "https://mednotes-backend-957293469884.us-central1.run.app")
     url = f"{backend_url}{endpoint}"
     
+    from google.cloud import tasks_v2
+    from google.protobuf import timestamp_pb2
+    
     # Construct the task
     task = {
         "http_request": {
-            "http_method": tasks_v2.HttpMethod.POST if GCP_TASKS_AVAILABLE else "POST",
+            "http_method": tasks_v2.HttpMethod.POST,
             "url": url,
             "headers": {
                 "Content-Type": "application/json",
@@ -81,7 +91,7 @@ def create_task(
     }
     
     # Schedule task if time provided
-    if schedule_time and GCP_TASKS_AVAILABLE:
+    if schedule_time:
         timestamp = timestamp_pb2.Timestamp()
         timestamp.FromDatetime(schedule_time)
         task["schedule_time"] = timestamp
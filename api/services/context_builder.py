@@ -0,0 +1,178 @@
+"""
+Token-budgeted note context for patient-level LLM prompts.
+
+A patient's notes are streamed newest-first from the database and each one is
+rendered as a short entry: the stored AI summary when there is one, else the
+persisted fallback summary, else a whitespace-compressed excerpt of the note.
+Assembly stops as soon as the next entry would exceed the token budget, so the
+prompt size (and with it LLM latency and cost) stays flat however many notes a
+patient has, and only the rows that make it into the prompt are read.
+
+Tokens are counted with tiktoken's encoding for the chat model. Without
+tiktoken installed, a characters/4 estimate is used instead.
+
+Configuration (environment):
+    RISK_CONTEXT_TOKEN_BUDGET    tokens of note context per risk report (default: 3000)
+    RISK_CONTEXT_EXCERPT_CHARS   characters read from a note that has no summary (default: 600)
+    CONTEXT_TOKENIZER_MODEL      model whose tokenizer is used (default: gpt-4o-mini)
+"""
+import importlib.util
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from api.models.note import Note, NoteFallbackSummary
+
+# Loaded on first count, like the rest of the AI stack
+TIKTOKEN_AVAILABLE = importlib.util.find_spec("tiktoken") is not None
+
+RISK_CONTEXT_TOKEN_BUDGET = int(os.getenv("RISK_CONTEXT_TOKEN_BUDGET", "3000"))
+RISK_CONTEXT_EXCERPT_CHARS = int(os.getenv("RISK_CONTEXT_EXCERPT_CHARS", "600"))
+CONTEXT_TOKENIZER_MODEL = os.getenv("CONTEXT_TOKENIZER_MODEL", "gpt-4o-mini")
+
+# Rows fetched per round trip while streaming notes
+_STREAM_BATCH_SIZE = 50
+# A partial entry smaller than this is not worth adding once the budget is nearly spent
+_MIN_PARTIAL_TOKENS = 32
+_ENTRY_SEPARATOR = "\n\n"
+_WHITESPACE = re.compile(r"\s+")
+
+
+class TokenCounter:
+    """Counts and truncates text in model tokens."""
+
+    def __init__(self, model: str = CONTEXT_TOKENIZER_MODEL):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        """True when counts come from the model's tokenizer rather than an estimate."""
+        return self._get_encoding() is not None
+
+    def _get_encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._encoding = self._load_encoding()
+                    self._loaded = True
+        return self._encoding
+
+    def _load_encoding(self):
+        if not TIKTOKEN_AVAILABLE:
+            print("⚠️ tiktoken not installed - estimating context tokens from text length")
+            return None
+        try:
+            import tiktoken
+            try:
+                return tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # The encoding file is downloaded on first use and may be unreachable
+            print(f"⚠️ Could not load tokenizer for {self.model}: {str(e)} - estimating tokens")
+            return None
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """`text` cut to at most `max_tokens` tokens."""
+        if max_tokens <= 0:
+            return ""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:max_tokens * 4]
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+default_token_counter = TokenCounter()
+
+
+class NoteContext(NamedTuple):
+    text: str
+    tokens: int
+    notes_included: int
+    truncated: bool  # older notes were left out to stay within the budget
+
+
+def compress_excerpt(content: Optional[str], max_chars: int = RISK_CONTEXT_EXCERPT_CHARS) -> str:
+    """Collapse whitespace and cut `content` at a word boundary near `max_chars`."""
+    text = _WHITESPACE.sub(" ", content or "").strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;:") + "…"
+
+
+def _note_entry(title: str, created_at, text: str) -> str:
+    date = created_at.strftime("%Y-%m-%d") if created_at else "undated"
+    return f"[{date}] {title}: {text}"
+
+
+def build_note_context(
+    db: Session,
+    patient_id: int,
+    token_budget: Optional[int] = None,
+    counter: Optional[TokenCounter] = None,
+) -> NoteContext:
+    """
+    Newest-first note digest for `patient_id` that fits in `token_budget` tokens.
+
+    Rows are streamed in small batches and the query is abandoned once the budget
+    is spent. Only a prefix of each note's content is read from the database.
+    """
+    token_budget = RISK_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    counter = counter or default_token_counter
+    separator_tokens = counter.count(_ENTRY_SEPARATOR)
+
+    stmt = (
+        select(
+            Note.title,
+            Note.created_at,
+            Note.summary,
+            NoteFallbackSummary.summary.label("fallback_summary"),
+            func.substr(Note.content, 1, RISK_CONTEXT_EXCERPT_CHARS * 2).label("content_head"),
+        )
+        .outerjoin(NoteFallbackSummary, NoteFallbackSummary.note_id == Note.id)
+        .where(Note.patient_id == patient_id)
+        .order_by(Note.created_at.desc(), Note.id.desc())
+    )
+
+    entries = []
+    used = 0
+    truncated = False
+    result = db.execute(stmt.execution_options(yield_per=_STREAM_BATCH_SIZE))
+    try:
+        for row in result:
+            text = (row.summary or row.fallback_summary or "").strip() or compress_excerpt(row.content_head)
+            entry = _note_entry(row.title, row.created_at, text)
+            cost = counter.count(entry) + (separator_tokens if entries else 0)
+            if used + cost > token_budget:
+                remaining = token_budget - used - (separator_tokens if entries else 0)
+                if remaining >= _MIN_PARTIAL_TOKENS or not entries:
+                    partial = counter.truncate(entry, remaining)
+                    if partial:
+                        entries.append(partial)
+                        used += counter.count(partial) + (separator_tokens if len(entries) > 1 else 0)
+                truncated = True
+                break
+            entries.append(entry)
+            used += cost
+    finally:
+        result.close()
+
+    return NoteContext(_ENTRY_SEPARATOR.join(entries), used, len(entries), truncated)
@@ -0,0 +1,135 @@
+"""
+Embedding cache for note chunks.
+
+Vectors are stored as float32 blobs in SQLite keyed by (model, chunk hash), so a
+chunk is embedded once per model no matter how many times the vector index is
+rebuilt or a note around it is edited. `CachingEmbedder` sits in front of the
+provider and only sends cache misses, deduplicated, in fixed-size batches.
+
+Configuration (environment):
+    EMBEDDING_CACHE_PATH    sqlite file (default: .cache/embeddings.sqlite3)
+    EMBEDDING_BATCH_SIZE    texts per provider call (default: 256)
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """SQLite table of float32 vectors keyed by (model, chunk hash)."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is required for the embedding store")
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, chunk_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, chunk_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, "np.ndarray"]:
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 900):
+            batch = list(hashes[start:start + 900])
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, "np.ndarray"]) -> None:
+        if not vectors:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector) VALUES (?, ?, ?)",
+                [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+            )
+            self._conn.commit()
+
+    def count(self, model: Optional[str] = None) -> int:
+        with self._lock:
+            if model is None:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            else:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()
+        return count
+
+
+class CachingEmbedder:
+    """
+    `embed_documents` drop-in that serves known chunks from an `EmbeddingStore`
+    and batches the rest to the provider.
+    """
+
+    def __init__(
+        self,
+        embed_documents: Callable[[List[str]], List[List[float]]],
+        model: str,
+        store: EmbeddingStore,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+        self._embed_documents = embed_documents
+        self.model = model
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.hits = 0
+        self.misses = 0
+        self.provider_calls = 0
+
+    def embed_documents(self, texts: Iterable[str]) -> "np.ndarray":
+        texts = list(texts)
+        hashes = [chunk_hash(text) for text in texts]
+        vectors = self.store.get_many(self.model, list(dict.fromkeys(hashes)))
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            embedded = self._embed_documents([text for _, text in batch])
+            self.provider_calls += 1
+            fresh = {key: np.asarray(vector, dtype=np.float32) for (key, _), vector in zip(batch, embedded)}
+            self.store.put_many(self.model, fresh)
+            vectors.update(fresh)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([vectors[key] for key in hashes])
+
+    def stats(self) -> Dict:
+        return {"model": self.model, "hits": self.hits, "misses": self.misses,
+                "provider_calls": self.provider_calls, "batch_size": self.batch_size}
@@ -0,0 +1,148 @@
+"""
+Materialized roster of high-risk patients (`high_risk_roster`).
+
+Holds one row per patient that has a HIGH or CRITICAL note, describing the
+newest such note. `record_note_level` is called by the risk-state hooks
+whenever a note's risk level is written (single-note and batch summarization,
+note creation), so the dashboard never scans notes: `list_high_risk_patients`
+is one ordered read of the (risk_level, last_note_date) index joined to
+patients, CRITICAL patients first and newest note first within each level.
+
+Like the risk state, nothing here commits.
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from api.models.note import Note
+from api.models.patient import Patient
+from api.models.risk_state import HighRiskRosterEntry
+
+HIGH_RISK_LEVELS = ("CRITICAL", "HIGH")
+
+
+def _fill(entry: HighRiskRosterEntry, note_id: int, created_at, title: Optional[str],
+          level: str, recommendations: Optional[str]) -> None:
+    entry.risk_level = level
+    entry.last_note_id = note_id
+    entry.last_note_date = created_at
+    entry.last_note_title = title
+    entry.recommendations = recommendations
+
+
+def record_note_level(db: Session, note: Note, level: Optional[str], recommendations: Optional[str]) -> None:
+    """Reflect a note's (normalized) risk level in its patient's roster row."""
+    entry = db.get(HighRiskRosterEntry, note.patient_id, with_for_update=True)
+    if level in HIGH_RISK_LEVELS:
+        if entry is None:
+            entry = HighRiskRosterEntry(patient_id=note.patient_id)
+            db.add(entry)
+        elif (entry.last_note_id != note.id and entry.last_note_date is not None
+              and (note.created_at, note.id) < (entry.last_note_date, entry.last_note_id)):
+            # An older note; the roster keeps the patient's newest high-risk note
+            return
+        _fill(entry, note.id, note.created_at, note.title, level, recommendations)
+    elif entry is not None and entry.last_note_id == note.id:
+        # The note the roster pointed at is no longer high risk
+        rebuild_roster_entry(db, note.patient_id, exclude_note_id=note.id)
+
+
+def record_note_title(db: Session, note: Note) -> None:
+    """Carry a renamed note's title into the roster row that points at it."""
+    entry = db.get(HighRiskRosterEntry, note.patient_id, with_for_update=True)
+    if entry is not None and entry.last_note_id == note.id:
+        entry.last_note_title = note.title
+
+
+def rebuild_roster_entry(db: Session, patient_id: int, exclude_note_id: Optional[int] = None) -> Optional[HighRiskRosterEntry]:
+    """Point the patient's row at their newest high-risk note, or remove it if there is none."""
+    query = db.query(Note.id, Note.created_at, Note.title, Note.risk_level, Note.recommendations).filter(
+        Note.patient_id == patient_id,
+        func.upper(Note.risk_level).in_(HIGH_RISK_LEVELS)
+    )
+    if exclude_note_id is not None:
+        query = query.filter(Note.id != exclude_note_id)
+    newest = query.order_by(Note.created_at.desc(), Note.id.desc()).first()
+
+    entry = db.get(HighRiskRosterEntry, patient_id, with_for_update=True)
+    if newest is None:
+        if entry is not None:
+            db.delete(entry)
+        return None
+    if entry is None:
+        entry = HighRiskRosterEntry(patient_id=patient_id)
+        db.add(entry)
+    _fill(entry, newest.id, newest.created_at, newest.title, newest.risk_level.upper(), newest.recommendations)
+    return entry
+
+
+def backfill_roster(db: Session, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Build roster rows for every patient with a high-risk note, one batch of
+    patients per query and commit.
+    """
+    written = 0
+    last_id = 0
+    while True:
+        patient_ids = [
+            row.id for row in db.query(Patient.id)
+            .filter(Patient.id > last_id)
+            .order_by(Patient.id)
+            .limit(batch_size)
+        ]
+        if not patient_ids:
+            break
+
+        ranked = (
+            db.query(
+                Note.id, Note.patient_id, Note.created_at, Note.title, Note.risk_level, Note.recommendations,
+                func.row_number().over(
+                    partition_by=Note.patient_id,
+                    order_by=(Note.created_at.desc(), Note.id.desc())
+                ).label("position"),
+            )
+            .filter(Note.patient_id.in_(patient_ids), func.upper(Note.risk_level).in_(HIGH_RISK_LEVELS))
+            .subquery()
+        )
+        for row in db.query(ranked).filter(ranked.c.position == 1):
+            entry = HighRiskRosterEntry(patient_id=row.patient_id)
+            _fill(entry, row.id, row.created_at, row.title, row.risk_level.upper(), row.recommendations)
+            db.merge(entry)
+            written += 1
+        db.commit()
+
+        last_id = patient_ids[-1]
+
+    return {"written": written}
+
+
+def list_high_risk_patients(db: Session, limit: int = 10) -> List[Dict]:
+    """Roster rows with patient names: CRITICAL first, then HIGH, newest note first."""
+    rows = (
+        db.query(
+            Patient.patient_id,
+            Patient.first_name,
+            Patient.last_name,
+            HighRiskRosterEntry.risk_level,
+            HighRiskRosterEntry.last_note_date,
+            HighRiskRosterEntry.last_note_title,
+            HighRiskRosterEntry.recommendations,
+        )
+        .select_from(HighRiskRosterEntry)
+        .join(Patient, Patient.id == HighRiskRosterEntry.patient_id)
+        .order_by(HighRiskRosterEntry.risk_level, HighRiskRosterEntry.last_note_date.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "patient_id": row.patient_id,
+            "patient_name": f"{row.first_name} {row.last_name}",
+            "risk_level": row.risk_level,
+            "last_note_date": row.last_note_date.isoformat() if row.last_note_date else None,
+            "last_note_title": row.last_note_title,
+            "recommendations": row.recommendations,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,320 @@
+"""
+Content-addressed cache for LLM responses.
+
+Responses are keyed on (model, temperature, response format, prompt template
+version, normalized input hash), so the same note sent through /ai/summarize, batch jobs or Cloud
+Tasks retries only reaches OpenAI once. The storage backend is pluggable:
+
+- memory: in-process LRU (default)
+- sqlite: on-disk store shared by processes on the same host
+- redis:  shared across hosts/workers
+
+Cached responses are generated from clinical notes and contain patient PHI.
+Only the memory backend keeps them inside the process; the sqlite and redis
+backends write them to disk or to a shared server, so they are only used with
+LLM_CACHE_ENCRYPTION_KEY set, and every value they store is Fernet-encrypted
+with it. Without a key they fall back to the memory backend. Rotating the key
+turns existing entries into misses that are overwritten on the next write.
+
+Configuration (environment):
+    LLM_CACHE_BACKEND       memory | sqlite | redis | none   (default: memory)
+    LLM_CACHE_TTL_SECONDS   entry lifetime, 0 disables expiry (default: 7 days)
+    LLM_CACHE_MAX_ENTRIES   size bound for memory/sqlite backends (default: 5000)
+    LLM_CACHE_PATH          sqlite file (default: .cache/llm_cache.sqlite3)
+    LLM_CACHE_REDIS_URL     defaults to REDIS_URL
+    LLM_CACHE_ENCRYPTION_KEY  Fernet key, required by the sqlite and redis
+                            backends (`cryptography.fernet.Fernet.generate_key()`)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+
+class CacheBackend:
+    """Interface implemented by every cache store."""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class InMemoryLRUBackend(CacheBackend):
+    """Thread-safe LRU with per-entry expiry."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "entries": len(self._entries),
+                "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Disk-backed store. Expired rows are dropped on read; when the table grows past
+    `max_entries` the least recently used rows are deleted.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        return {"backend": self.name, "entries": count,
+                "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class RedisBackend(CacheBackend):
+    """
+    Redis store shared by every API/worker process. TTL is enforced by Redis;
+    size-based eviction is delegated to the server's maxmemory policy
+    (configure `allkeys-lru` on a dedicated cache instance).
+    """
+
+    name = "redis"
+    prefix = "llmcache:"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("redis package not installed")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        if ttl:
+            self._client.setex(self.prefix + key, ttl, value)
+        else:
+            self._client.set(self.prefix + key, value)
+
+
+class EncryptedBackend(CacheBackend):
+    """Fernet-encrypts values on their way into another backend; keys are already hashes."""
+
+    def __init__(self, backend: CacheBackend, key: str):
+        from cryptography.fernet import Fernet
+
+        self.backend = backend
+        self.name = backend.name
+        self._fernet = Fernet(key.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[str]:
+        token = self.backend.get(key)
+        return self._fernet.decrypt(token.encode("utf-8")).decode("utf-8") if token is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self.backend.set(key, self._fernet.encrypt(value.encode("utf-8")).decode("utf-8"), ttl)
+
+    def stats(self) -> Dict:
+        return {**self.backend.stats(), "encrypted": True}
+
+
+class LLMResponseCache:
+    """Keying, TTL and hit/miss accounting on top of a `CacheBackend`."""
+
+    def __init__(self, backend: Optional[CacheBackend], ttl_seconds: Optional[int] = None):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds or None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def make_key(model: str, temperature, template_version: str, messages: Iterable,
+                 response_format: Optional[Dict] = None) -> str:
+        """Hash of the generation settings plus whitespace-normalized message contents."""
+        normalized = [
+            [getattr(message, "type", type(message).__name__), " ".join(str(getattr(message, "content", message)).split())]
+            for message in messages
+        ]
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "response_format": response_format,
+             "template": template_version, "input": normalized},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"⚠️ LLM cache read failed: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled or not value:
+            return
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+        }
+        if self.enabled:
+            try:
+                stats.update(self.backend.stats())
+            except Exception as e:
+                stats["backend_error"] = str(e)
+        return stats
+
+
+def build_llm_cache_from_env() -> LLMResponseCache:
+    backend_name = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    ttl = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+    backend: Optional[CacheBackend] = None
+    try:
+        encryption_key = os.getenv("LLM_CACHE_ENCRYPTION_KEY")
+        if backend_name in ("sqlite", "redis") and not encryption_key:
+            raise RuntimeError("LLM_CACHE_ENCRYPTION_KEY is required to keep PHI outside the process")
+        if backend_name == "memory":
+            backend = InMemoryLRUBackend(max_entries=max_entries)
+        elif backend_name == "sqlite":
+            backend = SQLiteBackend(os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3"), max_entries=max_entries)
+        elif backend_name == "redis":
+            backend = RedisBackend(os.getenv("LLM_CACHE_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379"))
+        if backend is not None and backend_name != "memory":
+            backend = EncryptedBackend(backend, encryption_key)
+    except Exception as e:
+        print(f"⚠️ LLM cache backend '{backend_name}' unavailable ({e}); falling back to in-memory cache")
+        backend = InMemoryLRUBackend(max_entries=max_entries)
+
+    return LLMResponseCache(backend, ttl_seconds=ttl)
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Process-wide cache shared by every MedicalAIService instance."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = build_llm_cache_from_env()
+    return _llm_cache
@@ -0,0 +1,87 @@
+"""
+Bounded worker pool for bcrypt hashing and verification.
+
+bcrypt takes 100-300 ms of CPU per call. Running it inline in `/auth/login` and
+`/auth/register` held the event loop (and every other request on it) for that
+long. Calls now run on a small dedicated thread pool (bcrypt releases the GIL),
+and once PASSWORD_HASH_MAX_PENDING calls are queued or running, new ones are
+rejected with `PasswordHashPoolSaturated` so the routes can answer 429 instead
+of letting a login storm queue unbounded work.
+
+Configuration (environment):
+    PASSWORD_HASH_WORKERS       pool size (default: min(4, CPU count))
+    PASSWORD_HASH_MAX_PENDING   queued + running calls before rejecting (default: 8 per worker)
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+
+
+class PasswordHashPoolSaturated(Exception):
+    """Raised when the hashing queue is full; `retry_after` is a hint in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Password hashing pool saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._total_seconds = 0.0
+
+    @property
+    def average_seconds(self) -> float:
+        return self._total_seconds / self.completed if self.completed else 0.2
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained."""
+        return max(1, math.ceil(self.pending / self.workers * self.average_seconds))
+
+    async def run(self, func: Callable, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHashPoolSaturated(self.retry_after())
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, func, args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def _timed(self, func: Callable, args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.completed += 1
+                self._total_seconds += elapsed
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.average_seconds * 1000, 1) if self.completed else None,
+        }
+
+
+password_hash_pool = PasswordHashPool()
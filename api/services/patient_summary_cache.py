@@ -0,0 +1,234 @@
+"""
+Stored per-patient LLM summaries (`patient_ai_summaries`).
+
+The patient overview (`/ai/patient-summary`) and the timeline's journey summary
+(`/ai/patient-timeline`) used to call the LLM on every request. Each is now
+kept per patient together with a fingerprint of its prompt inputs: the id and
+content hash of every note in it, plus the patient header (name, and for the
+journey the demographics and visit/appointment counts).
+
+- note create, update and summarization, patient edits and appointment writes
+  call `invalidate_patient_summaries`, which only flags the patient's entries
+  stale (no LLM work on the write path)
+- a read always returns the stored summary; if it is stale the caller schedules
+  `regenerate_patient_summary` as a background task, which recomputes the
+  fingerprint and calls the LLM only if the covered notes actually changed
+- only a patient's first summary of a kind is generated inline
+
+Regenerations are de-duplicated per process; across processes, identical
+prompts are answered by the shared LLM response cache. After a failed
+regeneration (e.g. an LLM outage) a summary is not retried for
+SUMMARY_REGENERATION_RETRY_SECONDS (default: 300); reads keep serving the
+last good one meanwhile.
+
+Invalidation leaves committing to the note write it is part of; generating or
+refreshing a summary commits it.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from api.db.async_database import release_connection, run_session_sync
+
+from api.models.ai_summary import PatientAISummary
+from api.models.note import Note
+from api.models.patient import Patient
+from api.services.ai_service import MedicalAIService
+from api.services.registry import get_ai_service
+from api.services.timeline_service import journey_context, recent_note_digests, timeline_statistics
+
+SUMMARY_KIND = "summary"
+JOURNEY_KIND = "journey"
+SUMMARY_KINDS = (SUMMARY_KIND, JOURNEY_KIND)
+
+# Notes fed to the patient overview prompt, newest first
+SUMMARY_NOTE_LIMIT = 10
+
+SUMMARY_REGENERATION_RETRY_SECONDS = float(os.getenv("SUMMARY_REGENERATION_RETRY_SECONDS", "300"))
+
+_in_flight: Set[Tuple[int, str]] = set()
+# (patient id, kind) -> monotonic time of the last failed regeneration
+_failed_at: Dict[Tuple[int, str], float] = {}
+_in_flight_lock = threading.Lock()
+
+
+class CachedSummary(NamedTuple):
+    content: str
+    generated_at: Optional[datetime]
+    stale: bool  # a background regeneration is due
+
+
+class SummaryInputs(NamedTuple):
+    fingerprint: str
+    note_ids: List[int]
+    generate: Callable[[MedicalAIService], str]
+    fallback: Callable[[Exception], str]  # served (not stored) when the first generation fails
+
+
+def _note_hash(*parts: Optional[str]) -> str:
+    return hashlib.sha256("\0".join(part or "" for part in parts).encode("utf-8")).hexdigest()
+
+
+def _fingerprint(header: str, pairs: List[Tuple[int, str]]) -> str:
+    return hashlib.sha256(json.dumps([header, pairs]).encode("utf-8")).hexdigest()
+
+
+def summary_inputs(db: Session, patient: Patient, kind: str) -> SummaryInputs:
+    """The notes a summary of `kind` is built from, their fingerprint, and how to generate it."""
+    if kind == SUMMARY_KIND:
+        rows = db.execute(
+            select(Note.id, Note.content)
+            .where(Note.patient_id == patient.id)
+            .order_by(Note.created_at.desc(), Note.id.desc())
+            .limit(SUMMARY_NOTE_LIMIT)
+        ).all()
+        pairs = [(row.id, _note_hash(row.content)) for row in rows]
+        patient_name = header = f"{patient.first_name} {patient.last_name}"
+        contents = [row.content for row in rows if row.content]
+        generate = lambda ai_service: ai_service.generate_patient_summary(patient_name, contents, fallback=False)
+        fallback = lambda error: MedicalAIService.fallback_patient_summary(patient_name, contents)
+    elif kind == JOURNEY_KIND:
+        digests = recent_note_digests(db, patient.id)
+        pairs = [(row.id, _note_hash(row.title, row.summary, row.excerpt)) for row in digests]
+        patient_info, recent_notes = journey_context(patient, timeline_statistics(db, patient.id), digests)
+        header = patient_info
+        generate = lambda ai_service: ai_service.generate_patient_journey_summary(patient_info, recent_notes)
+        fallback = lambda error: f"AI summary unavailable: {error}"
+    else:
+        raise ValueError(f"Unknown summary kind: {kind}")
+    return SummaryInputs(_fingerprint(header, pairs), [note_id for note_id, _ in pairs], generate, fallback)
+
+
+def invalidate_patient_summaries(db: Session, patient_id: int) -> None:
+    """Flag a patient's stored summaries stale after one of their notes, their record or appointments changed."""
+    db.query(PatientAISummary).filter(PatientAISummary.patient_id == patient_id).update(
+        {"stale": True, "invalidations": PatientAISummary.invalidations + 1},
+        synchronize_session=False
+    )
+
+
+def refresh_patient_summary(db: Session, patient: Patient, kind: str,
+                            ai_service: Optional[MedicalAIService] = None) -> PatientAISummary:
+    """
+    Bring a patient's stored summary up to date and commit. The LLM is called
+    only when there is no entry yet or the covered notes' fingerprint changed.
+    """
+    ai_service = ai_service or get_ai_service()
+    entry = db.get(PatientAISummary, (patient.id, kind))
+    seen_invalidations = entry.invalidations if entry is not None else 0
+    inputs = summary_inputs(db, patient, kind)
+    if entry is not None and entry.fingerprint == inputs.fingerprint:
+        content = None
+    else:
+        # The LLM call runs outside any write; a failure leaves the last good summary in place
+        content = inputs.generate(ai_service)
+    return _store(db, patient, kind, inputs, content, seen_invalidations)
+
+
+def _store(db: Session, patient: Patient, kind: str, inputs: SummaryInputs, content: Optional[str],
+           seen_invalidations: int) -> PatientAISummary:
+    """Write newly generated `content` (None: the covered notes are unchanged) and the stale flag."""
+    entry = db.get(PatientAISummary, (patient.id, kind), populate_existing=True)
+    if entry is None:
+        entry = PatientAISummary(patient_id=patient.id, kind=kind, invalidations=0)
+        db.add(entry)
+    if content is not None:
+        entry.content = content
+        entry.fingerprint = inputs.fingerprint
+        entry.note_ids = json.dumps(inputs.note_ids)
+        entry.generated_at = datetime.now(timezone.utc)
+    # A note written while this ran invalidated the entry again; leave it for the next read
+    entry.stale = (entry.invalidations or 0) != seen_invalidations
+    db.commit()
+    return entry
+
+
+def read_patient_summary(db: Session, patient: Patient, kind: str,
+                         ai_service: Optional[MedicalAIService] = None) -> CachedSummary:
+    """
+    The stored summary, even if stale; only a missing one is generated inline.
+    Without a configured LLM the rule-based text is returned and nothing is stored.
+    """
+    ai_service = ai_service or get_ai_service()
+    if not ai_service.enabled:
+        return CachedSummary(summary_inputs(db, patient, kind).generate(ai_service), None, False)
+
+    entry = db.get(PatientAISummary, (patient.id, kind))
+    if entry is None:
+        inputs = summary_inputs(db, patient, kind)
+        try:
+            entry = _store(db, patient, kind, inputs, inputs.generate(ai_service), 0)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Patient {kind} generation failed for patient {patient.id}: {e}")
+            return CachedSummary(inputs.fallback(e), None, False)
+    return CachedSummary(entry.content, entry.generated_at, entry.stale)
+
+
+async def aread_patient_summary(db, patient: Patient, kind: str,
+                                ai_service: Optional[MedicalAIService] = None) -> CachedSummary:
+    """
+    `read_patient_summary` for request handlers on an AsyncSession: the session
+    work runs through `run_session_sync`, a first generation's LLM call on the threadpool.
+    """
+    ai_service = ai_service or get_ai_service()
+    if ai_service.enabled:
+        entry = await run_session_sync(db, lambda session: session.get(PatientAISummary, (patient.id, kind)))
+        if entry is not None:
+            return CachedSummary(entry.content, entry.generated_at, entry.stale)
+
+    inputs = await run_session_sync(db, summary_inputs, patient, kind)
+    try:
+        await release_connection(db)
+        content = await run_in_threadpool(inputs.generate, ai_service)
+        if not ai_service.enabled:
+            return CachedSummary(content, None, False)
+        entry = await run_session_sync(db, _store, patient, kind, inputs, content, 0)
+    except Exception as e:
+        await run_session_sync(db, lambda session: session.rollback())
+        print(f"⚠️ Patient {kind} generation failed for patient {patient.id}: {e}")
+        return CachedSummary(inputs.fallback(e), None, False)
+    return CachedSummary(entry.content, entry.generated_at, entry.stale)
+
+
+def regenerate_patient_summary(patient_id: int, kind: str, ai_service: Optional[MedicalAIService] = None) -> bool:
+    """
+    Background task: refresh a stale summary in its own session. Returns False
+    when a regeneration for the same summary is already running in this process,
+    or the last one failed less than SUMMARY_REGENERATION_RETRY_SECONDS ago.
+    """
+    from api.db.database import SessionLocal
+
+    key = (patient_id, kind)
+    with _in_flight_lock:
+        failed_at = _failed_at.get(key)
+        if key in _in_flight or (failed_at is not None and time.monotonic() - failed_at < SUMMARY_REGENERATION_RETRY_SECONDS):
+            return False
+        _in_flight.add(key)
+
+    db = SessionLocal()
+    try:
+        patient = db.get(Patient, patient_id)
+        if patient is not None:
+            refresh_patient_summary(db, patient, kind, ai_service)
+        with _in_flight_lock:
+            _failed_at.pop(key, None)
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Patient {kind} regeneration failed for patient {patient_id}: {e}")
+        with _in_flight_lock:
+            _failed_at[key] = time.monotonic()
+        return True
+    finally:
+        db.close()
+        with _in_flight_lock:
+            _in_flight.discard(key)
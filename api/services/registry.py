@@ -0,0 +1,80 @@
+"""
+Process-wide registry for the AI stack.
+
+Agents, routes and background tasks all get the same `MedicalAIService` from
+`get_ai_service()`, so its RAG index, embedding cache and LLM clients are built
+once per process and reused. Its ChatOpenAI and embeddings clients share one
+keep-alive HTTP connection pool (sync and async), so requests to OpenAI reuse
+TLS connections instead of opening a pool per client.
+
+Configuration (environment):
+    AI_HTTP_MAX_CONNECTIONS     connection cap for the shared pool (default: 20)
+    AI_HTTP_MAX_KEEPALIVE       idle connections kept open (default: 10)
+    AI_HTTP_KEEPALIVE_SECONDS   idle connection lifetime (default: 30)
+    AI_HTTP_TIMEOUT_SECONDS     per-request timeout (default: 60)
+"""
+import importlib.util
+import os
+import threading
+from typing import Dict, Optional
+
+from api.services.ai_service import MedicalAIService
+
+# Imported with the first service, like the rest of the AI stack
+HTTPX_AVAILABLE = importlib.util.find_spec("httpx") is not None
+
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20"))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "10"))
+AI_HTTP_KEEPALIVE_SECONDS = float(os.getenv("AI_HTTP_KEEPALIVE_SECONDS", "30"))
+AI_HTTP_TIMEOUT_SECONDS = float(os.getenv("AI_HTTP_TIMEOUT_SECONDS", "60"))
+
+_lock = threading.Lock()
+_ai_service: Optional[MedicalAIService] = None
+_http_client = None
+_async_http_client = None
+
+
+def _build_http_clients():
+    global _http_client, _async_http_client
+    if not HTTPX_AVAILABLE or _http_client is not None:
+        return
+    import httpx
+    
+    limits = httpx.Limits(
+        max_connections=AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=AI_HTTP_KEEPALIVE_SECONDS,
+    )
+    _http_client = httpx.Client(limits=limits, timeout=AI_HTTP_TIMEOUT_SECONDS)
+    _async_http_client = httpx.AsyncClient(limits=limits, timeout=AI_HTTP_TIMEOUT_SECONDS)
+
+
+def get_ai_service() -> MedicalAIService:
+    """The process's MedicalAIService, built on first use."""
+    global _ai_service
+    if _ai_service is None:
+        with _lock:
+            if _ai_service is None:
+                _build_http_clients()
+                _ai_service = MedicalAIService(http_client=_http_client, http_async_client=_async_http_client)
+    return _ai_service
+
+
+def reset_registry() -> None:
+    """Drop the shared service and close its connection pool (tests, forked workers)."""
+    global _ai_service, _http_client, _async_http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        # The async client's connections belong to an event loop that may be gone; let them be collected
+        _ai_service, _http_client, _async_http_client = None, None, None
+
+
+def registry_stats() -> Dict:
+    return {
+        "ai_service_built": _ai_service is not None,
+        "ai_service_enabled": bool(_ai_service is not None and _ai_service.enabled),
+        "shared_http_pool": _http_client is not None,
+        "max_connections": AI_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": AI_HTTP_MAX_KEEPALIVE,
+    }
@@ -0,0 +1,242 @@
+"""
+Incremental per-patient risk state (`patient_risk_states`).
+
+Instead of re-reading a patient's notes for every risk report, the state is
+updated as notes change:
+
+- `record_note_created` when a note is written: note count, newest note, and
+  the note's week bucket
+- `record_note_risk` when summarization sets a note's risk level: moves the note
+  between risk buckets and tracks the latest risk level
+
+Both also keep the high-risk roster (api/services/high_risk_roster.py) in step.
+
+Weekly counts cover the most recent RISK_STATE_WEEKS weeks up to the newest
+note. `rebuild_risk_state` recomputes a state from the notes table; it is used
+for patients that have no state yet and by the backfill migration.
+
+The LLM assessment is stored next to the counts together with the newest note
+it covered; `needs_assessment` is true only once a newer note exists.
+
+All functions leave committing to the caller.
+
+Configuration (environment):
+    RISK_STATE_WEEKS   weeks of per-week note counts kept per patient (default: 12)
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from api.models.note import Note
+from api.models.patient import Patient
+from api.models.risk_state import PatientRiskState
+from api.services.high_risk_roster import record_note_level
+
+RISK_STATE_WEEKS = int(os.getenv("RISK_STATE_WEEKS", "12"))
+RISK_TREND_WEEKS = 4
+
+
+def normalize_level(value: Optional[str]) -> Optional[str]:
+    """Risk levels are stored lowercase on notes and uppercase by the LLM; states use uppercase."""
+    return (value or "").strip().upper() or None
+
+
+def week_key(created_at: datetime) -> str:
+    """Monday of the week `created_at` falls in, as YYYY-MM-DD."""
+    return (created_at - timedelta(days=created_at.weekday())).strftime("%Y-%m-%d")
+
+
+def _window_start(newest_week: str) -> str:
+    start = datetime.strptime(newest_week, "%Y-%m-%d") - timedelta(weeks=RISK_STATE_WEEKS - 1)
+    return start.strftime("%Y-%m-%d")
+
+
+def _load_counts(state: PatientRiskState) -> Dict[str, Dict[str, int]]:
+    return json.loads(state.weekly_counts) if state.weekly_counts else {}
+
+
+def _store_counts(state: PatientRiskState, counts: Dict[str, Dict[str, int]]) -> None:
+    if counts:
+        oldest_kept = _window_start(max(counts))
+        counts = {week: bucket for week, bucket in counts.items() if week >= oldest_kept}
+    state.weekly_counts = json.dumps(counts, sort_keys=True)
+
+
+def _set_risk_level(state: PatientRiskState, note_id: int, level: Optional[str]) -> None:
+    if level and note_id >= (state.risk_note_id or 0):
+        state.risk_level = level
+        state.risk_note_id = note_id
+
+
+def get_risk_state(db: Session, patient_id: int, for_update: bool = False) -> Optional[PatientRiskState]:
+    return db.get(PatientRiskState, patient_id, with_for_update=for_update or None)
+
+
+def load_risk_state(db: Session, patient_id: int) -> PatientRiskState:
+    """The patient's state, built from their notes the first time it is needed."""
+    return get_risk_state(db, patient_id) or rebuild_risk_state(db, patient_id)
+
+
+def rebuild_risk_state(db: Session, patient_id: int) -> PatientRiskState:
+    """Recompute a patient's state from the notes table; the stored assessment is kept."""
+    state = get_risk_state(db, patient_id, for_update=True)
+    if state is None:
+        state = PatientRiskState(patient_id=patient_id)
+        db.add(state)
+
+    state.note_count = db.query(func.count(Note.id)).filter(Note.patient_id == patient_id).scalar() or 0
+    last_note = db.query(Note.id, Note.created_at).filter(
+        Note.patient_id == patient_id
+    ).order_by(Note.id.desc()).first()
+    state.last_note_id, state.last_note_at = (last_note.id, last_note.created_at) if last_note else (None, None)
+
+    risk_note = db.query(Note.id, Note.risk_level).filter(
+        Note.patient_id == patient_id,
+        Note.risk_level.isnot(None)
+    ).order_by(Note.id.desc()).first()
+    state.risk_level, state.risk_note_id = None, None
+    if risk_note:
+        _set_risk_level(state, risk_note.id, normalize_level(risk_note.risk_level))
+
+    counts: Dict[str, Dict[str, int]] = {}
+    newest = db.query(func.max(Note.created_at)).filter(Note.patient_id == patient_id).scalar()
+    if newest is not None:
+        window_start = datetime.strptime(_window_start(week_key(newest)), "%Y-%m-%d")
+        if newest.tzinfo is not None:
+            window_start = window_start.replace(tzinfo=newest.tzinfo)
+        rows = db.query(Note.created_at, Note.risk_level).filter(
+            Note.patient_id == patient_id,
+            Note.created_at >= window_start
+        )
+        for row in rows:
+            bucket = counts.setdefault(week_key(row.created_at), {"total": 0})
+            bucket["total"] += 1
+            level = normalize_level(row.risk_level)
+            if level:
+                bucket[level] = bucket.get(level, 0) + 1
+    _store_counts(state, counts)
+    return state
+
+
+def backfill_risk_states(db: Session, batch_size: int = 200) -> Dict[str, int]:
+    """
+    Rebuild the state of every patient with notes, in primary-key order one batch
+    at a time, committing after each batch so it can be resumed.
+    """
+    rebuilt = 0
+    last_id = 0
+    while True:
+        patient_ids = [
+            row.id for row in db.query(Patient.id)
+            .filter(Patient.id > last_id, Patient.notes.any())
+            .order_by(Patient.id)
+            .limit(batch_size)
+        ]
+        if not patient_ids:
+            break
+
+        for patient_id in patient_ids:
+            rebuild_risk_state(db, patient_id)
+        db.commit()
+
+        rebuilt += len(patient_ids)
+        last_id = patient_ids[-1]
+
+    return {"rebuilt": rebuilt}
+
+
+def record_note_created(db: Session, note: Note) -> PatientRiskState:
+    """Fold a newly flushed note into its patient's state."""
+    level = normalize_level(note.risk_level)
+    if level:
+        record_note_level(db, note, level, note.recommendations)
+
+    state = get_risk_state(db, note.patient_id, for_update=True)
+    if state is None:
+        # First note (or a patient from before risk states): the rebuild includes this note
+        db.flush()
+        return rebuild_risk_state(db, note.patient_id)
+
+    state.note_count = (state.note_count or 0) + 1
+    if note.id > (state.last_note_id or 0):
+        state.last_note_id, state.last_note_at = note.id, note.created_at
+
+    counts = _load_counts(state)
+    week = week_key(note.created_at)
+    if not counts or week >= _window_start(max(counts)):
+        bucket = counts.setdefault(week, {"total": 0})
+        bucket["total"] += 1
+        if level:
+            bucket[level] = bucket.get(level, 0) + 1
+        _store_counts(state, counts)
+
+    _set_risk_level(state, note.id, level)
+    return state
+
+
+def record_note_risk(db: Session, note: Note, previous_level: Optional[str],
+                     new_level: Optional[str] = None, recommendations: Optional[str] = None) -> PatientRiskState:
+    """
+    Move a note between risk buckets after its risk level changed and update the
+    high-risk roster. `new_level` and `recommendations` default to the note's own.
+    """
+    new_level = normalize_level(new_level if new_level is not None else note.risk_level)
+    previous_level = normalize_level(previous_level)
+    record_note_level(db, note, new_level, recommendations if recommendations is not None else note.recommendations)
+
+    state = get_risk_state(db, note.patient_id, for_update=True)
+    if state is None:
+        db.flush()
+        state = rebuild_risk_state(db, note.patient_id)
+        # The rebuild counted the note at the level it currently holds
+        previous_level = normalize_level(note.risk_level)
+
+    if previous_level != new_level:
+        counts = _load_counts(state)
+        bucket = counts.get(week_key(note.created_at))
+        if bucket is not None:
+            if previous_level and bucket.get(previous_level):
+                bucket[previous_level] -= 1
+            if new_level:
+                bucket[new_level] = bucket.get(new_level, 0) + 1
+            _store_counts(state, counts)
+
+    _set_risk_level(state, note.id, new_level)
+    return state
+
+
+def risk_trends(state: PatientRiskState, weeks: int = RISK_TREND_WEEKS) -> List[Dict]:
+    """Per-week note and risk counts for the most recent weeks with notes, newest first."""
+    counts = _load_counts(state)
+    trends = []
+    for week in sorted(counts, reverse=True)[:weeks]:
+        bucket = counts[week]
+        high_risk_count = bucket.get("HIGH", 0) + bucket.get("CRITICAL", 0)
+        trends.append({
+            "week": week,
+            "total_notes": bucket.get("total", 0),
+            "high_risk_notes": high_risk_count,
+            "medium_risk_notes": bucket.get("MEDIUM", 0),
+            "risk_trend": "increasing" if high_risk_count > 0 else "stable"
+        })
+    return trends
+
+
+def needs_assessment(state: PatientRiskState) -> bool:
+    """True when there is no stored assessment or notes were written after it."""
+    return state.assessment is None or state.assessed_note_id != state.last_note_id
+
+
+def stored_assessment(state: PatientRiskState) -> Optional[Dict]:
+    return json.loads(state.assessment) if state.assessment else None
+
+
+def store_assessment(state: PatientRiskState, assessment: Dict, covered_note_id: Optional[int]) -> None:
+    """Keep an LLM assessment along with the newest note it was made from."""
+    state.assessment = json.dumps(assessment, default=str)
+    state.assessed_note_id = covered_note_id
+    state.assessed_at = datetime.now(timezone.utc)
@@ -0,0 +1,112 @@
+"""
+Incremental parsing of streamed LLM output.
+
+Structured summaries are requested as a single JSON object. `JSONSectionParser`
+consumes the completion chunk by chunk and hands back each top-level field as
+soon as its value is complete, so the first section (e.g. the chief complaint)
+can be rendered while the model is still writing the rest.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class JSONSectionParser:
+    """
+    Feed streamed text; `feed` returns the top-level (key, value) pairs that the
+    new text completed. Text before the opening brace (prose, code fences) is
+    skipped. Values that are not valid JSON on their own are returned as text.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.current_key: Optional[str] = None
+        self._state = "seek"  # seek -> key_start -> key -> colon -> value_start -> value -> ... -> done
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        completed = []
+        for char in text:
+            section = self._step(char)
+            if section is not None:
+                completed.append(section)
+        return completed
+
+    def _step(self, char: str) -> Optional[Tuple[str, Any]]:
+        state = self._state
+        if state == "seek":
+            if char == "{":
+                self._state = "key_start"
+        elif state == "key_start":
+            if char == '"':
+                self._state, self._buffer = "key", []
+            elif char == "}":
+                self._state = "done"
+        elif state == "key":
+            if self._consume_string_char(char):
+                self.current_key = json.loads('"' + "".join(self._buffer) + '"')
+                self._state = "colon"
+            else:
+                self._buffer.append(char)
+        elif state == "colon":
+            if char == ":":
+                self._state = "value_start"
+        elif state == "value_start":
+            if not char.isspace():
+                self._state, self._buffer, self._depth = "value", [], 0
+                return self._value_char(char)
+        elif state == "value":
+            return self._value_char(char)
+        return None
+
+    def _consume_string_char(self, char: str) -> bool:
+        """Track escapes inside a string; True when `char` closes it."""
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            return True
+        return False
+
+    def _value_char(self, char: str) -> Optional[Tuple[str, Any]]:
+        if self._in_string:
+            self._buffer.append(char)
+            if self._consume_string_char(char):
+                self._in_string = False
+                if self._depth == 0:
+                    return self._finish_value("key_start")
+            return None
+
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            if self._depth == 0:
+                # Closing brace of the outer object ends a bare scalar value
+                return self._finish_value("done")
+            self._depth -= 1
+            self._buffer.append(char)
+            return self._finish_value("key_start") if self._depth == 0 else None
+        elif char == "," and self._depth == 0:
+            return self._finish_value("key_start")
+        self._buffer.append(char)
+        return None
+
+    def _finish_value(self, next_state: str) -> Tuple[str, Any]:
+        raw = "".join(self._buffer).strip()
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        key = self.current_key
+        self.sections[key] = value
+        self._state, self._buffer, self.current_key = next_state, [], None
+        return key, value
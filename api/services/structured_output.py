@@ -0,0 +1,174 @@
+"""
+Typed parsing of JSON answers from the chat model.
+
+Structured prompts run in JSON mode, but answers can still arrive wrapped in
+prose or code fences, cut off at the token limit, or with small syntax slips.
+`parse_structured` works through them cheapest first:
+
+1. take the first balanced top-level object in a single string-aware pass,
+   skipping any prose or code fence around it (no backtracking regex)
+2. json.loads it and validate it into the caller's Pydantic model
+3. repair common defects locally: curly quotes, trailing commas, Python
+   literals, and unterminated strings/brackets from truncated output
+
+Only when all of that fails does the caller retry, and then with a short
+"return this as valid JSON" prompt instead of the original request
+(`MedicalAIService._invoke_structured`). Outcomes are counted per prompt
+template in `structured_output_metrics`.
+"""
+import json
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+_SMART_QUOTES = "“”"
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def extract_json_object(text: str) -> Tuple[Optional[str], bool]:
+    """
+    The first top-level JSON object in `text` and whether it was closed. An
+    unclosed object (truncated output) is returned up to the end of the text.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None, False
+
+    depth = 0
+    in_string = escape = False
+    for position in range(start, len(text)):
+        char = text[position]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:position + 1], True
+    return text[start:], False
+
+
+def repair_json(candidate: str) -> Optional[Any]:
+    """Best-effort fix of a malformed or truncated JSON object; None if still unparseable."""
+    out = []
+    stack = []
+    in_string = escape = smart_string = False
+    text = candidate
+    position = 0
+    while position < len(text):
+        char = text[position]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"' and not smart_string or char in _SMART_QUOTES and smart_string:
+                in_string = False
+                char = '"'
+            elif char == '"':
+                char = '\\"'
+            out.append(char)
+            position += 1
+            continue
+
+        if char == '"' or char in _SMART_QUOTES:
+            # Keys/values quoted with curly quotes are closed by a curly quote
+            in_string, smart_string = True, char != '"'
+            char = '"'
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+        elif char.isalpha():
+            word_end = position
+            while word_end < len(text) and text[word_end].isalpha():
+                word_end += 1
+            word = text[position:word_end]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            position = word_end
+            continue
+        out.append(char)
+        position += 1
+
+    # Truncated output: close the open string, drop a dangling separator, close brackets
+    if in_string:
+        out.append('"')
+    repaired = "".join(out).rstrip()
+    if repaired.endswith(":"):
+        repaired += " null"
+    repaired = repaired.rstrip(",")
+    repaired += "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+    try:
+        return json.loads(repaired)
+    except ValueError:
+        return None
+
+
+def _drop_trailing_comma(out) -> None:
+    index = len(out) - 1
+    while index >= 0 and out[index].isspace():
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index]
+
+
+class ParseResult(NamedTuple):
+    value: Optional[BaseModel]
+    repaired: bool
+    error: Optional[str]
+
+
+def parse_structured(content: str, model: Type[BaseModel]) -> ParseResult:
+    """Extract, decode and validate `content` as `model`, repairing it locally if needed."""
+    candidate, _ = extract_json_object(content or "")
+    if candidate is None:
+        return ParseResult(None, False, "no JSON object in response")
+
+    repaired = False
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        data = repair_json(candidate)
+        repaired = True
+        if data is None:
+            return ParseResult(None, True, "malformed JSON")
+
+    try:
+        return ParseResult(model.model_validate(data), repaired, None)
+    except ValidationError as e:
+        return ParseResult(None, repaired, f"validation failed: {e.error_count()} error(s)")
+
+
+class StructuredOutputMetrics:
+    """Per-template counts of how structured responses were obtained."""
+
+    OUTCOMES = ("parsed", "repaired", "retried", "recovered_by_retry", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, template: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(template, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {template: dict(counts) for template, counts in self._counts.items()}
+
+
+structured_output_metrics = StructuredOutputMetrics()
@@ -0,0 +1,210 @@
+"""
+Patient timeline engine.
+
+Notes and appointments are merged in the database by one UNION ALL query,
+newest first, instead of loading both lists and sorting them in Python:
+
+- each branch is an indexed range read on (patient_id, created_at) or
+  (patient_id, start_time), limited to one page, so a page costs the same
+  however long the patient's history is
+- pages are addressed with an opaque cursor (date, type, id of the last item)
+  and can be narrowed to a [since, until) window
+- `fields` projects the item columns; columns left out (e.g. full note
+  content) are selected as NULL and never leave the database
+- statistics (visit counts, risk distribution, last visit) are SQL aggregates
+
+Configuration (environment):
+    TIMELINE_PAGE_SIZE   items per page when no limit is given (default: 50)
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import String, Text, and_, cast, func, literal, null, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from api.models.appointment import Appointment
+from api.models.note import Note
+from api.models.patient import Patient
+from api.models.user import User
+
+TIMELINE_PAGE_SIZE = int(os.getenv("TIMELINE_PAGE_SIZE", "50"))
+TIMELINE_MAX_PAGE_SIZE = 200
+
+# Always returned: they identify an item and its position for the cursor
+KEY_FIELDS = ("type", "id", "date")
+TIMELINE_FIELDS = KEY_FIELDS + ("title", "content", "summary", "risk_level", "author", "reason", "status")
+
+# Column type of each projected field, so NULL placeholders line up across the UNION
+_FIELD_TYPES = {
+    "title": String, "content": Text, "summary": Text, "risk_level": String,
+    "author": String, "reason": Text, "status": String,
+}
+# Fields that exist on each item type
+_ITEM_FIELDS = {
+    "note": ("title", "content", "summary", "risk_level", "author"),
+    "appointment": ("title", "reason", "status"),
+}
+
+
+class TimelinePage(NamedTuple):
+    items: List[Dict]
+    next_cursor: Optional[str]
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Validate a comma-separated `fields=` value; None or empty selects every field."""
+    if not fields:
+        return list(TIMELINE_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - set(TIMELINE_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown timeline fields: {', '.join(unknown)}")
+    return [field for field in TIMELINE_FIELDS if field in KEY_FIELDS or field in requested]
+
+
+def encode_cursor(item: Dict) -> str:
+    position = {"date": item["date"], "type": item["type"], "id": item["id"]}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {"date": datetime.fromisoformat(position["date"]), "type": position["type"], "id": int(position["id"])}
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid timeline cursor")
+
+
+def _projected(field: str, column, fields: Iterable[str]):
+    if field in fields and column is not None:
+        return column.label(field)
+    return cast(null(), _FIELD_TYPES[field]).label(field)
+
+
+def _after_cursor(kind: str, date_column, id_column, cursor: Dict):
+    """Rows of one branch that sort after the cursor in (date, type, id) descending order."""
+    if kind > cursor["type"]:
+        return date_column < cursor["date"]
+    if kind < cursor["type"]:
+        return date_column <= cursor["date"]
+    return or_(date_column < cursor["date"], and_(date_column == cursor["date"], id_column < cursor["id"]))
+
+
+def _branch(kind: str, date_column, id_column, columns: Dict, patient_filter, fields, cursor, since, until, limit):
+    query = select(
+        literal(kind, String).label("type"),
+        id_column.label("id"),
+        date_column.label("date"),
+        *(_projected(field, columns.get(field), fields) for field in _FIELD_TYPES),
+    ).where(patient_filter)
+    if since is not None:
+        query = query.where(date_column >= since)
+    if until is not None:
+        query = query.where(date_column < until)
+    if cursor is not None:
+        query = query.where(_after_cursor(kind, date_column, id_column, cursor))
+    return query.order_by(date_column.desc(), id_column.desc()).limit(limit)
+
+
+def load_timeline_page(
+    db: Session,
+    patient_id: int,
+    limit: int = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[List[str]] = None,
+) -> TimelinePage:
+    """One page of a patient's merged notes and appointments, newest first."""
+    limit = max(1, min(limit, TIMELINE_MAX_PAGE_SIZE))
+    fields = fields or list(TIMELINE_FIELDS)
+    position = decode_cursor(cursor) if cursor else None
+
+    note_columns = {
+        "title": Note.title, "content": Note.content, "summary": Note.summary,
+        "risk_level": Note.risk_level, "author": User.full_name,
+    }
+    notes = _branch("note", Note.created_at, Note.id, note_columns, Note.patient_id == patient_id,
+                    fields, position, since, until, limit + 1)
+    if "author" in fields:
+        notes = notes.outerjoin(User, User.id == Note.author_id)
+
+    appointment_columns = {"title": Appointment.title, "reason": Appointment.notes, "status": Appointment.status}
+    appointments = _branch("appointment", Appointment.start_time, Appointment.id, appointment_columns,
+                           Appointment.patient_id == patient_id, fields, position, since, until, limit + 1)
+
+    # Each branch stays a bounded index read; the merge only orders 2 * (limit + 1) rows
+    merged = union_all(
+        select(notes.subquery()),
+        select(appointments.subquery()),
+    ).subquery()
+    rows = db.execute(
+        select(merged)
+        .order_by(merged.c.date.desc(), merged.c.type.desc(), merged.c.id.desc())
+        .limit(limit + 1)
+    ).all()
+
+    items = []
+    for row in rows[:limit]:
+        item = {"type": row.type, "id": row.id, "date": row.date.isoformat()}
+        for field in _ITEM_FIELDS[row.type]:
+            if field in fields:
+                item[field] = getattr(row, field)
+        items.append(item)
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return TimelinePage(items, next_cursor)
+
+
+def timeline_statistics(db: Session, patient_id: int) -> Dict:
+    """Visit counts, risk distribution and last visit, aggregated in SQL."""
+    risk_rows = db.execute(
+        select(Note.risk_level, func.count(Note.id), func.max(Note.created_at))
+        .where(Note.patient_id == patient_id)
+        .group_by(Note.risk_level)
+    ).all()
+    total_appointments = db.execute(
+        select(func.count(Appointment.id)).where(Appointment.patient_id == patient_id)
+    ).scalar()
+
+    last_visits = [last for _, _, last in risk_rows if last is not None]
+    return {
+        "total_visits": sum(count for _, count, _ in risk_rows),
+        "total_appointments": total_appointments or 0,
+        "risk_distribution": {level: count for level, count, _ in risk_rows if level},
+        "last_visit": max(last_visits).isoformat() if last_visits else None,
+    }
+
+
+def recent_note_digests(db: Session, patient_id: int, limit: int = 10, excerpt_chars: int = 300) -> List:
+    """(id, created_at, title, summary, excerpt) of the newest notes, reading only a prefix of each note's content."""
+    return db.execute(
+        select(Note.id, Note.created_at, Note.title, Note.summary,
+               func.substr(Note.content, 1, excerpt_chars).label("excerpt"))
+        .where(Note.patient_id == patient_id)
+        .order_by(Note.created_at.desc(), Note.id.desc())
+        .limit(limit)
+    ).all()
+
+
+def journey_context(patient: Patient, statistics: Dict, recent_notes: List) -> Tuple[str, str]:
+    """Patient header and recent-visit digest the journey summary prompt is built from."""
+    patient_info = f"""
+Patient: {patient.first_name} {patient.last_name}
+DOB: {patient.date_of_birth}
+MRN: {patient.medical_record_number}
+Allergies: {patient.allergies or 'None'}
+Medical History: {patient.medical_history or 'None'}
+
+Total Visits: {statistics["total_visits"]}
+Total Appointments: {statistics["total_appointments"]}
+    """
+    
+    # Each visit is represented by its AI summary once it has one, else by a content excerpt
+    recent_notes_summary = "\n\n".join([
+        f"{note.created_at.strftime('%Y-%m-%d')}: {note.title}\n{note.summary or (note.excerpt or '') + '...'}"
+        for note in recent_notes
+    ])
+    return patient_info, recent_notes_summary
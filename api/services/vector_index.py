@@ -0,0 +1,514 @@
+"""
+Persistent, incrementally updated vector index for note retrieval (RAG).
+
+Replaces the per-process LangChain FAISS store that was rebuilt from scratch and
+lost on restart. On-disk layout (VECTOR_INDEX_DIR, default .cache/vector_index):
+
+    vectors.<epoch>.f32  raw float32 rows, appended in place; every API/worker
+                         process memory-maps the same file instead of holding its own copy
+    meta.sqlite3         current epoch, (epoch, row) -> (note, chunk number) mapping,
+                         per-note content hashes, tombstones; no note text
+    index.lock           writer lock (flock) so concurrent workers don't interleave appends
+
+Only notes whose content hash changed are re-embedded. Updates and deletes
+tombstone the old rows; `compact()` writes the live rows to the next epoch's file
+and then swaps the epoch pointer, so a file is never rewritten under a process
+that has it mapped. Readers take the epoch, generation and tombstones from one
+SQLite snapshot and resolve rows within that epoch only: a search that races a
+compaction can come back short, never with another chunk's text.
+
+Chunk text is patient data and is not written to disk here: hits are rehydrated
+through `load_notes` (by default from the notes table) and re-split, and a note
+whose content hash no longer matches the indexed one is skipped until the next sync.
+Search is exact inner product over normalized vectors using faiss.knn on the
+mapped array when FAISS is installed, NumPy otherwise. Searches scoped to a
+patient only gather and score that patient's rows (looked up through an index on
+chunks.patient_id and cached per generation), so their cost follows the size of
+one patient's history rather than the whole corpus.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms fall back to the in-process lock
+    fcntl = None
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", ".cache/vector_index")
+COMPACT_DEAD_RATIO = float(os.getenv("VECTOR_INDEX_COMPACT_DEAD_RATIO", "0.3"))
+# Patient partitions up to this many chunks are scored with a plain NumPy dot product
+PARTITION_EXACT_MAX_ROWS = int(os.getenv("VECTOR_INDEX_PARTITION_EXACT_MAX_ROWS", "4096"))
+PARTITION_CACHE_SIZE = 1024
+# Bumped when the on-disk layout changes; an index in an older layout is dropped and re-synced
+SCHEMA_VERSION = "3"
+
+
+class RetrievedChunk(NamedTuple):
+    page_content: str
+    note_key: str
+    patient_id: Optional[int]
+    score: float
+
+
+def note_content_hash(note: Dict) -> str:
+    return hashlib.sha256(format_note_document(note).encode("utf-8")).hexdigest()
+
+
+class _ReaderState(NamedTuple):
+    generation: int
+    epoch: int
+    vectors: "np.ndarray"
+    dead_rows: set
+
+
+def format_note_document(note: Dict) -> str:
+    text = f"Date: {note.get('date', 'N/A')}\n"
+    text += f"Type: {note.get('type', 'N/A')}\n"
+    text += f"Content: {note.get('content', '')}"
+    return text
+
+
+def note_index_document(note) -> Dict:
+    """The dict a `Note` (or a row with its id, patient_id, note_type, title, content, created_at) is indexed as."""
+    return {
+        "id": note.id,
+        "patient_id": note.patient_id,
+        "date": note.created_at.isoformat() if note.created_at else "N/A",
+        "type": note.note_type.value,
+        "content": f"{note.title}: {note.content}"
+    }
+
+
+def load_notes_from_db(note_keys: Sequence[str]) -> Dict[str, Dict]:
+    """Current index documents for `note_keys`, read from the notes table."""
+    from api.db.database import SessionLocal
+    from api.models.note import Note
+
+    note_ids = [int(key) for key in note_keys if key.isdigit()]
+    if not note_ids:
+        return {}
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            Note.id, Note.patient_id, Note.note_type, Note.title, Note.content, Note.created_at
+        ).filter(Note.id.in_(note_ids)).all()
+        return {str(row.id): note_index_document(row) for row in rows}
+    finally:
+        db.close()
+
+
+class NoteVectorIndex:
+    """
+    Disk-backed note index. Notes are dicts with `id`, `content` and optionally
+    `patient_id`, `date` and `type`. `load_notes` maps note ids back to those
+    dicts when hits are returned, so a note without an id is rejected.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embed_documents: Callable[[List[str]], List[List[float]]],
+        embed_query: Callable[[str], List[float]],
+        split_text: Callable[[str], List[str]],
+        load_notes: Callable[[Sequence[str]], Dict[str, Dict]] = load_notes_from_db,
+    ):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is required for the vector index")
+        self.directory = directory
+        self.embed_documents = embed_documents
+        self.embed_query = embed_query
+        self.split_text = split_text
+        self.load_notes = load_notes
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._thread_lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "meta.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._init_schema()
+        # Reader state, refreshed whenever another process changes the index
+        self._reader: Optional[_ReaderState] = None
+        self._partitions: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def _init_schema(self):
+        with self._writer():
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            version = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if version is None or version[0] != SCHEMA_VERSION:
+                # The index only mirrors the notes table; the next sync re-embeds from the embedding cache
+                self._conn.executescript("DROP TABLE IF EXISTS chunks; DROP TABLE IF EXISTS notes; DELETE FROM meta;")
+                for name in os.listdir(self.directory):
+                    if name.startswith("vectors.") and ".f32" in name:
+                        self._remove_file(os.path.join(self.directory, name))
+            self._conn.executescript(
+                f"""
+                CREATE TABLE IF NOT EXISTS notes (
+                    note_key TEXT PRIMARY KEY, patient_id INTEGER, content_hash TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS chunks (
+                    epoch INTEGER NOT NULL, row INTEGER NOT NULL, note_key TEXT NOT NULL, patient_id INTEGER,
+                    chunk INTEGER NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (epoch, row));
+                CREATE INDEX IF NOT EXISTS ix_chunks_note_key ON chunks (note_key);
+                CREATE INDEX IF NOT EXISTS ix_chunks_patient ON chunks (epoch, patient_id, deleted);
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', '0');
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', '0');
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('schema', '{SCHEMA_VERSION}');
+                """
+            )
+            self._conn.commit()
+
+    def _vectors_path(self, epoch: int) -> str:
+        return os.path.join(self.directory, f"vectors.{epoch}.f32")
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # --- writes ---------------------------------------------------------------
+
+    @contextmanager
+    def _writer(self):
+        """Serialize writers across threads and processes."""
+        with self._thread_lock:
+            with open(self._lock_path, "a+") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                except BaseException:
+                    self._conn.rollback()
+                    raise
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def upsert_notes(self, notes: Iterable[Dict]) -> Dict[str, int]:
+        """Embed new or changed notes; unchanged notes are skipped by content hash."""
+        with self._writer():
+            stored = dict(self._conn.execute("SELECT note_key, content_hash FROM notes"))
+            changed = []
+            unchanged = 0
+            for note in notes:
+                key = self._note_key(note)
+                content_hash = note_content_hash(note)
+                if stored.get(key) == content_hash:
+                    unchanged += 1
+                else:
+                    changed.append((key, content_hash, note))
+
+            if changed:
+                self._write_notes(changed)
+            return {"embedded": len(changed), "unchanged": unchanged, "deleted": 0}
+
+    def sync_notes(self, notes: Iterable[Dict]) -> Dict[str, int]:
+        """Make the index match `notes` exactly: upsert them and delete every other note."""
+        notes = list(notes)
+        stats = self.upsert_notes(notes)
+        keep = {self._note_key(note) for note in notes}
+        with self._writer():
+            stale = [key for (key,) in self._conn.execute("SELECT note_key FROM notes") if key not in keep]
+        stats["deleted"] = self.delete_notes(stale)
+        return stats
+
+    def delete_notes(self, note_keys: Iterable) -> int:
+        keys = [str(key) for key in note_keys]
+        if not keys:
+            return 0
+        with self._writer():
+            self._tombstone(keys)
+            self._conn.executemany("DELETE FROM notes WHERE note_key = ?", [(key,) for key in keys])
+            self._bump_generation()
+            self._conn.commit()
+            self._maybe_compact()
+        return len(keys)
+
+    def _write_notes(self, changed: List) -> None:
+        chunk_rows = []
+        texts = []
+        for key, _, note in changed:
+            for number, text in enumerate(self.split_text(format_note_document(note))):
+                chunk_rows.append((key, note.get("patient_id"), number))
+                texts.append(text)
+
+        epoch = self._epoch()
+        vectors = self._embed_chunks(texts)
+        start_row = self._append_vectors(vectors, epoch)
+
+        self._tombstone([key for key, _, _ in changed])
+        self._conn.executemany(
+            "INSERT INTO chunks (epoch, row, note_key, patient_id, chunk) VALUES (?, ?, ?, ?, ?)",
+            [(epoch, start_row + offset, key, patient_id, number)
+             for offset, (key, patient_id, number) in enumerate(chunk_rows)]
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO notes (note_key, patient_id, content_hash) VALUES (?, ?, ?)",
+            [(key, note.get("patient_id"), content_hash) for key, content_hash, note in changed]
+        )
+        self._bump_generation()
+        self._conn.commit()
+        self._maybe_compact()
+
+    def _embed_chunks(self, texts: List[str]):
+        if not texts:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        return self._normalize(np.asarray(self.embed_documents(texts), dtype=np.float32))
+
+    def _append_vectors(self, vectors, epoch: int) -> int:
+        """Append rows to the epoch's vector file and return the row number of the first one."""
+        if len(vectors) == 0:
+            return self._row_count(epoch)
+        if self.dimension is None:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(vectors.shape[1]),))
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dimension}")
+        start_row = self._row_count(epoch)
+        with open(self._vectors_path(epoch), "ab") as handle:
+            handle.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        return start_row
+
+    def _tombstone(self, keys: List[str]) -> None:
+        self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE note_key = ?", [(key,) for key in keys])
+
+    def _bump_generation(self) -> None:
+        self._conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+
+    def _maybe_compact(self) -> None:
+        total, dead = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(deleted), 0) FROM chunks WHERE epoch = ?", (self._epoch(),)
+        ).fetchone()
+        if total and dead / total > COMPACT_DEAD_RATIO:
+            self._compact_locked()
+
+    def compact(self) -> None:
+        """Rewrite the vector file without tombstoned rows."""
+        with self._writer():
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        epoch = self._epoch()
+        live = self._conn.execute(
+            "SELECT row FROM chunks WHERE epoch = ? AND deleted = 0 ORDER BY row", (epoch,)
+        ).fetchall()
+        live_rows = np.array([row for (row,) in live], dtype=np.int64)
+        vectors = self._open_vectors(epoch)
+        new_epoch = epoch + 1
+        tmp_path = self._vectors_path(new_epoch) + ".tmp"
+        with open(tmp_path, "wb") as handle:
+            if len(live_rows):
+                handle.write(np.ascontiguousarray(vectors[live_rows]).tobytes())
+        os.replace(tmp_path, self._vectors_path(new_epoch))
+
+        # Live chunks are renumbered under the new epoch; the pointer moves in the same commit
+        self._conn.executemany(
+            "INSERT INTO chunks (epoch, row, note_key, patient_id, chunk) "
+            "SELECT ?, ?, note_key, patient_id, chunk FROM chunks WHERE epoch = ? AND row = ?",
+            [(new_epoch, new_row, epoch, int(old_row)) for new_row, old_row in enumerate(live_rows)]
+        )
+        self._conn.execute("DELETE FROM chunks WHERE epoch = ?", (epoch,))
+        self._conn.execute("UPDATE meta SET value = ? WHERE key = 'epoch'", (str(new_epoch),))
+        self._bump_generation()
+        self._conn.commit()
+        # Processes that still map the old file keep their pages until they refresh
+        self._remove_file(self._vectors_path(epoch))
+
+    # --- reads ----------------------------------------------------------------
+
+    def _fetchone(self, sql: str, params: Sequence = ()):
+        with self._thread_lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    @property
+    def dimension(self) -> Optional[int]:
+        row = self._fetchone("SELECT value FROM meta WHERE key = 'dim'")
+        return int(row[0]) if row else None
+
+    def _generation(self) -> int:
+        return int(self._fetchone("SELECT value FROM meta WHERE key = 'generation'")[0])
+
+    def _epoch(self) -> int:
+        return int(self._fetchone("SELECT value FROM meta WHERE key = 'epoch'")[0])
+
+    def _row_count(self, epoch: int) -> int:
+        dim = self.dimension
+        path = self._vectors_path(epoch)
+        if not dim or not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (dim * 4)
+
+    def _open_vectors(self, epoch: int):
+        """Memory-map the epoch's vector file (read-only, shared through the OS page cache)."""
+        rows = self._row_count(epoch)
+        try:
+            if rows:
+                return np.memmap(self._vectors_path(epoch), dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        except FileNotFoundError:
+            pass  # compacted away since the snapshot; the next search maps the new epoch
+        return np.zeros((0, self.dimension or 0), dtype=np.float32)
+
+    def _refresh_reader(self) -> _ReaderState:
+        reader = self._reader
+        if reader is not None and reader.generation == self._generation():
+            return reader
+        with self._thread_lock:
+            # One read transaction, so the epoch and tombstones belong to the same generation
+            self._conn.execute("BEGIN")
+            try:
+                generation = int(self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+                epoch = int(self._conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0])
+                dead = self._conn.execute("SELECT row FROM chunks WHERE epoch = ? AND deleted = 1", (epoch,)).fetchall()
+            finally:
+                self._conn.commit()
+            reader = _ReaderState(generation, epoch, self._open_vectors(epoch), {row for (row,) in dead})
+            self._partitions.clear()
+            self._reader = reader
+            return reader
+
+    def is_ready(self) -> bool:
+        return self._fetchone("SELECT 1 FROM chunks WHERE deleted = 0 LIMIT 1") is not None
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 3,
+        patient_id: Optional[int] = None,
+        exclude_note_keys: Iterable = (),
+    ) -> List[RetrievedChunk]:
+        """
+        Top-k chunks for `query`. With `patient_id` only that patient's chunks
+        are scanned; `exclude_note_keys` drops chunks of the given notes
+        (typically the note being summarized).
+        """
+        reader = self._refresh_reader()
+        vectors, dead_rows = reader.vectors, reader.dead_rows
+        if len(vectors) == 0:
+            return []
+        excluded = {str(key) for key in exclude_note_keys}
+        query_vector = self._normalize(np.asarray([self.embed_query(query)], dtype=np.float32))
+
+        if patient_id is not None:
+            return self._search_partition(reader, query_vector, patient_id, k, excluded)
+
+        rows, scores = self._top_k(vectors, query_vector, min(len(vectors), k + len(dead_rows)))
+        hits = [(row, score) for row, score in zip(rows, scores) if row not in dead_rows]
+        chunks = self._load_chunks(reader.epoch, hits)
+        return [chunk for chunk in chunks if chunk.note_key not in excluded][:k]
+
+    def _search_partition(self, reader: _ReaderState, query_vector, patient_id: int, k: int,
+                          excluded) -> List[RetrievedChunk]:
+        vectors = reader.vectors
+        rows, note_keys = self._partition(reader, patient_id)
+        if excluded:
+            keep = ~np.isin(note_keys, list(excluded))
+            rows = rows[keep]
+        rows = rows[rows < len(vectors)]
+        if len(rows) == 0:
+            return []
+
+        subset = vectors[rows]
+        k = min(k, len(rows))
+        if len(rows) <= PARTITION_EXACT_MAX_ROWS:
+            positions, scores = self._numpy_top_k(subset, query_vector, k)
+        else:
+            positions, scores = self._top_k(subset, query_vector, k)
+        hits = [(int(rows[position]), score) for position, score in zip(positions, scores)]
+        return self._load_chunks(reader.epoch, hits)
+
+    def _partition(self, reader: _ReaderState, patient_id: int):
+        """Live rows (and their note keys) for one patient in the reader's epoch, cached per generation."""
+        cache_key = (reader.generation, patient_id)
+        with self._thread_lock:
+            cached = self._partitions.get(cache_key)
+            if cached is not None:
+                self._partitions.move_to_end(cache_key)
+                return cached
+            found = self._conn.execute(
+                "SELECT row, note_key FROM chunks WHERE epoch = ? AND patient_id = ? AND deleted = 0 ORDER BY row",
+                (reader.epoch, patient_id)
+            ).fetchall()
+            partition = (
+                np.array([row for row, _ in found], dtype=np.int64),
+                np.array([note_key for _, note_key in found], dtype=object),
+            )
+            self._partitions[cache_key] = partition
+            while len(self._partitions) > PARTITION_CACHE_SIZE:
+                self._partitions.popitem(last=False)
+            return partition
+
+    @classmethod
+    def _top_k(cls, vectors, query_vector, k: int):
+        if FAISS_AVAILABLE:
+            scores, rows = faiss.knn(query_vector, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+            return [int(row) for row in rows[0] if row >= 0], [float(score) for score in scores[0]]
+        return cls._numpy_top_k(vectors, query_vector, k)
+
+    @staticmethod
+    def _numpy_top_k(vectors, query_vector, k: int):
+        scores = np.asarray(vectors @ query_vector[0])
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [int(row) for row in top], [float(scores[row]) for row in top]
+
+    def _load_chunks(self, epoch: int, hits: Sequence) -> List[RetrievedChunk]:
+        """Chunks for (row, score) hits; rows are only resolved within the epoch they were scored in."""
+        if not hits:
+            return []
+        placeholders = ",".join("?" * len(hits))
+        with self._thread_lock:
+            rows = self._conn.execute(
+                f"SELECT c.row, c.note_key, c.patient_id, c.chunk, n.content_hash FROM chunks c "
+                f"JOIN notes n ON n.note_key = c.note_key WHERE c.epoch = ? AND c.row IN ({placeholders})",
+                [epoch, *(row for row, _ in hits)]
+            ).fetchall()
+        by_row = {row: (note_key, patient_id, number) for row, note_key, patient_id, number, _ in rows}
+        indexed_hashes = {note_key: content_hash for _, note_key, _, _, content_hash in rows}
+
+        # Rehydrate the text from the current notes; one that changed since it was indexed is skipped
+        texts = {
+            key: self.split_text(format_note_document(note))
+            for key, note in self.load_notes(list(indexed_hashes)).items()
+            if note_content_hash(note) == indexed_hashes.get(key)
+        }
+        chunks = []
+        for row, score in hits:
+            if row not in by_row:
+                continue
+            note_key, patient_id, number = by_row[row]
+            if number < len(texts.get(note_key, ())):
+                chunks.append(RetrievedChunk(texts[note_key][number], note_key, patient_id, score))
+        return chunks
+
+    def stats(self) -> Dict:
+        notes, = self._fetchone("SELECT COUNT(*) FROM notes")
+        total, dead = self._fetchone("SELECT COUNT(*), COALESCE(SUM(deleted), 0) FROM chunks")
+        return {"notes": notes, "chunks": total - dead, "tombstoned_chunks": dead,
+                "dimension": self.dimension, "faiss": FAISS_AVAILABLE}
+
+    @staticmethod
+    def _note_key(note: Dict) -> str:
+        if note.get("id") is None:
+            raise ValueError("Indexed notes need an id to be rehydrated from")
+        return str(note["id"])
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
@@ -1,12 +1,14 @@
 """
 Background AI processing tasks using Celery
 """
+import asyncio
 from celery import current_task
 from api.tasks.celery_app import celery_app
 from api.agents.summarization_agent import SummarizationAgent
 from api.agents.risk_agent import RiskAssessmentAgent
+from api.services.batch_summarization import BatchSummarizationEngine
 from api.db.database import SessionLocal
-from api.models.note import Note
+from api.models.note import Note, NoteStatus
 from api.models.patient import Patient
 from api.models.audit import AuditLog, AuditAction
 from api.models.user import User
@@ -127,32 +129,24 @@ def batch_process_notes(self, note_ids: list, user_id: int):
             meta={"status": f"Processing {len(note_ids)} notes", "total": len(note_ids)}
         )
         
-        summarization_agent = SummarizationAgent()
-        results = []
-        
-        for i, note_id in enumerate(note_ids):
-            # Update progress
-            current_task.update_state(
-                state="PROGRESS",
-                meta={
-                    "status": f"Processing note {i+1}/{len(note_ids)}",
-                    "current": i + 1,
-                    "total": len(note_ids)
-                }
-            )
-            
-            note = db.query(Note).filter(Note.id == note_id).first()
-            if note:
-                patient = db.query(Patient).filter(Patient.id == note.patient_id).first()
-                if patient:
-                    result = summarization_agent.process_note(note, patient, db)
-                    results.append({
-                        "note_id": note_id,
-                        "success": result["success"],
-                        "summary": result.get("summary"),
-                        "risk_level": result.get("risk_level"),
-                        "error": result.get("error")
-                    })
+        engine = BatchSummarizationEngine()
+        
+        async def collect():
+            collected = []
+            async for result in engine.stream(db, note_ids):
+                collected.append(result)
+                # Update progress
+                current_task.update_state(
+                    state="PROGRESS",
+                    meta={
+                        "status": f"Processed note {len(collected)}/{len(note_ids)}",
+                        "current": len(collected),
+                        "total": len(note_ids)
+                    }
+                )
+            return collected
+        
+        results = asyncio.run(collect())
         
         # Log audit trail
         user = db.query(User).filter(User.id == user_id).first()
@@ -188,19 +182,23 @@ def update_vector_store():
     """
     db = SessionLocal()
     try:
-        from api.services.ai_service import MedicalAIService
-        ai_service = MedicalAIService()
+        from api.services.registry import get_ai_service
+        from api.services.vector_index import note_index_document
+        ai_service = get_ai_service()
         
-        # Get all notes for vector store
-        notes = db.query(Note).filter(Note.status == "finalized").all()
-        note_contents = [f"{note.title}: {note.content}" for note in notes]
+        # Finalized notes are the source of truth for the index; only columns the index needs are loaded
+        notes = db.query(
+            Note.id, Note.patient_id, Note.note_type, Note.title, Note.content, Note.created_at
+        ).filter(Note.status == NoteStatus.FINALIZED).all()
+        documents = [note_index_document(note) for note in notes]
         
-        # Update vector store
-        ai_service.add_documents_to_vector_store(note_contents)
+        # Embed new/changed notes and drop ones that are no longer finalized
+        stats = ai_service.create_vectorstore_from_notes(documents)
         
         return {
             "status": "completed",
-            "notes_processed": len(note_contents)
+            "notes_processed": len(documents),
+            **stats
         }
     
     except Exception as e:
@@ -209,3 +207,22 @@ def update_vector_store():
     
     finally:
         db.close()
+
+@celery_app.task
+def backfill_fallback_summaries(batch_size: int = 500):
+    """
+    Background task to precompute stored fallback summaries for existing notes
+    """
+    db = SessionLocal()
+    try:
+        from api.services.fallback_summary_service import backfill_fallback_summaries as run_backfill
+        
+        stats = run_backfill(db, batch_size=batch_size)
+        return {"status": "completed", **stats}
+    
+    except Exception as e:
+        logger.error(f"Error backfilling fallback summaries: {str(e)}")
+        return {"status": "error", "error": str(e)}
+    
+    finally:
+        db.close()
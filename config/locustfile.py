@@ -129,3 +129,31 @@ class ReadOnlyUser(HttpUser):
         if self.token:
             self.client.get("/appointments/", headers=self.headers)
 
+
+
+class LoginStormUser(HttpUser):
+    """
+    Hammers /auth/login to measure login p99 and how bcrypt load affects other
+    endpoints served by the same process. Run alongside the read mix, e.g.:
+
+        locust -f config/locustfile.py LoginStormUser ReadOnlyUser
+
+    Logins shed with 429 (hashing pool saturated) are reported under a
+    separate name so they don't skew the successful-login percentiles.
+    """
+    wait_time = between(0.1, 0.5)
+    weight = 1
+    
+    @task
+    def login(self):
+        with self.client.post(
+            "/auth/login",
+            json={
+                "email": "dr.williams@hospital.com",
+                "password": "password123"
+            },
+            catch_response=True
+        ) as response:
+            if response.status_code == 429:
+                response.request_meta["name"] = "/auth/login [429 shed]"
+                response.success()
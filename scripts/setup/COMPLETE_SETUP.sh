@@ -21,6 +21,7 @@ echo ""
 
 # Step 2: Check if we need to seed
 echo -e "${BLUE}Step 2: Checking database...${NC}"
+python -m api.db.migrations upgrade
 if [ ! -f "mednotes.db" ]; then
     echo -e "${YELLOW}Seeding database...${NC}"
     python api/seed_more_data.py
@@ -0,0 +1,155 @@
+"""
+Micro-benchmark for the deterministic note summarizer.
+
+Compares the original per-call implementation of
+MedicalAIService.build_structured_mock_summary with the compiled
+ClinicalRuleEngine (single and batch API) and reports notes per second.
+
+Usage:
+    python scripts/testing/benchmark_rule_engine.py [--notes 5000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from api.services.clinical_rules import default_rule_engine
+
+SAMPLE_NOTES = [
+    "**Chief Complaint:** headache and fever for 3 days. **History of Present Illness:** "
+    "54 year old with hypertension and diabetes, glucose poorly controlled. Denies chest pain. "
+    "**Assessment:** likely viral infection, stable. **Plan:** CBC, follow up in one week.",
+    "Patient presents with chest pain radiating to left arm, onset 2 hours ago. "
+    "BP: 145/95, HR: 98. ECG shows normal sinus rhythm. Troponin pending.",
+    "Routine follow-up. Asthma well controlled on current inhaler, no wheezing. Continue plan.",
+    "**Reason for Admission:** shortness of breath. **Physical Examination:** bilateral crackles. "
+    "**Plan:** CT chest, diuresis, monitor closely. Condition unstable overnight.",
+    "Post-op day 2, wound clean, pain improved. Ambulating with assistance.",
+]
+
+
+def legacy_build_structured_mock_summary(content: str, note_type: str = "general") -> Dict:
+    """Pre-rule-engine implementation, kept verbatim as the benchmark baseline."""
+    import re
+
+    text = content or ""
+    lowered = text.lower()
+
+    # Extract key-value sections like **Reason for Admission:** headache
+    section_matches = re.findall(r"\*\*(.+?)\*\*\s*:?\s*([^*]+)", text)
+    sections = {key.strip().lower(): value.strip() for key, value in section_matches}
+
+    def first_sentence_fallback(raw: str) -> str:
+        sentences = re.split(r"(?<=[.!?])\s+", raw.strip())
+        trimmed = " ".join(sentences[:2]).strip()
+        return trimmed or raw.strip()
+
+    summary_parts = []
+    label_map = {
+        "reason for admission": "Admission",
+        "chief complaint": "Chief complaint",
+        "history of present illness": "HPI",
+        "past medical history": "PMH",
+        "physical examination": "Exam",
+        "assessment": "Assessment",
+        "plan": "Plan"
+    }
+    for key, label in label_map.items():
+        if key in sections and sections[key]:
+            summary_parts.append(f"{label}: {sections[key]}")
+
+    if not summary_parts:
+        summary_parts.append(first_sentence_fallback(text))
+
+    summary_text = " ".join(summary_parts)
+    if len(summary_text) > 320:
+        summary_text = summary_text[:317].rstrip() + "..."
+
+    # Keyword-driven recommendations
+    recommendations = []
+    def add_rec(rec: str):
+        if rec and rec not in recommendations:
+            recommendations.append(rec)
+
+    if any(word in lowered for word in ["chest pain", "shortness of breath", "dyspnea"]):
+        add_rec("Obtain ECG/troponin and monitor vitals closely; escalate if pain worsens.")
+    if "fever" in lowered or "infection" in lowered:
+        add_rec("Check CBC and cultures if indicated; start antipyretics and hydration.")
+    if "headache" in lowered:
+        add_rec("Assess neuro status; consider imaging if red flags (sudden/severe, neuro deficits).")
+    if "mri" in lowered or "ct" in lowered:
+        add_rec("Confirm imaging order and follow up on results with the patient.")
+    if "diabetes" in lowered or "glucose" in lowered:
+        add_rec("Reinforce glucose control, medication adherence, and foot care education.")
+    if "hypertension" in lowered or "bp" in lowered:
+        add_rec("Review antihypertensive regimen and home BP logs; adjust if persistently elevated.")
+    if "asthma" in lowered or "wheezing" in lowered:
+        add_rec("Assess inhaler technique; ensure rescue inhaler available; monitor for triggers.")
+
+    if not recommendations:
+        add_rec("Monitor symptoms, document changes, and schedule follow-up if no improvement.")
+
+    recommendations_text = " • ".join(recommendations)
+
+    # Simple risk heuristic
+    risk_level = "medium"
+    if any(word in lowered for word in ["chest pain", "severe", "critical", "dyspnea", "unstable"]):
+        risk_level = "high"
+    elif any(word in lowered for word in ["routine", "stable", "well controlled", "improved"]):
+        risk_level = "low"
+
+    key_findings = "; ".join(summary_parts[:3])
+
+    return {
+        "summary": summary_text,
+        "key_findings": key_findings or "Key findings pending AI analysis",
+        "assessment": sections.get("assessment", "Manual review required"),
+        "recommendations": recommendations_text,
+        "risk_level": risk_level,
+        "ai_generated": False,
+        "mock": True
+    }
+
+
+def _time(label: str, fn: Callable[[List[str]], List[Dict]], notes: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(notes)
+        best = min(best, time.perf_counter() - start)
+    rate = len(notes) / best
+    print(f"{label:<28} {rate:>12,.0f} notes/s  ({best * 1000:.1f} ms for {len(notes)} notes)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    # Every note is unique so the batch API's de-duplication does not flatter the numbers
+    notes = [
+        " ".join(random.sample(SAMPLE_NOTES, k=random.randint(1, 3))) + f" Encounter {i}."
+        for i in range(args.notes)
+    ]
+
+    mismatches = sum(
+        1 for note in notes
+        if legacy_build_structured_mock_summary(note) != default_rule_engine.evaluate(note)
+    )
+    print(f"Output mismatches vs. legacy: {mismatches}")
+
+    before = _time("legacy (per call)", lambda batch: [legacy_build_structured_mock_summary(n) for n in batch], notes, args.repeat)
+    after = _time("rule engine (per call)", lambda batch: [default_rule_engine.evaluate(n) for n in batch], notes, args.repeat)
+    batch = _time("rule engine (batch)", default_rule_engine.evaluate_many, notes, args.repeat)
+    print(f"Speed-up: {after / before:.2f}x per call, {batch / before:.2f}x batch")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,8 @@ os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DB_FILE.name}"
 
 from api.main import app
 from api.db.database import Base, get_db, engine
+from api.db.async_database import SyncSessionAdapter, get_async_db
+from api.db.routing import get_async_read_db, get_read_db
 from api.models import user, patient, note, appointment, audit
 from api.deps import get_password_hash
 
@@ -32,6 +34,12 @@ test_engine = create_engine(
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
 
 
+def pytest_configure(config):
+    """Register the suite's markers; config/pytest.ini is only read when passed with -c"""
+    for marker in ("unit: Unit tests", "integration: Integration tests", "slow: Slow running tests"):
+        config.addinivalue_line("markers", marker)
+
+
 @pytest.fixture(scope="function")
 def db():
     """Create a fresh database for each test"""
@@ -61,8 +69,14 @@ def client(db):
         finally:
             pass
     
-    # Override database dependency to use test database
+    async def override_get_async_db():
+        yield SyncSessionAdapter(db)
+    
+    # Override database dependencies to use test database
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
     
     # Store current user for auth override (will be set by auth_headers fixture)
     current_test_user = [None]  # Use list to allow modification
@@ -89,6 +103,27 @@ def client(db):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def real_async_db(client):
+    """Serve get_async_db/get_async_read_db from a real aiosqlite AsyncSession on the test database"""
+    pytest.importorskip("aiosqlite")
+    pytest.importorskip("greenlet")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    
+    # NullPool: TestClient runs each request on its own event loop, so no connection outlives one
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_FILE.name}", poolclass=NullPool)
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    
+    async def override_get_async_db():
+        async with session_factory() as session:
+            yield session
+    
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
+    yield session_factory
+
+
 @pytest.fixture
 def test_user(db):
     """Create a test user"""
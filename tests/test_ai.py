@@ -0,0 +1,1020 @@
+"""
+Unit tests for the AI service layer and agents (no OpenAI access required)
+"""
+import pytest
+
+from api.services.clinical_rules import ClinicalRuleEngine, KeywordRule, default_rule_engine
+
+
+def test_rule_engine_extracts_sections_and_risk():
+    """Test section extraction, keyword recommendations and risk level"""
+    result = default_rule_engine.evaluate(
+        "**Chief Complaint**: chest pain for 2 hours **Assessment**: possible ACS **Plan**: ECG, troponin"
+    )
+    assert result["summary"].startswith("Chief complaint: chest pain for 2 hours")
+    assert result["assessment"] == "possible ACS"
+    assert result["risk_level"] == "high"
+    assert "ECG/troponin" in result["recommendations"]
+    assert result["mock"] is True
+
+
+def test_rule_engine_defaults_without_keywords():
+    """Test fallback summary and recommendation when nothing matches"""
+    result = default_rule_engine.evaluate("Patient seen today. Discussed diet. Will call back next week.")
+    assert result["summary"] == "Patient seen today. Discussed diet."
+    assert result["risk_level"] == "medium"
+    assert result["recommendations"].startswith("Monitor symptoms")
+
+
+def test_rule_engine_shares_keywords_between_rules():
+    """Test that one keyword can trigger a recommendation and the risk rule"""
+    engine = ClinicalRuleEngine(
+        recommendation_rules=(KeywordRule(("dyspnea",), "Check oxygen saturation."),),
+        high_risk_keywords=("dyspnea",),
+        low_risk_keywords=("stable",),
+    )
+    result = engine.evaluate("New dyspnea overnight, previously stable.")
+    assert result["recommendations"] == "Check oxygen saturation."
+    assert result["risk_level"] == "high"
+
+
+def test_rule_engine_batch_matches_single():
+    """Test that the batch API returns the same results as per-note evaluation"""
+    notes = ["Routine visit, stable.", "Fever and infection suspected.", "Routine visit, stable.", None]
+    batch = default_rule_engine.evaluate_many(notes)
+    assert batch == [default_rule_engine.evaluate(note) for note in notes]
+    assert batch[0] is not batch[2]
+
+
+class _SlowAIService:
+    """Fake AI service whose calls each take a fixed amount of time"""
+    
+    def __init__(self, delay=0.3, fail_risk=False):
+        self.delay = delay
+        self.fail_risk = fail_risk
+    
+    def summarize_note(self, note_content, note_type="general", patient_context="", patient_id=None, note_id=None):
+        import time
+        time.sleep(self.delay)
+        return {"summary": "LLM summary", "key_findings": "fever", "recommendations": "Hydrate"}
+    
+    def assess_risk(self, note_content, patient_history=None):
+        import time
+        time.sleep(self.delay)
+        if self.fail_risk:
+            raise RuntimeError("risk model unavailable")
+        return {"risk_level": "HIGH", "recommendations": "Escalate"}
+    
+    def generate_nurse_recommendations(self, note_content, patient_context=""):
+        import time
+        time.sleep(self.delay)
+        return {"nursing_actions": "Vitals q4h"}
+
+
+def _make_note(db, patient, user, content="Fever since yesterday, severe headache.", note_type="nurse_note"):
+    from api.models.note import Note
+    
+    note = Note(
+        patient_id=patient.id,
+        author_id=user.id,
+        note_type=note_type,
+        title="AI Test Note",
+        content=content
+    )
+    db.add(note)
+    db.commit()
+    db.refresh(note)
+    return note
+
+
+def test_process_note_runs_ai_calls_concurrently(db, test_patient, test_user):
+    """Test that summary, risk and nursing calls overlap instead of running back to back"""
+    import time
+    from api.agents.summarization_agent import SummarizationAgent
+    
+    note = _make_note(db, test_patient, test_user)
+    agent = SummarizationAgent(ai_service=_SlowAIService(delay=0.3))
+    
+    start = time.monotonic()
+    result = agent.process_note(note, test_patient, db)
+    elapsed = time.monotonic() - start
+    
+    assert result["success"] is True
+    assert result["partial"] is False
+    assert elapsed < 0.8
+    assert note.risk_level == "high"
+    assert "Nursing: Vitals q4h" in note.recommendations
+
+
+def test_aprocess_note_returns_partial_results(db, test_patient, test_user):
+    """Test that a failing call falls back instead of failing the whole note"""
+    import asyncio
+    from api.agents.summarization_agent import SummarizationAgent
+    
+    note = _make_note(db, test_patient, test_user)
+    agent = SummarizationAgent(ai_service=_SlowAIService(delay=0.05, fail_risk=True))
+    
+    result = asyncio.run(agent.aprocess_note(note, test_patient, db))
+    
+    assert result["success"] is True
+    assert result["partial"] is True
+    assert result["failed_calls"] == ["risk"]
+    assert result["summary"] == "LLM summary"
+    assert note.risk_level == "high"  # keyword fallback: "severe"
+
+
+def test_agents_share_one_ai_service():
+    """Test that agents and tasks reuse the registry's service instead of building their own"""
+    from api.agents.risk_agent import RiskAssessmentAgent
+    from api.agents.summarization_agent import SummarizationAgent
+    from api.services import registry
+    
+    registry.reset_registry()
+    try:
+        service = registry.get_ai_service()
+        assert SummarizationAgent().ai_service is service
+        assert RiskAssessmentAgent().ai_service is service
+        assert registry.get_ai_service() is service
+        assert registry.registry_stats()["ai_service_built"] is True
+    finally:
+        registry.reset_registry()
+
+
+def test_llm_cache_hits_on_normalized_input():
+    """Test that whitespace-only differences share a cache entry and stats are counted"""
+    from api.services.llm_cache import InMemoryLRUBackend, LLMResponseCache
+    
+    cache = LLMResponseCache(InMemoryLRUBackend(max_entries=10), ttl_seconds=60)
+    key = cache.make_key("gpt-4o-mini", 0.1, "note_summary:1", ["Patient  has\nfever"])
+    assert cache.get(key) is None
+    cache.set(key, '{"summary": "Fever"}')
+    
+    same_key = cache.make_key("gpt-4o-mini", 0.1, "note_summary:1", ["Patient has fever"])
+    assert same_key == key
+    assert cache.get(same_key) == '{"summary": "Fever"}'
+    assert cache.make_key("gpt-4o-mini", 0.7, "note_summary:1", ["Patient has fever"]) != key
+    assert cache.make_key("gpt-4o-mini", 0.1, "note_summary:2", ["Patient has fever"]) != key
+    json_mode = {"type": "json_object"}
+    assert cache.make_key("gpt-4o-mini", 0.1, "note_summary:1", ["Patient has fever"], json_mode) != key
+    
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_llm_cache_lru_and_ttl_eviction():
+    """Test size-based and time-based eviction in the in-process backend"""
+    import time
+    from api.services.llm_cache import InMemoryLRUBackend
+    
+    backend = InMemoryLRUBackend(max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert backend.stats()["evictions"] == 1
+    
+    backend.set("short", "x", ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get("short") is None
+
+
+def test_llm_cache_sqlite_backend(tmp_path):
+    """Test that the disk backend persists entries and enforces its size bound"""
+    from api.services.llm_cache import SQLiteBackend
+    
+    path = str(tmp_path / "llm_cache.sqlite3")
+    backend = SQLiteBackend(path, max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.set("c", "3")
+    
+    reopened = SQLiteBackend(path, max_entries=2)
+    assert reopened.get("a") is None
+    assert reopened.get("c") == "3"
+    assert reopened.stats()["entries"] == 2
+
+
+def test_llm_cache_persistent_backends_encrypt_phi(tmp_path, monkeypatch):
+    """Test that the sqlite backend needs an encryption key and never stores plaintext responses"""
+    import sqlite3
+    from cryptography.fernet import Fernet
+    from api.services.llm_cache import build_llm_cache_from_env
+    
+    path = str(tmp_path / "llm_cache.sqlite3")
+    monkeypatch.setenv("LLM_CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("LLM_CACHE_PATH", path)
+    monkeypatch.delenv("LLM_CACHE_ENCRYPTION_KEY", raising=False)
+    assert build_llm_cache_from_env().stats()["backend"] == "memory"
+    
+    monkeypatch.setenv("LLM_CACHE_ENCRYPTION_KEY", Fernet.generate_key().decode())
+    cache = build_llm_cache_from_env()
+    cache.set("k", "Patient John Doe reports chest pain")
+    assert cache.get("k") == "Patient John Doe reports chest pain"
+    assert cache.stats()["backend"] == "sqlite" and cache.stats()["encrypted"]
+    
+    (stored,) = sqlite3.connect(path).execute("SELECT value FROM llm_cache").fetchone()
+    assert "John Doe" not in stored
+    
+    # Entries written under a rotated key read as misses
+    monkeypatch.setenv("LLM_CACHE_ENCRYPTION_KEY", Fernet.generate_key().decode())
+    assert build_llm_cache_from_env().get("k") is None
+
+
+def test_batch_summarize_streams_ndjson(client, auth_headers, db, test_patient, test_user):
+    """Test that batch results stream one line per note and are committed in bulk"""
+    import json
+    from api.models.note import Note
+    
+    note_ids = [
+        _make_note(db, test_patient, test_user, content=content, note_type="doctor_note").id
+        for content in ["Routine follow-up, stable.", "Severe chest pain on exertion."]
+    ]
+    
+    response = client.post(
+        "/ai/batch-summarize?stream=true",
+        headers=auth_headers,
+        json={"note_ids": note_ids + [99999]}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert lines[-1] == {"event": "done", "processed": 2}
+    assert sorted(line["note_id"] for line in lines[:-1]) == sorted(note_ids)
+    assert all(line["success"] for line in lines[:-1])
+    
+    db.expire_all()
+    risk_levels = {note.id: note.risk_level for note in db.query(Note).filter(Note.id.in_(note_ids))}
+    assert risk_levels == {note_ids[0]: "low", note_ids[1]: "high"}
+
+
+def test_batch_stream_commits_results_before_yielding(db, test_patient, test_user):
+    """Test that a result already sent is persisted even if the client stops reading"""
+    import asyncio
+    from api.agents.summarization_agent import SummarizationAgent
+    from api.models.note import Note
+    from api.services.batch_summarization import BatchSummarizationEngine
+    
+    note_ids = [_make_note(db, test_patient, test_user).id for _ in range(3)]
+    engine = BatchSummarizationEngine(
+        agent=SummarizationAgent(ai_service=_SlowAIService(delay=0)), max_concurrency=1, rate_per_second=0
+    )
+    
+    async def first_result_then_disconnect():
+        stream = engine.stream(db, note_ids)
+        result = await stream.__anext__()
+        await stream.aclose()
+        return result
+    
+    result = asyncio.run(first_result_then_disconnect())
+    assert result["success"] is True
+    
+    db.expire_all()
+    assert db.get(Note, result["note_id"]).summary == result["summary"]
+    assert db.get(Note, result["note_id"]).risk_level == "high"
+
+
+def test_batch_summarize_json_response(client, auth_headers, db, test_patient, test_user):
+    """Test the non-streaming batch response shape"""
+    note = _make_note(db, test_patient, test_user)
+    
+    response = client.post("/ai/batch-summarize", headers=auth_headers, json={"note_ids": [note.id]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "Processed 1 notes"
+    assert data["results"][0]["note_id"] == note.id
+
+
+def _sse_events(response):
+    import json
+    return [json.loads(line[len("data: "):]) for line in response.text.split("\n\n") if line.startswith("data: ")]
+
+
+def test_json_section_parser_emits_sections_as_they_complete():
+    """Test that each top-level field is returned as soon as its value closes"""
+    from api.services.streaming import JSONSectionParser
+    
+    parser = JSONSectionParser()
+    assert parser.feed('```json\n{"chief_complaint": "Chest \\"tight') == []
+    assert parser.feed('ness\\" on exertion", "key_ev') == [("chief_complaint", 'Chest "tightness" on exertion')]
+    assert parser.feed('ents": [{"date": "2024-01-02", "event": "ECG [normal]"}], "visits": 3') == [
+        ("key_events", [{"date": "2024-01-02", "event": "ECG [normal]"}])
+    ]
+    assert parser.feed('}\n```') == [("visits", 3)]
+    assert parser.done
+    assert list(parser.sections) == ["chief_complaint", "key_events", "visits"]
+
+
+def test_stream_llm_caches_completed_stream():
+    """Test that a streamed response is cached and replayed on the next call"""
+    from types import SimpleNamespace
+    from api.services.ai_service import MedicalAIService
+    from api.services.llm_cache import InMemoryLRUBackend, LLMResponseCache
+    
+    class _StreamingLLM:
+        model_name, temperature, calls = "fake", 0.1, 0
+        
+        def stream(self, messages):
+            self.calls += 1
+            for token in ["Stable ", "angina, ", "follow up."]:
+                yield SimpleNamespace(content=token)
+    
+    service = MedicalAIService.__new__(MedicalAIService)
+    service.llm_cache = LLMResponseCache(InMemoryLRUBackend(max_entries=10), ttl_seconds=60)
+    llm = _StreamingLLM()
+    
+    assert list(service._stream_llm(llm, ["prompt"], "patient_summary")) == ["Stable ", "angina, ", "follow up."]
+    assert list(service._stream_llm(llm, ["prompt"], "patient_summary")) == ["Stable angina, follow up."]
+    assert llm.calls == 1
+
+
+def test_patient_summary_stream(client, auth_headers, db, test_patient, test_user):
+    """Test the SSE patient summary ends with the full text"""
+    _make_note(db, test_patient, test_user, content="Chest pain resolved after rest.")
+    
+    response = client.get(f"/ai/patient-summary/{test_patient.id}/stream", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    
+    events = _sse_events(response)
+    assert events[-1]["event"] == "done"
+    assert "".join(event["text"] for event in events if event["event"] == "token").strip() == events[-1]["summary"]
+    assert "Chest pain resolved" in events[-1]["summary"]
+
+
+def test_patient_timeline_stream_sends_sections(client, auth_headers, db, test_patient, test_user, monkeypatch):
+    """Test that the timeline is sent first and the chief complaint before the rest of the summary"""
+    import json
+    from api.routes import ai as ai_routes
+    
+    note = _make_note(db, test_patient, test_user)
+    document = json.dumps({"chief_complaint": "Fever and headache", "current_status": "Improving"})
+    
+    class _StreamingService:
+        def stream_patient_journey_summary(self, patient_info, recent_notes):
+            assert "Hypertension" in patient_info and "AI Test Note" in recent_notes
+            for start in range(0, len(document), 7):
+                yield document[start:start + 7]
+    
+    monkeypatch.setattr(ai_routes, "get_ai_service", lambda: _StreamingService())
+    response = client.get(f"/ai/patient-timeline/{test_patient.id}/stream", headers=auth_headers)
+    assert response.status_code == 200
+    
+    events = _sse_events(response)
+    assert events[0]["event"] == "timeline"
+    assert events[0]["timeline"][0]["id"] == note.id
+    assert events[0]["timeline"][0]["author"] == "Test User"
+    sections = [(event["name"], event["value"]) for event in events if event["event"] == "section"]
+    assert sections == [("chief_complaint", "Fever and headache"), ("current_status", "Improving")]
+    first_section = next(i for i, event in enumerate(events) if event["event"] == "section")
+    assert any(event["event"] == "token" for event in events[first_section + 1:])
+    assert events[-1] == {"event": "done", "ai_summary": json.loads(document)}
+
+
+def test_patient_timeline_stream_unknown_patient(client, auth_headers):
+    """Test 404 before any stream is opened"""
+    response = client.get("/ai/patient-timeline/99999/stream", headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_extract_json_object_is_string_aware():
+    """Test that braces inside strings and text around the object are ignored"""
+    from api.services.structured_output import extract_json_object
+    
+    text = 'Here you go:\n```json\n{"summary": "BP {high}", "items": [1, {"a": "]"}]}\n```\nThanks {x}'
+    assert extract_json_object(text) == ('{"summary": "BP {high}", "items": [1, {"a": "]"}]}', True)
+    assert extract_json_object('{"summary": "cut off') == ('{"summary": "cut off', False)
+    assert extract_json_object("no json here") == (None, False)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"a": True, "b": [1, 2,], }', {"a": True, "b": [1, 2]}),
+    ('{“risk_level”: “HIGH”, "note": "said “ok”"}', {"risk_level": "HIGH", "note": "said “ok”"}),
+    ('{"summary": "Chest pain, onset 2h', {"summary": "Chest pain, onset 2h"}),
+    ('{"risks": ["fall", "sepsis"', {"risks": ["fall", "sepsis"]}),
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+])
+def test_repair_json(raw, expected):
+    """Test local repair of common malformed and truncated outputs"""
+    from api.services.structured_output import repair_json
+    assert repair_json(raw) == expected
+
+
+def test_parse_structured_validates_into_typed_model():
+    """Test typed results, list coercion, risk normalization and validation failures"""
+    from api.schemas.ai_output import RiskAssessmentOutput
+    from api.services.structured_output import parse_structured
+    
+    parsed = parse_structured('Result: {"risk_level": "high ", "risk_factors": "smoker", "extra": 1}', RiskAssessmentOutput)
+    assert parsed.error is None and parsed.repaired is False
+    assert parsed.value.risk_level == "HIGH"
+    assert parsed.value.risk_factors == ["smoker"]
+    assert parsed.value.model_dump()["extra"] == 1
+    
+    assert parse_structured('{"risk_level": "HIGH", "risk_factors": ["a",]}', RiskAssessmentOutput).repaired is True
+    assert parse_structured('{"risk_level": "unclear"}', RiskAssessmentOutput).error.startswith("validation failed")
+
+
+class _ScriptedLLM:
+    """Fake chat model returning queued responses"""
+    
+    model_name, temperature = "fake", 0.1
+    
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+    
+    def invoke(self, messages):
+        from types import SimpleNamespace
+        self.calls += 1
+        return SimpleNamespace(content=self.responses.pop(0))
+
+
+def _structured_service(json_llm):
+    from api.services.ai_service import MedicalAIService
+    from api.services.llm_cache import InMemoryLRUBackend, LLMResponseCache
+    
+    service = MedicalAIService.__new__(MedicalAIService)
+    service.llm_cache = LLMResponseCache(InMemoryLRUBackend(max_entries=10), ttl_seconds=60)
+    service.json_llm = json_llm
+    # Plain prompt instead of LangChain message objects (not needed for these tests)
+    service._json_fix_messages = lambda content, output_model, error: [f"fix: {content}"]
+    return service
+
+
+def test_invoke_structured_repairs_without_recall():
+    """Test that a locally repairable answer costs no extra model call"""
+    from api.schemas.ai_output import MedicalEntitiesOutput
+    from api.services.structured_output import structured_output_metrics
+    
+    llm = _ScriptedLLM('{"symptoms": ["cough", "fever",], "medications": "ibuprofen"')
+    service = _structured_service(llm)
+    before = structured_output_metrics.stats().get("entity_extraction", {}).get("repaired", 0)
+    
+    result, _ = service._invoke_structured(llm, ["extract"], "entity_extraction", MedicalEntitiesOutput)
+    
+    assert result.symptoms == ["cough", "fever"]
+    assert result.medications == ["ibuprofen"]
+    assert llm.calls == 1
+    assert structured_output_metrics.stats()["entity_extraction"]["repaired"] == before + 1
+
+
+def test_invoke_structured_retries_with_fix_prompt_and_caches_fix():
+    """Test the single fix-up call, its metrics, and that the fixed answer replaces the cached one"""
+    from api.schemas.ai_output import RiskAssessmentOutput
+    from api.services.structured_output import structured_output_metrics
+    
+    main_llm = _ScriptedLLM("The patient is high risk.")
+    fixer = _ScriptedLLM('{"risk_level": "HIGH", "summary": "The patient is high risk."}')
+    service = _structured_service(fixer)
+    before = dict(structured_output_metrics.stats().get("risk_assessment", {}))
+    
+    result, _ = service._invoke_structured(main_llm, ["assess"], "risk_assessment", RiskAssessmentOutput)
+    assert result.risk_level == "HIGH"
+    again, _ = service._invoke_structured(main_llm, ["assess"], "risk_assessment", RiskAssessmentOutput)
+    assert again.risk_level == "HIGH"
+    assert (main_llm.calls, fixer.calls) == (1, 1)
+    
+    after = structured_output_metrics.stats()["risk_assessment"]
+    assert after["retried"] == before.get("retried", 0) + 1
+    assert after["recovered_by_retry"] == before.get("recovered_by_retry", 0) + 1
+    assert after["parsed"] == before.get("parsed", 0) + 1
+
+
+def test_invoke_structured_gives_up_after_retries():
+    """Test that an unusable answer returns None and counts as failed"""
+    from api.schemas.ai_output import TreatmentPlanOutput
+    from api.services.structured_output import structured_output_metrics
+    
+    service = _structured_service(_ScriptedLLM("still not json"))
+    before = structured_output_metrics.stats().get("treatment_plan", {}).get("failed", 0)
+    
+    result, content = service._invoke_structured(_ScriptedLLM("no json"), ["plan"], "treatment_plan", TreatmentPlanOutput)
+    
+    assert result is None and content == "no json"
+    assert structured_output_metrics.stats()["treatment_plan"]["failed"] == before + 1
+
+
+def _add_patient_notes(db, patient, user, count, summary=None, content="Routine follow-up, vitals stable."):
+    from datetime import datetime, timedelta
+    from api.models.note import Note
+    
+    start = datetime(2026, 1, 1, 9, 0)
+    notes = [
+        Note(
+            patient_id=patient.id,
+            author_id=user.id,
+            note_type="DOCTOR_NOTE",
+            title=f"Visit {i}",
+            content=content,
+            summary=summary,
+            created_at=start + timedelta(days=i)
+        )
+        for i in range(count)
+    ]
+    db.add_all(notes)
+    db.commit()
+    return notes
+
+
+class _RecordingRiskService:
+    """Fake AI service that records the risk prompts it receives"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def assess_risk(self, note_content, patient_history=None):
+        self.calls.append((note_content, patient_history))
+        return {"risk_level": "HIGH", "summary": "Worsening chest pain and dizziness"}
+
+
+def test_note_context_stops_at_token_budget(db, test_patient, test_user):
+    """Test that only the newest notes that fit the budget are included"""
+    from api.services.context_builder import TokenCounter, build_note_context
+    
+    _add_patient_notes(db, test_patient, test_user, 200, content="Chest pain on exertion. " * 200)
+    counter = TokenCounter()
+    
+    context = build_note_context(db, test_patient.id, token_budget=300, counter=counter)
+    
+    assert context.truncated is True
+    assert 0 < context.notes_included < 200
+    assert context.tokens <= 300
+    assert counter.count(context.text) <= 300
+    assert context.text.startswith("[2026-07-19] Visit 199:")
+    assert context.text.index("Visit 199") < context.text.index("Visit 198")
+
+
+def test_note_context_prefers_stored_summaries(db, test_patient, test_user):
+    """Test summary > fallback summary > compressed excerpt for each note"""
+    from api.models.note import NoteFallbackSummary
+    from api.services.context_builder import build_note_context
+    
+    long_content = "Shortness   of breath\n\nworsening overnight. " * 100
+    with_summary, with_fallback, raw = _add_patient_notes(db, test_patient, test_user, 3, content=long_content)
+    with_summary.summary = "AI: decompensated heart failure"
+    db.add(NoteFallbackSummary(note_id=with_fallback.id, content_hash="x", summary="Rules: dyspnea"))
+    db.commit()
+    
+    context = build_note_context(db, test_patient.id, token_budget=10_000)
+    
+    entries = context.text.split("\n\n")
+    assert context.truncated is False
+    assert context.notes_included == 3
+    assert entries[0].startswith("[2026-01-03] Visit 2: Shortness of breath worsening overnight.")
+    assert entries[0].endswith("…") and len(entries[0]) < 700
+    assert entries[1] == "[2026-01-02] Visit 1: Rules: dyspnea"
+    assert entries[2] == "[2026-01-01] Visit 0: AI: decompensated heart failure"
+
+
+def test_risk_report_sends_bounded_context(db, test_patient, test_user):
+    """Test that the risk prompt stays within budget however many notes the patient has"""
+    from api.agents.risk_agent import RiskAssessmentAgent
+    from api.services import context_builder
+    
+    _add_patient_notes(db, test_patient, test_user, 120, summary="Chest pain episode, troponin pending. " * 20)
+    service = _RecordingRiskService()
+    
+    report = RiskAssessmentAgent(ai_service=service).generate_patient_risk_report(test_patient.id, db)
+    
+    note_content, patient_history = service.calls[0]
+    assert "error" not in report
+    assert report["total_notes"] == 120
+    assert report["context_notes"] < 120
+    assert patient_history is None
+    assert context_builder.default_token_counter.count(note_content) < context_builder.RISK_CONTEXT_TOKEN_BUDGET + 200
+    assert {"Chest Pain", "Dizziness"} <= set(report["risks"])
+    assert len(report["trends"]) == 4
+    assert report["trends"][0]["week"] == "2026-04-27"
+
+
+def test_risk_state_updates_match_rebuild(client, auth_headers, db, test_patient):
+    """Test that note creation and summarization keep the stored state equal to a full rebuild"""
+    import json
+    from api.agents.summarization_agent import SummarizationAgent
+    from api.models.note import Note
+    from api.models.risk_state import PatientRiskState
+    from api.services.risk_state_service import rebuild_risk_state
+    
+    for title in ("Admission", "Day 2", "Day 3"):
+        response = client.post("/notes/", headers=auth_headers, json={
+            "patient_id": test_patient.id, "title": title,
+            "content": "Fever since yesterday, severe headache.", "note_type": "doctor_note"
+        })
+        assert response.status_code == 200
+    
+    agent = SummarizationAgent(ai_service=_SlowAIService(delay=0))
+    for note in db.query(Note).order_by(Note.id).limit(2):
+        agent.process_note(note, test_patient, db)
+    
+    state = db.get(PatientRiskState, test_patient.id)
+    db.refresh(state)
+    incremental = (state.note_count, state.last_note_id, state.risk_level, json.loads(state.weekly_counts))
+    
+    rebuild_risk_state(db, test_patient.id)
+    assert incremental == (state.note_count, state.last_note_id, state.risk_level, json.loads(state.weekly_counts))
+    assert incremental[0] == 3
+    assert incremental[2] == "HIGH"
+    assert list(incremental[3].values()) == [{"total": 3, "HIGH": 2}]
+
+
+def test_risk_report_reassesses_only_after_new_notes(client, auth_headers, db, test_patient, test_user):
+    """Test that the stored assessment is served until a newer note is written"""
+    from api.agents.risk_agent import RiskAssessmentAgent
+    
+    _add_patient_notes(db, test_patient, test_user, 3)
+    service = _RecordingRiskService()
+    agent = RiskAssessmentAgent(ai_service=service)
+    
+    first = agent.generate_patient_risk_report(test_patient.id, db)
+    second = agent.generate_patient_risk_report(test_patient.id, db)
+    
+    assert len(service.calls) == 1
+    assert first["reassessed"] is True and second["reassessed"] is False
+    assert second["summary"] == first["summary"]
+    assert second["last_assessment"] == first["last_assessment"]
+    
+    client.post("/notes/", headers=auth_headers, json={
+        "patient_id": test_patient.id, "title": "New event",
+        "content": "Acute confusion overnight.", "note_type": "nurse_note"
+    })
+    third = agent.generate_patient_risk_report(test_patient.id, db)
+    
+    assert len(service.calls) == 2
+    assert third["reassessed"] is True
+    assert third["total_notes"] == 4
+
+
+def test_high_risk_roster_follows_note_risk_changes(client, auth_headers, db, test_patient, test_user):
+    """Test one roster row per patient, CRITICAL first, kept in step with risk level changes"""
+    from datetime import date
+    from api.models.patient import Patient
+    from api.services.risk_state_service import record_note_risk
+    
+    other = Patient(patient_id="MRN-TEST-002", first_name="Jane", last_name="Roe",
+                    date_of_birth=date(1985, 5, 5), medical_record_number="MRN-TEST-002")
+    db.add(other)
+    db.commit()
+    
+    older, newer = _add_patient_notes(db, test_patient, test_user, 2)
+    (critical,) = _add_patient_notes(db, other, test_user, 1)
+    for note, level in ((older, "high"), (newer, "high"), (critical, "critical")):
+        previous, note.risk_level = note.risk_level, level
+        record_note_risk(db, note, previous)
+    db.commit()
+    
+    response = client.get("/ai/high-risk-patients?limit=10", headers=auth_headers)
+    assert response.status_code == 200
+    roster = response.json()["high_risk_patients"]
+    assert [(entry["patient_id"], entry["risk_level"], entry["last_note_title"]) for entry in roster] == [
+        ("MRN-TEST-002", "CRITICAL", "Visit 0"),
+        ("MRN-TEST-001", "HIGH", "Visit 1"),
+    ]
+    
+    # Downgrading the newest high-risk note falls back to the older one, then drops the patient
+    for note in (newer, older):
+        previous, note.risk_level = note.risk_level, "low"
+        record_note_risk(db, note, previous)
+        db.commit()
+        roster = client.get("/ai/high-risk-patients", headers=auth_headers).json()["high_risk_patients"]
+        if note is newer:
+            assert roster[1]["last_note_title"] == "Visit 0"
+    assert [entry["patient_id"] for entry in roster] == ["MRN-TEST-002"]
+
+
+def test_high_risk_roster_follows_note_title_edits(client, auth_headers, db, test_patient, test_user):
+    """Test that renaming the roster's newest high-risk note updates its title"""
+    from api.services.risk_state_service import record_note_risk
+    
+    older, newer = _add_patient_notes(db, test_patient, test_user, 2)
+    for note in (older, newer):
+        previous, note.risk_level = note.risk_level, "high"
+        record_note_risk(db, note, previous)
+    db.commit()
+    
+    # Renaming an older high-risk note leaves the roster alone
+    for note, title in ((older, "Renamed older"), (newer, "Renamed newer")):
+        response = client.put(f"/notes/{note.id}", json={"title": title}, headers=auth_headers)
+        assert response.status_code == 200
+    
+    roster = client.get("/ai/high-risk-patients", headers=auth_headers).json()["high_risk_patients"]
+    assert [entry["last_note_title"] for entry in roster] == ["Renamed newer"]
+
+
+def _add_appointments(db, patient, user, starts):
+    from datetime import timedelta
+    from api.models.appointment import Appointment
+    
+    appointments = [
+        Appointment(title=f"Follow-up {i}", patient_name="John Doe", patient_id=patient.id,
+                    appointment_type="Consultation", location="Clinic 4A", notes=f"Reason {i}",
+                    start_time=start, end_time=start + timedelta(minutes=30), created_by=user.id)
+        for i, start in enumerate(starts)
+    ]
+    db.add_all(appointments)
+    db.commit()
+    return appointments
+
+
+def test_patient_timeline_pages_merged_items(client, auth_headers, db, test_patient, test_user):
+    """Test UNION ALL merge order, cursor pages without gaps or repeats, and SQL statistics"""
+    from datetime import datetime
+    
+    notes = _add_patient_notes(db, test_patient, test_user, 3)  # Jan 1-3, 09:00
+    notes[2].risk_level = "high"
+    db.commit()
+    _add_appointments(db, test_patient, test_user, [datetime(2026, 1, 2, 12, 0), datetime(2026, 1, 5, 8, 0)])
+    
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get(f"/ai/patient-timeline/{test_patient.id}", headers=auth_headers, params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["timeline"]) <= 2
+        seen.extend(data["timeline"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    
+    assert [(item["type"], item["title"]) for item in seen] == [
+        ("appointment", "Follow-up 1"), ("note", "Visit 2"), ("appointment", "Follow-up 0"),
+        ("note", "Visit 1"), ("note", "Visit 0"),
+    ]
+    assert seen[0]["reason"] == "Reason 1" and "content" not in seen[0]
+    assert seen[1]["author"] == "Test User" and seen[1]["risk_level"] == "high"
+    assert data["statistics"]["total_visits"] == 3
+    assert data["statistics"]["total_appointments"] == 2
+    assert data["statistics"]["risk_distribution"] == {"high": 1}
+    assert data["statistics"]["last_visit"].startswith("2026-01-03T09:00")
+
+
+def test_patient_timeline_window_and_projection(client, auth_headers, db, test_patient, test_user):
+    """Test since/until windows, fields= projection and rejected parameters"""
+    _add_patient_notes(db, test_patient, test_user, 5)
+    url = f"/ai/patient-timeline/{test_patient.id}"
+    
+    response = client.get(url, headers=auth_headers, params={
+        "since": "2026-01-02T00:00:00", "until": "2026-01-04T00:00:00", "fields": "title,risk_level"
+    })
+    assert response.status_code == 200
+    timeline = response.json()["timeline"]
+    assert [item["title"] for item in timeline] == ["Visit 2", "Visit 1"]
+    assert set(timeline[0]) == {"type", "id", "date", "title", "risk_level"}
+    
+    assert client.get(url, headers=auth_headers, params={"fields": "title,password"}).status_code == 400
+    assert client.get(url, headers=auth_headers, params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+class _CountingSummaryService:
+    """Fake enabled AI service that numbers each summary it generates"""
+    
+    enabled = True
+    
+    def __init__(self):
+        self.summary_calls = []
+        self.journey_calls = []
+    
+    def generate_patient_summary(self, patient_name, notes, fallback=True):
+        self.summary_calls.append(notes)
+        return f"Overview {len(self.summary_calls)}: {len(notes)} notes"
+    
+    def generate_patient_journey_summary(self, patient_info, recent_notes):
+        self.journey_calls.append(recent_notes)
+        return f"Journey {len(self.journey_calls)}"
+
+
+def test_patient_summary_is_stored_and_regenerated_after_note_changes(client, auth_headers, db, test_patient, test_user, monkeypatch):
+    """Test that page views get the stored summary and a new note triggers one background regeneration"""
+    from api.models.ai_summary import PatientAISummary
+    from api.routes import ai as ai_routes
+    
+    _add_patient_notes(db, test_patient, test_user, 2)
+    service = _CountingSummaryService()
+    monkeypatch.setattr(ai_routes, "get_ai_service", lambda: service)
+    url = f"/ai/patient-summary/{test_patient.id}"
+    
+    first = client.post(url, headers=auth_headers).json()
+    second = client.post(url, headers=auth_headers).json()
+    assert first["summary"] == second["summary"] == "Overview 1: 2 notes"
+    assert second["stale"] is False
+    assert len(service.summary_calls) == 1
+    
+    client.post("/notes/", headers=auth_headers, json={
+        "patient_id": test_patient.id, "title": "New event",
+        "content": "Acute confusion overnight.", "note_type": "nurse_note"
+    })
+    
+    # Served the last good summary; the regeneration ran as a background task after the response
+    third = client.post(url, headers=auth_headers).json()
+    assert third["summary"] == "Overview 1: 2 notes" and third["stale"] is True
+    assert len(service.summary_calls) == 2
+    assert service.summary_calls[-1][0] == "Acute confusion overnight."
+    
+    db.expire_all()
+    entry = db.get(PatientAISummary, (test_patient.id, "summary"))
+    assert entry.stale is False and entry.content == "Overview 2: 3 notes"
+    assert client.post(url, headers=auth_headers).json()["summary"] == "Overview 2: 3 notes"
+
+
+def test_patient_summary_regeneration_skips_llm_for_unchanged_notes(db, test_patient, test_user):
+    """Test that an invalidation without a change to the covered notes only clears the stale flag"""
+    from api.models.ai_summary import PatientAISummary
+    from api.services.patient_summary_cache import (
+        invalidate_patient_summaries,
+        read_patient_summary,
+        regenerate_patient_summary,
+    )
+    
+    _add_patient_notes(db, test_patient, test_user, 2)
+    service = _CountingSummaryService()
+    read_patient_summary(db, test_patient, "journey", service)
+    
+    invalidate_patient_summaries(db, test_patient.id)
+    db.commit()
+    assert read_patient_summary(db, test_patient, "journey", service).stale is True
+    
+    assert regenerate_patient_summary(test_patient.id, "journey", service) is True
+    db.expire_all()
+    entry = db.get(PatientAISummary, (test_patient.id, "journey"))
+    assert len(service.journey_calls) == 1
+    assert entry.stale is False and entry.content == "Journey 1"
+
+
+def test_failed_regeneration_backs_off_before_retrying(db, test_patient, test_user, monkeypatch):
+    """Test that an LLM outage doesn't turn every stale read into another LLM call"""
+    from api.services import patient_summary_cache
+    from api.services.patient_summary_cache import (
+        invalidate_patient_summaries,
+        read_patient_summary,
+        regenerate_patient_summary,
+    )
+    
+    class _FailingSummaryService(_CountingSummaryService):
+        def generate_patient_journey_summary(self, patient_info, recent_notes):
+            super().generate_patient_journey_summary(patient_info, recent_notes)
+            raise RuntimeError("LLM unavailable")
+    
+    notes = _add_patient_notes(db, test_patient, test_user, 2)
+    read_patient_summary(db, test_patient, "journey", _CountingSummaryService())
+    notes[0].title = "Edited"
+    invalidate_patient_summaries(db, test_patient.id)
+    db.commit()
+    
+    failing = _FailingSummaryService()
+    assert regenerate_patient_summary(test_patient.id, "journey", failing) is True
+    assert regenerate_patient_summary(test_patient.id, "journey", failing) is False
+    assert len(failing.journey_calls) == 1
+    
+    monkeypatch.setattr(patient_summary_cache, "SUMMARY_REGENERATION_RETRY_SECONDS", 0)
+    recovered = _CountingSummaryService()
+    assert regenerate_patient_summary(test_patient.id, "journey", recovered) is True
+    assert len(recovered.journey_calls) == 1
+    assert (test_patient.id, "journey") not in patient_summary_cache._failed_at
+
+
+def test_patient_timeline_serves_stored_journey_summary(client, auth_headers, db, test_patient, test_user, monkeypatch):
+    """Test that paging the timeline does not call the LLM again"""
+    from api.routes import ai as ai_routes
+    
+    _add_patient_notes(db, test_patient, test_user, 3, summary="Stable, continue current plan.")
+    service = _CountingSummaryService()
+    monkeypatch.setattr(ai_routes, "get_ai_service", lambda: service)
+    url = f"/ai/patient-timeline/{test_patient.id}"
+    
+    first = client.get(url, headers=auth_headers, params={"limit": 2}).json()
+    second = client.get(url, headers=auth_headers, params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    
+    assert first["ai_summary"] == second["ai_summary"] == "Journey 1"
+    assert second["ai_summary_stale"] is False
+    assert len(service.journey_calls) == 1
+    assert "Visit 2\nStable, continue current plan." in service.journey_calls[0]
+
+
+def test_appointment_and_patient_edits_refresh_stored_summaries(client, auth_headers, db, test_patient, test_user, monkeypatch):
+    """Test that non-note prompt inputs (appointment counts, patient name) invalidate and change the fingerprint"""
+    from api.routes import ai as ai_routes
+    
+    _add_patient_notes(db, test_patient, test_user, 2, summary="Stable.")
+    service = _CountingSummaryService()
+    monkeypatch.setattr(ai_routes, "get_ai_service", lambda: service)
+    timeline_url = f"/ai/patient-timeline/{test_patient.id}"
+    summary_url = f"/ai/patient-summary/{test_patient.id}"
+    client.get(timeline_url, headers=auth_headers)
+    client.post(summary_url, headers=auth_headers)
+    
+    response = client.post("/appointments/", headers=auth_headers, json={
+        "title": "Follow-up", "patient_name": "John Doe", "patient_id": test_patient.id,
+        "appointment_type": "Consultation", "location": "Clinic 4A",
+        "start_time": "2026-02-01T09:00:00", "end_time": "2026-02-01T09:30:00"
+    })
+    assert response.status_code == 201
+    assert client.get(timeline_url, headers=auth_headers).json()["ai_summary_stale"] is True
+    # Same notes, but the appointment count in the prompt changed, so the LLM ran again
+    assert len(service.journey_calls) == 2
+    assert client.get(timeline_url, headers=auth_headers).json()["ai_summary"] == "Journey 2"
+    
+    client.put(f"/patients/{test_patient.id}", headers=auth_headers, json={"first_name": "Jonathan"})
+    assert client.post(summary_url, headers=auth_headers).json()["stale"] is True
+    assert len(service.summary_calls) == 2
+    assert client.post(summary_url, headers=auth_headers).json()["summary"] == "Overview 2: 2 notes"
+
+
+def test_ai_routes_on_real_async_session(client, auth_headers, real_async_db, db, test_patient, test_user, monkeypatch):
+    """Test the /ai routes against a real aiosqlite AsyncSession rather than the sync adapter"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from api.agents.risk_agent import RiskAssessmentAgent
+    from api.db import async_database
+    from api.models.ai_summary import PatientAISummary
+    from api.routes import ai as ai_routes
+    
+    _add_patient_notes(db, test_patient, test_user, 3, summary="Stable, continue current plan.")
+    service = _CountingSummaryService()
+    risk_service = _RecordingRiskService()
+    monkeypatch.setattr(ai_routes, "get_ai_service", lambda: service)
+    monkeypatch.setattr(ai_routes, "get_risk_agent", lambda: RiskAssessmentAgent(ai_service=risk_service))
+    sessions = []
+    run_session_sync = async_database.run_session_sync
+    
+    async def recording_run_session_sync(session, fn, *args, **kwargs):
+        sessions.append(type(session))
+        return await run_session_sync(session, fn, *args, **kwargs)
+    
+    monkeypatch.setattr(ai_routes, "run_session_sync", recording_run_session_sync)
+    
+    summary = client.post(f"/ai/patient-summary/{test_patient.id}", headers=auth_headers)
+    assert summary.status_code == 200
+    assert summary.json()["summary"] == "Overview 1: 3 notes"
+    
+    timeline = client.get(f"/ai/patient-timeline/{test_patient.id}", headers=auth_headers, params={"limit": 2})
+    assert timeline.status_code == 200
+    assert [item["title"] for item in timeline.json()["timeline"]] == ["Visit 2", "Visit 1"]
+    assert timeline.json()["ai_summary"] == "Journey 1"
+    
+    report = client.get(f"/ai/risk-report/{test_patient.id}", headers=auth_headers)
+    assert report.status_code == 200
+    assert report.json()["reassessed"] is True and len(risk_service.calls) == 1
+    
+    assert client.get("/ai/high-risk-patients", headers=auth_headers).status_code == 200
+    assert sessions and set(sessions) == {AsyncSession}
+    
+    # Written through the AsyncSession and visible to a separate sync connection
+    db.expire_all()
+    assert db.get(PatientAISummary, (test_patient.id, "summary")).content == "Overview 1: 3 notes"
+    assert db.get(PatientAISummary, (test_patient.id, "journey")).content == "Journey 1"
+
+
+def test_async_llm_calls_run_outside_a_transaction(real_async_db, db, test_patient, test_user):
+    """Test that the AsyncSession gives its connection back before the model is awaited"""
+    import asyncio
+    from api.agents.risk_agent import RiskAssessmentAgent
+    from api.services.patient_summary_cache import aread_patient_summary
+    
+    _add_patient_notes(db, test_patient, test_user, 3)
+    sessions, in_transaction = [], []
+    
+    class _CheckingRiskService(_RecordingRiskService):
+        def assess_risk(self, note_content, patient_history=None):
+            in_transaction.append(sessions[-1].in_transaction())
+            return super().assess_risk(note_content, patient_history)
+    
+    class _CheckingSummaryService(_CountingSummaryService):
+        def generate_patient_summary(self, patient_name, notes, fallback=True):
+            in_transaction.append(sessions[-1].in_transaction())
+            return super().generate_patient_summary(patient_name, notes, fallback)
+    
+    async def run():
+        async with real_async_db() as session:
+            sessions.append(session)
+            report = await RiskAssessmentAgent(ai_service=_CheckingRiskService()).agenerate_patient_risk_report(
+                test_patient.id, session
+            )
+            patient = await session.get(type(test_patient), test_patient.id)
+            summary = await aread_patient_summary(session, patient, "summary", _CheckingSummaryService())
+            return report, summary
+    
+    report, summary = asyncio.run(run())
+    assert report["reassessed"] is True
+    assert summary.content == "Overview 1: 3 notes"
+    assert in_transaction == [False, False]
+
+
+def test_journey_summary_renders_sections():
+    """Test that the non-streaming journey summary is rendered as readable text"""
+    import json
+    from api.services.ai_service import MedicalAIService
+    
+    service = MedicalAIService.__new__(MedicalAIService)
+    service.enabled = True
+    document = json.dumps({
+        "chief_complaint": "Chest pain",
+        "key_events": [{"date": "2026-01-02", "event": "ECG normal"}, "Started aspirin"],
+    })
+    service.stream_patient_journey_summary = lambda patient_info, recent_notes: iter([document[:9], document[9:]])
+    
+    assert service.generate_patient_journey_summary("info", "notes") == (
+        "Chief Complaint: Chest pain\n\nKey Events:\n- 2026-01-02: ECG normal\n- Started aspirin"
+    )
@@ -99,3 +99,148 @@ def test_register_missing_fields(client):
     )
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
+
+
+def _use_real_auth(client):
+    """Drop the conftest auth overrides so requests go through JWT validation"""
+    from api.main import app
+    from api.deps import get_current_user, get_current_active_user
+    app.dependency_overrides.pop(get_current_user, None)
+    app.dependency_overrides.pop(get_current_active_user, None)
+
+
+def _login(client, email="test@example.com", password="testpassword123"):
+    response = client.post("/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_principal_lookup_runs_on_the_threadpool(client, test_user, monkeypatch):
+    """Test that a cache miss loads the user off the event loop and the token carries no authz claims"""
+    from jose import jwt
+    from api import deps
+    from api.services.auth_cache import principal_cache
+    
+    principal_cache.clear()
+    _use_real_auth(client)
+    headers = _login(client)
+    payload = jwt.decode(headers["Authorization"].split(" ", 1)[1], deps.SECRET_KEY, algorithms=[deps.ALGORITHM])
+    assert payload["sub"] == "test@example.com"
+    assert not {"uid", "role", "active"} & set(payload)
+    
+    offloaded = []
+    run_in_threadpool = deps.run_in_threadpool
+    
+    async def recording_run_in_threadpool(fn, *args, **kwargs):
+        offloaded.append(fn)
+        return await run_in_threadpool(fn, *args, **kwargs)
+    
+    monkeypatch.setattr(deps, "run_in_threadpool", recording_run_in_threadpool)
+    assert client.get("/patients/", headers=headers).status_code == status.HTTP_200_OK
+    assert offloaded == [deps.get_user_by_email]
+
+
+def test_authenticated_requests_reuse_cached_principal(client, test_user):
+    """Test that repeated requests with one token skip the user lookup"""
+    from sqlalchemy import event
+    from api.services.auth_cache import principal_cache
+    from tests.conftest import test_engine
+    
+    principal_cache.clear()
+    _use_real_auth(client)
+    headers = _login(client)
+    assert client.get("/patients/", headers=headers).status_code == status.HTTP_200_OK
+    
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(test_engine, "before_cursor_execute", listener)
+    try:
+        hits_before = principal_cache.hits
+        assert client.get("/patients/", headers=headers).status_code == status.HTTP_200_OK
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+    
+    assert principal_cache.hits == hits_before + 1
+    assert not any("FROM users" in statement for statement in statements)
+    assert principal_cache.stats()["hits"] >= 1
+
+
+def test_metrics_require_admin_or_metrics_token(client, db, test_user, monkeypatch):
+    """Test that /metrics is closed to anonymous and non-admin callers"""
+    from api import deps
+    from api.models.user import User, UserRole
+    
+    _use_real_auth(client)
+    assert client.get("/metrics").status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.get("/metrics", headers=_login(client)).status_code == status.HTTP_403_FORBIDDEN
+    
+    db.add(User(email="admin@example.com", hashed_password=deps.get_password_hash("adminpassword123"),
+                full_name="Admin", role=UserRole.ADMIN.value, is_active=True))
+    db.commit()
+    admin_headers = _login(client, "admin@example.com", "adminpassword123")
+    assert "auth_cache" in client.get("/metrics", headers=admin_headers).json()
+    
+    monkeypatch.setattr(deps, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics", headers={"X-Metrics-Token": "wrong"}).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.get("/metrics", headers={"X-Metrics-Token": "scrape-secret"}).status_code == status.HTTP_200_OK
+
+
+def test_deactivating_user_invalidates_cached_principal(client, db, test_user):
+    """Test that a cached principal is dropped when the user is deactivated"""
+    from api.services.auth_cache import principal_cache
+    
+    principal_cache.clear()
+    _use_real_auth(client)
+    headers = _login(client)
+    assert client.get("/patients/", headers=headers).status_code == status.HTTP_200_OK
+    
+    test_user.is_active = False
+    db.commit()
+    
+    response = client.get("/patients/", headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert principal_cache.stats()["invalidations"] >= 1
+
+
+def test_invalid_token_is_rejected(client, test_user):
+    """Test that a tampered token is not served from the cache"""
+    _use_real_auth(client)
+    headers = _login(client)
+    client.get("/patients/", headers=headers)
+    
+    tampered = {"Authorization": headers["Authorization"][:-4] + "AAAA"}
+    assert client.get("/patients/", headers=tampered).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_login_returns_429_when_hashing_pool_is_saturated(client, test_user, monkeypatch):
+    """Test that logins are shed with Retry-After once the hashing queue is full"""
+    from api.services import password_hashing
+    
+    pool = password_hashing.password_hash_pool
+    monkeypatch.setattr(pool, "pending", pool.max_pending)
+    rejected_before = pool.rejected
+    
+    response = client.post(
+        "/auth/login",
+        json={"email": "test@example.com", "password": "testpassword123"}
+    )
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+    assert pool.rejected == rejected_before + 1
+
+
+def test_password_hash_pool_runs_off_the_event_loop():
+    """Test that hashing calls run on pool threads and are counted"""
+    import asyncio
+    import threading
+    from api.services.password_hashing import PasswordHashPool
+    
+    pool = PasswordHashPool(workers=2, max_pending=2)
+    loop_thread = threading.get_ident()
+    
+    async def run():
+        return await asyncio.gather(*(pool.run(threading.get_ident) for _ in range(2)))
+    
+    thread_ids = asyncio.run(run())
+    assert loop_thread not in thread_ids
+    assert pool.stats()["completed"] == 2
+    assert pool.pending == 0
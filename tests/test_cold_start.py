@@ -0,0 +1,67 @@
+"""
+Cold-start budget: importing the app and serving /health must not load the AI stack
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# Generous default so slow CI machines pass; tighten per deployment target via env
+IMPORT_BUDGET_MS = float(os.getenv("COLD_START_IMPORT_BUDGET_MS", "3000"))
+DEFERRED_MODULES = (
+    "langchain_openai", "langchain_community", "langchain_core", "openai",
+    "faiss", "numpy", "tiktoken", "google.cloud.tasks_v2",
+)
+
+_COLD_START_SCRIPT = """
+import json, sys
+from fastapi.testclient import TestClient
+from api.main import app
+from api.routes import ai
+from api.services import registry
+
+response = TestClient(app).get("/health")
+print(json.dumps({
+    "status": response.status_code,
+    "loaded": sorted(name for name in sys.modules if name.split(".")[0] in %r or name.startswith("google.cloud.tasks")),
+    "ai_services_built": int(registry.registry_stats()["ai_service_built"]) + ai.get_summarization_agent.cache_info().currsize,
+}))
+"""
+
+
+def _run_cold(args, tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'cold.db'}", SKIP_CLOUD_TASKS="true")
+    return subprocess.run(
+        [sys.executable, *args], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def test_health_does_not_load_ai_stack(tmp_path):
+    """Test that /health on a fresh process imports no LLM, vector or Cloud Tasks libraries"""
+    top_level = tuple(sorted({module.split(".")[0] for module in DEFERRED_MODULES} - {"google"}))
+    result = _run_cold(["-c", _COLD_START_SCRIPT % (top_level,)], tmp_path)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["status"] == 200
+    assert report["loaded"] == []
+    assert report["ai_services_built"] == 0
+
+
+def test_app_import_time_within_budget(tmp_path):
+    """Test cumulative `import api.main` time from -X importtime against the budget"""
+    result = _run_cold(["-X", "importtime", "-c", "import api.main"], tmp_path)
+    cumulative_us = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            cumulative_us[name.strip()] = int(cumulative)
+
+    assert not [module for module in DEFERRED_MODULES if module in cumulative_us]
+    total_ms = cumulative_us["api.main"] / 1000
+    assert total_ms < IMPORT_BUDGET_MS, f"import api.main took {total_ms:.0f}ms (budget {IMPORT_BUDGET_MS:.0f}ms)"
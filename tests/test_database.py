@@ -0,0 +1,311 @@
+"""
+Unit tests for database engine configuration and schema migrations
+"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from api.db.indexes import hot_path_indexes
+from api.db.migrations import discover_migrations, status, upgrade
+from api.db.pooling import InstrumentedQueuePool, engine_pool_kwargs, pool_metrics
+
+
+def test_pool_kwargs_follow_environment(monkeypatch):
+    """Test pool sizing from env and pre-ping off by default"""
+    monkeypatch.delenv("VERCEL", raising=False)
+    monkeypatch.delenv("DB_POOL_MODE", raising=False)
+    monkeypatch.setenv("DB_POOL_SIZE", "7")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "3")
+    monkeypatch.setenv("DB_POOL_RECYCLE", "600")
+    
+    kwargs = engine_pool_kwargs("postgresql://db/mednotes")
+    assert kwargs["poolclass"] is InstrumentedQueuePool
+    assert (kwargs["pool_size"], kwargs["max_overflow"], kwargs["pool_recycle"]) == (7, 3, 600)
+    assert kwargs["pool_pre_ping"] is False
+
+
+@pytest.mark.parametrize("env", [{"VERCEL": "1"}, {"DB_POOL_MODE": "pgbouncer"}, {"DB_POOL_MODE": "null"}])
+def test_serverless_modes_disable_in_process_pooling(monkeypatch, env):
+    """Test that Vercel and PgBouncer deployments use NullPool"""
+    monkeypatch.delenv("DB_POOL_MODE", raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    assert engine_pool_kwargs("postgresql://db/mednotes")["poolclass"] is NullPool
+
+
+def test_pgbouncer_mode_disables_asyncpg_statement_caches(monkeypatch):
+    """Test that prepared statements are neither cached nor reused by name behind PgBouncer"""
+    from api.db.pooling import pgbouncer_connect_args
+    
+    monkeypatch.setenv("DB_POOL_MODE", "pgbouncer")
+    connect_args = pgbouncer_connect_args("postgresql+asyncpg://db/mednotes")
+    assert (connect_args["statement_cache_size"], connect_args["prepared_statement_cache_size"]) == (0, 0)
+    assert connect_args["prepared_statement_name_func"]() != connect_args["prepared_statement_name_func"]()
+    assert pgbouncer_connect_args("postgresql://db/mednotes") == {}
+    
+    monkeypatch.setenv("DB_POOL_MODE", "queue")
+    assert pgbouncer_connect_args("postgresql+asyncpg://db/mednotes") == {}
+
+
+def test_instrumented_pool_records_waits_and_timeouts(tmp_path):
+    """Test checkout counters, utilization and timeout accounting"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    held = engine.connect()
+    metrics = pool_metrics(engine)
+    assert metrics["checked_out"] == 1
+    assert metrics["utilization"] == 1.0
+    
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    held.close()
+    
+    metrics = pool_metrics(engine)
+    assert metrics["checkouts"] == 2
+    assert metrics["checkout_timeouts"] == 1
+    assert metrics["checkout_wait_ms_max"] >= 50
+    engine.dispose()
+
+
+def test_async_url_mapping():
+    """Test that sync URLs map to asyncpg/aiosqlite with libpq-only options moved to connect_args"""
+    from api.db.async_database import to_async_url
+    
+    url, connect_args = to_async_url("postgresql://u:p@host/db?sslmode=require&channel_binding=require")
+    assert url == "postgresql+asyncpg://u:p@host/db"
+    assert connect_args == {"ssl": "require"}
+    assert to_async_url("postgresql+psycopg2://u:p@host/db") == ("postgresql+asyncpg://u:p@host/db", {})
+    assert to_async_url("sqlite:///./test.db") == ("sqlite+aiosqlite:///./test.db", {})
+
+
+def test_sync_session_adapter_runs_queries_off_the_event_loop(db, test_patient):
+    """Test that the fallback adapter executes on a worker thread and buffers results"""
+    import asyncio
+    import threading
+    from sqlalchemy import event, select
+    from api.db.async_database import SyncSessionAdapter
+    from api.models.patient import Patient
+    from tests.conftest import test_engine
+    
+    threads = []
+    listener = lambda *args: threads.append(threading.get_ident())
+    event.listen(test_engine, "before_cursor_execute", listener)
+    
+    async def run():
+        session = SyncSessionAdapter(db)
+        result = await session.execute(select(Patient))
+        return threading.get_ident(), result.scalars().all(), await session.get(Patient, test_patient.id)
+    
+    try:
+        loop_thread, patients, fetched = asyncio.run(run())
+    finally:
+        event.remove(test_engine, "before_cursor_execute", listener)
+    
+    assert [patient.id for patient in patients] == [test_patient.id]
+    assert fetched.id == test_patient.id
+    assert threads and loop_thread not in threads
+
+
+def test_appointments_list_seeds_through_async_session(client, auth_headers):
+    """Test that the async appointments route seeds and returns sample appointments"""
+    response = client.get("/appointments/", headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == 4
+
+
+def test_appointments_seed_on_primary_not_replica(client, auth_headers, db, tmp_path):
+    """Test that demo seeding writes to the primary and is read back from it while the replica lags"""
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import sessionmaker
+    from api.db.async_database import SyncSessionAdapter
+    from api.db.database import Base
+    from api.db.routing import get_async_read_db
+    from api.main import app
+    from api.models.appointment import Appointment
+    
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica_engine)
+    replica = sessionmaker(bind=replica_engine)()
+    
+    async def override_get_async_read_db():
+        yield SyncSessionAdapter(replica)
+    
+    app.dependency_overrides[get_async_read_db] = override_get_async_read_db
+    try:
+        response = client.get("/appointments/", headers=auth_headers)
+    finally:
+        replica.close()
+    
+    assert response.status_code == 200
+    assert len(response.json()) == 4
+    assert db.scalar(select(func.count()).select_from(Appointment)) == 4
+    with replica_engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(Appointment)) == 0
+
+
+def _two_node_setup(tmp_path, lag=0.0):
+    """Primary and replica stand-ins as two SQLite files with one table each"""
+    from sqlalchemy import text
+    from api.db.routing import ReplicaRouter, ReplicaState, RoutingSession
+    
+    engines = {}
+    for name in ("primary", "replica"):
+        engines[name] = create_engine(f"sqlite:///{tmp_path / name}.db")
+        with engines[name].begin() as conn:
+            conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, source TEXT)"))
+            conn.execute(text("INSERT INTO items (source) VALUES (:source)"), {"source": name})
+    
+    probe_result = {"lag": lag}
+    
+    def probe(engine):
+        if isinstance(probe_result["lag"], Exception):
+            raise probe_result["lag"]
+        return probe_result["lag"]
+    
+    router = ReplicaRouter(engines["primary"], [ReplicaState(engines["replica"])], max_lag_seconds=5,
+                           check_interval=3600, read_your_writes_seconds=60, probe=probe)
+    session_class = type("TestRoutingSession", (RoutingSession,), {"router": router})
+    return router, session_class, probe_result
+
+
+def test_routing_session_reads_replica_and_writes_primary(tmp_path):
+    """Test that reads go to the replica until the session writes"""
+    from sqlalchemy import column, insert, table, text
+    
+    router, session_class, _ = _two_node_setup(tmp_path)
+    session = session_class()
+    assert session.execute(text("SELECT source FROM items")).scalar() == "replica"
+    
+    session.execute(insert(table("items", column("source"))).values(source="written"))
+    session.commit()
+    rows = session.execute(text("SELECT source FROM items ORDER BY id")).scalars().all()
+    assert rows == ["primary", "written"]
+    assert router.stats()["replica_reads"] == 1
+    session.close()
+
+
+def test_lagging_or_failing_replica_falls_back_to_primary(tmp_path):
+    """Test lag awareness: replicas behind the threshold or failing the probe are skipped"""
+    from sqlalchemy import text
+    
+    router, session_class, probe_result = _two_node_setup(tmp_path, lag=30.0)
+    assert session_class().execute(text("SELECT source FROM items")).scalar() == "primary"
+    
+    probe_result["lag"] = 0.5
+    router.refresh()
+    assert session_class().execute(text("SELECT source FROM items")).scalar() == "replica"
+    
+    probe_result["lag"] = RuntimeError("replica down")
+    router.refresh()
+    assert session_class().execute(text("SELECT source FROM items")).scalar() == "primary"
+    assert router.stats()["replicas"][0]["error"] == "replica down"
+
+
+def test_recent_writer_reads_from_primary(tmp_path):
+    """Test read-your-writes: a user who just wrote is pinned to the primary"""
+    from sqlalchemy import text
+    from api.db.routing import current_user_id
+    
+    router, session_class, _ = _two_node_setup(tmp_path)
+    router.note_write(42)
+    
+    token = current_user_id.set(42)
+    try:
+        assert session_class().execute(text("SELECT source FROM items")).scalar() == "primary"
+    finally:
+        current_user_id.reset(token)
+    assert session_class().execute(text("SELECT source FROM items")).scalar() == "replica"
+
+
+def test_async_primary_commit_pins_user_to_primary(db, monkeypatch):
+    """Test that a commit through get_async_db records the user's write like the sync session does"""
+    import asyncio
+    from datetime import date
+    from api.db import async_database
+    from api.db.routing import current_user_id, replica_router
+    from api.models.patient import Patient
+    
+    if async_database.AsyncSessionLocal is None:
+        pytest.skip("async driver not installed")
+    user_id = 424242
+    monkeypatch.setattr(replica_router, "replicas", [object()])
+    assert not replica_router.wrote_recently(user_id)
+    
+    async def write():
+        token = current_user_id.set(user_id)
+        try:
+            async for session in async_database.get_async_db():
+                session.add(Patient(patient_id="MRN-ASYNC-1", first_name="Ann", last_name="Lee",
+                                    date_of_birth=date(1970, 1, 1), medical_record_number="MRN-ASYNC-1"))
+                await session.commit()
+        finally:
+            current_user_id.reset(token)
+            await async_database.async_engine.dispose()
+    
+    asyncio.run(write())
+    assert replica_router.wrote_recently(user_id)
+    assert replica_router.choose_replica(user_id) is None
+
+
+def _index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+def test_migrations_create_schema_once(tmp_path):
+    """Test that upgrade builds a fresh database and is a no-op on the second run"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    versions = [migration.version for migration in discover_migrations()]
+    
+    assert upgrade(engine, log=lambda message: None) == versions
+    assert upgrade(engine, log=lambda message: None) == []
+    assert {"users", "patients", "notes", "schema_migrations"} <= set(inspect(engine).get_table_names())
+    assert "ix_notes_patient_created" in _index_names(engine, "notes")
+    assert all(row["applied_at"] is not None for row in status(engine))
+
+
+def test_migrations_stop_at_target(tmp_path):
+    """Test that --target leaves later versions pending"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'target.db'}")
+    assert upgrade(engine, target="0001", log=lambda message: None) == ["0001"]
+    assert [row["version"] for row in status(engine) if row["applied_at"] is None] == ["0002", "0003", "0004", "0005", "0006"]
+
+
+def test_migrations_upgrade_existing_database(tmp_path):
+    """Test that a database created by the old startup create_all gains indexes, fallback summaries, risk states, the roster and AI summaries"""
+    from api.db.database import Base
+    
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for index in hot_path_indexes():
+            conn.execute(text(f"DROP INDEX {index.name}"))
+        conn.execute(text(
+            "INSERT INTO users (id, email, hashed_password, full_name, role, is_active)"
+            " VALUES (1, 'dr@test.com', 'x', 'Dr Test', 'DOCTOR', 1)"
+        ))
+        conn.execute(text(
+            "INSERT INTO patients (id, patient_id, first_name, last_name, date_of_birth, medical_record_number)"
+            " VALUES (1, 'P1', 'Pat', 'Test', '1980-01-01', 'MRN1')"
+        ))
+        conn.execute(text(
+            "INSERT INTO notes (id, patient_id, author_id, note_type, title, content, status)"
+            " VALUES (1, 1, 1, 'DOCTOR_NOTE', 'Visit', 'Patient reports chest pain on exertion.', 'FINALIZED')"
+        ))
+        conn.execute(text("UPDATE notes SET risk_level = 'high' WHERE id = 1"
+        ))
+    assert "ix_notes_patient_created" not in _index_names(engine, "notes")
+    
+    upgrade(engine, log=lambda message: None)
+    
+    assert {index.name for index in hot_path_indexes() if index.table.name == "notes"} <= _index_names(engine, "notes")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM note_fallback_summaries")).scalar() == 1
+        assert conn.execute(text("SELECT note_count FROM patient_risk_states WHERE patient_id = 1")).scalar() == 1
+        assert conn.execute(text("SELECT last_note_id FROM high_risk_roster WHERE patient_id = 1")).scalar() == 1
+    assert "patient_ai_summaries" in inspect(engine).get_table_names()
@@ -128,3 +128,136 @@ def test_update_note_success(client, auth_headers, test_patient, test_user):
     assert data["title"] == "Updated Title"
     assert data["content"] == "Updated content"
 
+
+
+def test_get_notes_includes_author_and_patient_names(client, auth_headers, test_patient, test_user):
+    """Test that the list view resolves author and patient names"""
+    client.post(
+        "/notes/",
+        headers=auth_headers,
+        json={
+            "patient_id": test_patient.id,
+            "title": "Named Note",
+            "content": "Patient stable, routine follow-up.",
+            "note_type": "doctor_note"
+        }
+    )
+    
+    response = client.get("/notes/", headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data[0]["author_name"] == "Test User"
+    assert data[0]["patient_name"] == "John Doe"
+
+
+def test_get_notes_keyset_pagination(client, auth_headers, test_patient, test_user):
+    """Test paging through notes with after_id instead of skip"""
+    for i in range(5):
+        client.post(
+            "/notes/",
+            headers=auth_headers,
+            json={
+                "patient_id": test_patient.id,
+                "title": f"Page Note {i}",
+                "content": f"Content {i}",
+                "note_type": "nurse_note"
+            }
+        )
+    
+    first_page = client.get("/notes/?limit=2", headers=auth_headers).json()
+    assert len(first_page) == 2
+    
+    second_page = client.get(
+        f"/notes/?limit=2&after_id={first_page[-1]['id']}",
+        headers=auth_headers
+    ).json()
+    assert len(second_page) == 2
+    
+    first_ids = {note["id"] for note in first_page}
+    second_ids = {note["id"] for note in second_page}
+    assert not first_ids & second_ids
+    assert max(second_ids) < min(first_ids)
+
+
+def test_get_notes_keyset_pagination_with_tied_timestamps(client, auth_headers, test_patient, test_user, db):
+    """Test that keyset pages neither skip nor repeat notes sharing a created_at"""
+    from datetime import datetime
+    from api.models.note import Note
+    
+    tied = datetime(2026, 3, 1, 9, 0)
+    # Ids run against created_at order: the newest note has the lowest id
+    db.add_all([
+        Note(patient_id=test_patient.id, author_id=test_user.id, note_type="NURSE_NOTE", title=f"Note {i}",
+             content=f"Content {i}", created_at=created_at)
+        for i, created_at in enumerate([datetime(2026, 3, 2), tied, tied, tied, datetime(2026, 2, 28)])
+    ])
+    db.commit()
+    expected = [note["id"] for note in client.get("/notes/?limit=10", headers=auth_headers).json()]
+    assert len(expected) == 5
+    
+    for with_created_at in (False, True):
+        seen, page = [], client.get("/notes/?limit=2", headers=auth_headers).json()
+        while page:
+            seen.extend(note["id"] for note in page)
+            params = {"limit": 2, "after_id": page[-1]["id"]}
+            if with_created_at:
+                params["after_created_at"] = page[-1]["created_at"]
+            page = client.get("/notes/", headers=auth_headers, params=params).json()
+        assert seen == expected
+    
+    half = client.get("/notes/", headers=auth_headers, params={"after_created_at": tied.isoformat()})
+    assert half.status_code == 422
+
+
+def test_fallback_summary_persisted_on_write(client, auth_headers, test_patient, test_user, db):
+    """Test that the rule-based summary is stored on create and refreshed on edit"""
+    from api.models.note import NoteFallbackSummary
+    
+    create_response = client.post(
+        "/notes/",
+        headers=auth_headers,
+        json={
+            "patient_id": test_patient.id,
+            "title": "Chest Pain",
+            "content": "Patient reports severe chest pain since morning.",
+            "note_type": "doctor_note"
+        }
+    )
+    note_id = create_response.json()["id"]
+    
+    stored = db.get(NoteFallbackSummary, note_id)
+    assert stored is not None
+    assert stored.risk_level == "high"
+    original_hash = stored.content_hash
+    
+    client.put(
+        f"/notes/{note_id}",
+        headers=auth_headers,
+        json={"content": "Routine visit, patient stable."}
+    )
+    db.refresh(stored)
+    assert stored.content_hash != original_hash
+    assert stored.risk_level == "low"
+    
+    listed = client.get("/notes/", headers=auth_headers).json()
+    assert listed[0]["risk_level"] == "low"
+
+
+def test_backfill_fallback_summaries(db, test_patient, test_user):
+    """Test that the backfill job fills in missing summaries and skips fresh ones"""
+    from api.models.note import Note, NoteFallbackSummary
+    from api.services.fallback_summary_service import backfill_fallback_summaries
+    
+    for i in range(3):
+        db.add(Note(
+            patient_id=test_patient.id,
+            author_id=test_user.id,
+            note_type="doctor_note",
+            title=f"Legacy Note {i}",
+            content="History of diabetes, glucose elevated."
+        ))
+    db.commit()
+    
+    assert backfill_fallback_summaries(db, batch_size=2) == {"scanned": 3, "written": 3}
+    assert db.query(NoteFallbackSummary).count() == 3
+    assert backfill_fallback_summaries(db, batch_size=2) == {"scanned": 3, "written": 0}
@@ -0,0 +1,228 @@
+"""
+Query-plan regression tests for the hot read paths.
+
+Every query below mirrors one issued by a route, agent or task. The SQLite suite
+always runs. The Postgres suite runs against PLAN_TEST_DATABASE_URL (a throwaway
+database; it is seeded with 1M notes on first use) and is marked slow.
+Either fails if a hot query falls back to a full table scan.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from api.db.database import Base
+from api.db.indexes import ensure_indexes
+from api.services.high_risk_roster import backfill_roster
+from api.models.appointment import Appointment
+from api.models.audit import AuditAction, AuditLog
+from api.models.note import Note, NoteStatus, NoteType
+from api.models.patient import Patient
+from api.models.risk_state import HighRiskRosterEntry
+from api.models.user import User, UserRole
+
+SCANNED_TABLES = ("notes", "appointments", "audit_logs", "high_risk_roster")
+NOW = datetime(2024, 6, 1)
+
+
+def hot_queries():
+    return {
+        # GET /notes (newest first, keyset pagination)
+        "notes_list": select(Note.id, Note.title, User.full_name, Patient.first_name)
+            .join(User, User.id == Note.author_id)
+            .join(Patient, Patient.id == Note.patient_id)
+            .order_by(Note.created_at.desc(), Note.id.desc())
+            .limit(100),
+        # GET /notes?patient_id=..., agent patient history, timeline
+        "notes_by_patient": select(Note.id, Note.title)
+            .where(Note.patient_id == 42)
+            .order_by(Note.created_at.desc())
+            .limit(5),
+        # GET /notes?note_type=...
+        "notes_by_type": select(Note.id)
+            .where(Note.note_type == NoteType.NURSE_NOTE)
+            .order_by(Note.created_at.desc())
+            .limit(100),
+        # RiskAssessmentAgent.get_high_risk_patients (materialized roster)
+        "high_risk_roster": select(HighRiskRosterEntry.patient_id, Patient.first_name)
+            .join(Patient, Patient.id == HighRiskRosterEntry.patient_id)
+            .order_by(HighRiskRosterEntry.risk_level, HighRiskRosterEntry.last_note_date.desc())
+            .limit(10),
+        # Draft queue (the full finalized-note sync in update_vector_store reads
+        # most of the table by design and is not a hot path)
+        "draft_notes": select(Note.id).where(Note.status == NoteStatus.DRAFT),
+        # GET /appointments?start=&end=
+        "appointments_window": select(Appointment.id)
+            .where(Appointment.start_time >= NOW, Appointment.start_time <= NOW + timedelta(days=7))
+            .order_by(Appointment.start_time.asc()),
+        # Patient timeline appointments
+        "appointments_by_patient": select(Appointment.id)
+            .where(Appointment.patient_id == 42)
+            .order_by(Appointment.start_time.desc()),
+        # Audit trail for a user
+        "audit_by_user": select(AuditLog.id)
+            .where(AuditLog.user_id == 1)
+            .order_by(AuditLog.created_at.desc())
+            .limit(50),
+    }
+
+
+def _compile(engine, statement) -> str:
+    return str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+
+# --- SQLite -------------------------------------------------------------------
+
+def _seed_sqlite(engine, notes=5000, patients=500):
+    rng = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"email": f"user{i}@test.com", "hashed_password": "x", "full_name": f"User {i}",
+                                     "role": UserRole.DOCTOR, "is_active": True} for i in range(1, 11)])
+        conn.execute(insert(Patient), [{"patient_id": f"P{i}", "first_name": "Pat", "last_name": str(i),
+                                        "date_of_birth": datetime(1980, 1, 1).date(), "medical_record_number": f"MRN{i}"}
+                                       for i in range(1, patients + 1)])
+        conn.execute(insert(Note), [{
+            "patient_id": rng.randint(1, patients), "author_id": rng.randint(1, 10),
+            "note_type": rng.choice(list(NoteType)), "title": f"Note {i}", "content": "...",
+            "status": NoteStatus.DRAFT if rng.random() < 0.05 else NoteStatus.FINALIZED,
+            "risk_level": rng.choice(["LOW"] * 8 + ["MEDIUM"] * 3 + ["HIGH"]),
+            "created_at": NOW - timedelta(minutes=i),
+        } for i in range(notes)])
+        conn.execute(insert(Appointment), [{
+            "title": "Visit", "patient_name": "Pat", "patient_id": rng.randint(1, patients), "appointment_type": "Consult",
+            "location": "Clinic", "start_time": NOW + timedelta(hours=i - notes // 2), "end_time": NOW + timedelta(hours=i - notes // 2, minutes=30),
+            "created_by": 1,
+        } for i in range(notes)])
+        conn.execute(insert(AuditLog), [{
+            "user_id": rng.randint(1, 10), "action": AuditAction.READ, "resource_type": "note",
+            "created_at": NOW - timedelta(minutes=i),
+        } for i in range(notes)])
+    with Session(engine) as db:
+        backfill_roster(db)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+@pytest.fixture(scope="module")
+def sqlite_plan_engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    _seed_sqlite(engine)
+    yield engine
+    engine.dispose()
+
+
+def _sqlite_full_scans(engine, statement):
+    with engine.connect() as conn:
+        plan = [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + _compile(engine, statement)))]
+    # "SCAN notes" is a full table scan; "SCAN notes USING INDEX ..." walks an index in order
+    return [step for step in plan if step.split(" ")[0] == "SCAN" and step.split(" ")[1] in SCANNED_TABLES
+            and "USING" not in step], plan
+
+
+@pytest.mark.parametrize("name", sorted(hot_queries()))
+def test_sqlite_hot_query_uses_index(sqlite_plan_engine, name):
+    """Test that each hot query is answered from an index in SQLite"""
+    full_scans, plan = _sqlite_full_scans(sqlite_plan_engine, hot_queries()[name])
+    assert not full_scans, f"{name} does a full table scan: {plan}"
+
+
+def test_ensure_indexes_is_idempotent(sqlite_plan_engine):
+    """Test that re-running the index migration is a no-op"""
+    statements = ensure_indexes(sqlite_plan_engine)
+    assert all("IF NOT EXISTS" in statement for statement in statements)
+    with sqlite_plan_engine.connect() as conn:
+        names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert {"ix_notes_patient_created", "ix_appointments_start_time", "ix_audit_logs_user_created"} <= names
+
+
+# --- Postgres at 1M rows --------------------------------------------------------
+
+PLAN_TEST_DATABASE_URL = os.getenv("PLAN_TEST_DATABASE_URL")
+PG_NOTE_ROWS = 1_000_000
+
+
+def _seed_postgres(engine):
+    with engine.begin() as conn:
+        notes_seeded = conn.execute(select(func.count()).select_from(Note.__table__)).scalar() >= PG_NOTE_ROWS
+        roster_seeded = conn.execute(select(func.count()).select_from(HighRiskRosterEntry.__table__)).scalar() > 0
+    if notes_seeded and roster_seeded:
+        return
+    if not notes_seeded:
+        _seed_postgres_tables(engine)
+    with Session(engine) as db:
+        backfill_roster(db)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+
+
+def _seed_postgres_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "TRUNCATE audit_logs, appointments, high_risk_roster, patient_risk_states,"
+            " note_fallback_summaries, notes, patients, users RESTART IDENTITY CASCADE"
+        ))
+        conn.execute(text(
+            "INSERT INTO users (email, hashed_password, full_name, role, is_active)"
+            " SELECT 'user' || g || '@test.com', 'x', 'User ' || g, 'DOCTOR', true FROM generate_series(1, 100) g"
+        ))
+        conn.execute(text(
+            "INSERT INTO patients (patient_id, first_name, last_name, date_of_birth, medical_record_number)"
+            " SELECT 'P' || g, 'Pat', g::text, DATE '1980-01-01', 'MRN' || g FROM generate_series(1, 20000) g"
+        ))
+        conn.execute(text(
+            "INSERT INTO notes (patient_id, author_id, note_type, title, content, status, risk_level, created_at)"
+            " SELECT 1 + (random() * 19999)::int, 1 + (random() * 99)::int,"
+            " (CASE WHEN random() < 0.5 THEN 'DOCTOR_NOTE' ELSE 'NURSE_NOTE' END)::notetype,"
+            " 'Note ' || g, 'Clinical note content',"
+            " (CASE WHEN random() < 0.05 THEN 'DRAFT' ELSE 'FINALIZED' END)::notestatus,"
+            " (ARRAY['LOW','LOW','LOW','MEDIUM','MEDIUM','HIGH','CRITICAL'])[1 + (random() * 6)::int],"
+            " TIMESTAMPTZ '2024-06-01' - g * INTERVAL '30 seconds'"
+            f" FROM generate_series(1, {PG_NOTE_ROWS}) g"
+        ))
+        conn.execute(text(
+            "INSERT INTO appointments (title, patient_name, patient_id, appointment_type, location, start_time, end_time, created_by)"
+            " SELECT 'Visit', 'Pat', 1 + (random() * 19999)::int, 'Consult', 'Clinic',"
+            " TIMESTAMPTZ '2023-01-01' + g * INTERVAL '3 minutes', TIMESTAMPTZ '2023-01-01' + g * INTERVAL '3 minutes' + INTERVAL '30 minutes', 1"
+            " FROM generate_series(1, 500000) g"
+        ))
+        conn.execute(text(
+            "INSERT INTO audit_logs (user_id, action, resource_type, created_at)"
+            " SELECT 1 + (random() * 99)::int, 'READ', 'note', TIMESTAMPTZ '2024-06-01' - g * INTERVAL '10 seconds'"
+            f" FROM generate_series(1, {PG_NOTE_ROWS}) g"
+        ))
+
+
+def _seq_scans(node, found=None):
+    found = [] if found is None else found
+    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in SCANNED_TABLES:
+        found.append(node["Relation Name"])
+    for child in node.get("Plans", []):
+        _seq_scans(child, found)
+    return found
+
+
+@pytest.fixture(scope="module")
+def postgres_plan_engine():
+    if not PLAN_TEST_DATABASE_URL:
+        pytest.skip("PLAN_TEST_DATABASE_URL not set")
+    engine = create_engine(PLAN_TEST_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    _seed_postgres(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("name", sorted(hot_queries()))
+def test_postgres_hot_query_avoids_seq_scan_at_1m_rows(postgres_plan_engine, name):
+    """Test that each hot query avoids a sequential scan on a 1M-note Postgres database"""
+    with postgres_plan_engine.connect() as conn:
+        plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + _compile(postgres_plan_engine, hot_queries()[name]))).scalar()
+    seq_scans = _seq_scans(plan[0]["Plan"])
+    assert not seq_scans, f"{name} sequentially scans {seq_scans}: {plan}"
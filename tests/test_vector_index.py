@@ -0,0 +1,258 @@
+"""
+Tests for the persistent note vector index (no OpenAI access required)
+"""
+import pytest
+
+pytest.importorskip("numpy")
+
+from api.services.embedding_store import CachingEmbedder, EmbeddingStore
+from api.services.vector_index import NoteVectorIndex
+
+VOCABULARY = ("chest", "pain", "diabetes", "glucose", "asthma", "wheezing", "fever")
+
+
+class _KeywordEmbedder:
+    """Bag-of-words embedding over a tiny vocabulary; counts embedded texts."""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_one(self, text):
+        lowered = text.lower()
+        return [float(lowered.count(word)) for word in VOCABULARY] + [0.01]
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self.embed_one(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_one(text)
+
+
+NOTES = [
+    {"id": 1, "patient_id": 10, "date": "2024-01-01", "type": "progress", "content": "Chest pain on exertion"},
+    {"id": 2, "patient_id": 10, "date": "2024-01-02", "type": "progress", "content": "Diabetes, glucose 210"},
+    {"id": 3, "patient_id": 11, "date": "2024-01-03", "type": "progress", "content": "Asthma with wheezing"},
+]
+
+
+def _note_table(notes):
+    """Stands in for the notes table the index rehydrates chunk text from"""
+    by_key = {str(note["id"]): note for note in notes}
+    return lambda keys: {key: by_key[key] for key in keys if key in by_key}
+
+
+def _make_index(directory, embedder=None, notes=NOTES):
+    embedder = embedder or _KeywordEmbedder()
+    return NoteVectorIndex(
+        str(directory),
+        embed_documents=embedder.embed_documents,
+        embed_query=embedder.embed_query,
+        split_text=lambda text: [text],
+        load_notes=_note_table(notes),
+    ), embedder
+
+
+def test_unchanged_notes_are_not_reembedded(tmp_path):
+    """Test that syncing the same notes twice only embeds them once"""
+    index, embedder = _make_index(tmp_path)
+    assert index.sync_notes(NOTES) == {"embedded": 3, "unchanged": 0, "deleted": 0}
+    assert index.sync_notes(NOTES) == {"embedded": 0, "unchanged": 3, "deleted": 0}
+    assert embedder.embedded == 3
+    assert index.is_ready()
+
+
+def test_similarity_search_returns_closest_note(tmp_path):
+    """Test that search ranks the matching note first"""
+    index, _ = _make_index(tmp_path)
+    index.sync_notes(NOTES)
+    results = index.similarity_search("glucose control in diabetes", k=2)
+    assert results[0].note_key == "2"
+    assert results[0].patient_id == 10
+    assert "Diabetes" in results[0].page_content
+
+
+def test_updates_and_deletes_tombstone_old_rows(tmp_path):
+    """Test that changed and removed notes stop appearing in results"""
+    updated = [dict(NOTES[0], content="Fever overnight"), NOTES[1]]
+    index, embedder = _make_index(tmp_path, notes=updated)
+    index.sync_notes(NOTES)
+
+    stats = index.sync_notes(updated)
+    assert stats == {"embedded": 1, "unchanged": 1, "deleted": 1}
+    assert embedder.embedded == 4
+
+    keys = [hit.note_key for hit in index.similarity_search("chest pain asthma wheezing", k=5)]
+    assert "3" not in keys
+    assert index.similarity_search("fever", k=1)[0].note_key == "1"
+    assert index.stats()["notes"] == 2
+
+
+def test_index_persists_and_compacts(tmp_path):
+    """Test that a fresh process sees the index and compaction keeps live rows"""
+    index, _ = _make_index(tmp_path)
+    index.sync_notes(NOTES)
+    index.delete_notes([1])
+    index.compact()
+    assert index.stats()["tombstoned_chunks"] == 0
+
+    reopened, embedder = _make_index(tmp_path)
+    assert reopened.sync_notes(NOTES[1:])["embedded"] == 0
+    assert embedder.embedded == 0
+    assert reopened.similarity_search("asthma", k=1)[0].note_key == "3"
+    assert reopened.similarity_search("diabetes", k=1)[0].note_key == "2"
+
+
+def test_search_racing_a_compaction_never_returns_another_chunk(tmp_path, monkeypatch):
+    """Test that rows scored against a pre-compaction mapping are not resolved in the new numbering"""
+    writer, _ = _make_index(tmp_path)
+    writer.sync_notes(NOTES)
+    reader, _ = _make_index(tmp_path)
+    stale = reader._refresh_reader()
+
+    writer.delete_notes([1])
+    writer.compact()
+
+    # Row 1 is note 2 in the mapped file but note 3 after compaction
+    with monkeypatch.context() as patched:
+        patched.setattr(reader, "_refresh_reader", lambda: stale)
+        assert [hit.note_key for hit in reader.similarity_search("diabetes glucose", k=1)] in ([], ["2"])
+    assert reader.similarity_search("diabetes glucose", k=1)[0].note_key == "2"
+    assert reader.similarity_search("asthma", k=1, patient_id=11)[0].note_key == "3"
+
+
+def test_caching_embedder_only_sends_misses_in_batches(tmp_path):
+    """Test that cached chunks are reused and misses are batched and deduplicated"""
+    embedder = _KeywordEmbedder()
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+    cached = CachingEmbedder(embedder.embed_documents, model="test-model", store=store, batch_size=2)
+
+    first = cached.embed_documents(["chest pain", "fever", "asthma", "chest pain"])
+    assert first.shape == (4, len(VOCABULARY) + 1)
+    assert embedder.embedded == 3
+    assert cached.provider_calls == 2
+
+    cached.embed_documents(["fever", "asthma", "glucose"])
+    assert embedder.embedded == 4
+    assert cached.stats()["hits"] == 3
+
+    other_model = CachingEmbedder(embedder.embed_documents, model="other-model", store=store)
+    other_model.embed_documents(["fever"])
+    assert embedder.embedded == 5
+    assert store.count("test-model") == 4
+
+
+def test_rebuilt_index_reuses_cached_chunk_vectors(tmp_path):
+    """Test that rebuilding the index from scratch does not call the provider again"""
+    embedder = _KeywordEmbedder()
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+    cached = CachingEmbedder(embedder.embed_documents, model="test-model", store=store)
+
+    for directory in ("first", "second"):
+        index = NoteVectorIndex(
+            str(tmp_path / directory),
+            embed_documents=cached.embed_documents,
+            embed_query=embedder.embed_query,
+            split_text=lambda text: [text],
+            load_notes=_note_table(NOTES),
+        )
+        index.sync_notes(NOTES)
+    assert embedder.embedded == 3
+    assert index.similarity_search("wheezing", k=1)[0].note_key == "3"
+
+
+def test_patient_scoped_search_ignores_other_patients(tmp_path):
+    """Test that a patient-scoped search never returns another patient's notes"""
+    notes = NOTES + [
+        {"id": 4, "patient_id": 11, "date": "2024-01-04", "type": "progress", "content": "Chest pain, chest tightness"},
+    ]
+    index, _ = _make_index(tmp_path, notes=notes)
+    index.sync_notes(notes)
+
+    unscoped = index.similarity_search("chest pain, chest tightness", k=1)
+    assert unscoped[0].note_key == "4"
+
+    scoped = index.similarity_search("chest pain, chest tightness", k=3, patient_id=10)
+    assert [hit.note_key for hit in scoped] == ["1", "2"]
+    assert all(hit.patient_id == 10 for hit in scoped)
+
+    excluded = index.similarity_search("chest pain", k=3, patient_id=10, exclude_note_keys=[1])
+    assert [hit.note_key for hit in excluded] == ["2"]
+    assert index.similarity_search("chest pain", patient_id=99) == []
+
+
+def test_patient_partition_is_refreshed_after_updates(tmp_path):
+    """Test that cached patient partitions pick up new and deleted notes"""
+    new_note = {"id": 5, "patient_id": 11, "date": "2024-02-01", "type": "progress", "content": "Fever"}
+    index, _ = _make_index(tmp_path, notes=NOTES + [new_note])
+    index.sync_notes(NOTES)
+    assert len(index.similarity_search("asthma", k=5, patient_id=11)) == 1
+
+    index.upsert_notes([new_note])
+    assert {hit.note_key for hit in index.similarity_search("fever", k=5, patient_id=11)} == {"3", "5"}
+
+    index.delete_notes([3])
+    assert [hit.note_key for hit in index.similarity_search("asthma", k=5, patient_id=11)] == ["5"]
+
+
+def test_index_stores_no_note_text(tmp_path):
+    """Test that chunk text is rehydrated from the notes and never written to the index files"""
+    import sqlite3
+
+    edited = dict(NOTES[1], content="Diabetes, glucose 95 after titration")
+    index, _ = _make_index(tmp_path, notes=[NOTES[0], edited, NOTES[2]])
+    index.sync_notes(NOTES)
+
+    with sqlite3.connect(str(tmp_path / "meta.sqlite3")) as conn:
+        dump = "\n".join(conn.iterdump())
+    assert all(note["content"] not in dump for note in NOTES)
+
+    hit = index.similarity_search("asthma wheezing", k=1)[0]
+    assert hit.note_key == "3" and "Asthma with wheezing" in hit.page_content
+    # A note edited since it was indexed is skipped rather than served with stale or mismatched text
+    assert "2" not in [hit.note_key for hit in index.similarity_search("diabetes glucose", k=3)]
+
+
+def test_vector_index_is_opened_once_under_concurrent_first_use(tmp_path, monkeypatch):
+    """Test that threads racing on the lazy property share one index"""
+    import threading
+    import time
+    from types import SimpleNamespace
+    from api.services import embedding_store, vector_index
+    from api.services.ai_service import MedicalAIService
+
+    opened = []
+
+    class _SlowIndex:
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)
+            opened.append(self)
+
+    monkeypatch.setattr(vector_index, "NoteVectorIndex", _SlowIndex)
+    monkeypatch.setattr(embedding_store, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    embedder = _KeywordEmbedder()
+    service = MedicalAIService.__new__(MedicalAIService)
+    service._vector_index = None
+    service._vector_index_lock = threading.Lock()
+    service.embeddings = SimpleNamespace(
+        embed_documents=embedder.embed_documents, embed_query=embedder.embed_query, model="test-model"
+    )
+    service.text_splitter = SimpleNamespace(split_text=lambda text: [text])
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.vector_index)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 1
+    assert all(result is opened[0] for result in results)
+
+
+def test_notes_without_an_id_are_rejected(tmp_path):
+    """Test that a note the index could never rehydrate is refused before anything is written"""
+    index, embedder = _make_index(tmp_path)
+    with pytest.raises(ValueError):
+        index.upsert_notes([NOTES[0], {"patient_id": 10, "content": "Chest pain, no id"}])
+    assert embedder.embedded == 0
+    assert index.stats()["notes"] == 0